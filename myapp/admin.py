@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import PromptSet, Prompt, ActivePromptConfig
+from .models import (
+    PromptSet, Prompt, ActivePromptConfig, ReportJob, AIResponseCache, AICacheStats,
+    FileExtraction, FileExtractionStats,
+)
 
 
 @admin.register(PromptSet)
@@ -20,3 +23,36 @@ class PromptAdmin(admin.ModelAdmin):
 @admin.register(ActivePromptConfig)
 class ActivePromptConfigAdmin(admin.ModelAdmin):
     list_display = ("id", "active_set", "updated_at")
+
+
+@admin.register(ReportJob)
+class ReportJobAdmin(admin.ModelAdmin):
+    list_display = ("section_key", "report", "status", "attempts", "worker", "created_at", "finished_at")
+    list_filter = ("status", "section_key")
+    search_fields = ("report__title", "error")
+    readonly_fields = ("payload",)
+
+
+@admin.register(AIResponseCache)
+class AIResponseCacheAdmin(admin.ModelAdmin):
+    list_display = ("key", "model", "hits", "created_at", "last_used_at")
+    list_filter = ("model",)
+    ordering = ("-last_used_at",)
+
+
+@admin.register(AICacheStats)
+class AICacheStatsAdmin(admin.ModelAdmin):
+    list_display = ("id", "hits", "misses", "bypasses", "updated_at")
+
+
+@admin.register(FileExtraction)
+class FileExtractionAdmin(admin.ModelAdmin):
+    list_display = ("sha256", "engine", "max_chars", "size", "hits", "created_at", "last_used_at")
+    list_filter = ("engine",)
+    search_fields = ("sha256",)
+    ordering = ("-last_used_at",)
+
+
+@admin.register(FileExtractionStats)
+class FileExtractionStatsAdmin(admin.ModelAdmin):
+    list_display = ("id", "hits", "misses", "updated_at")
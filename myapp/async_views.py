@@ -0,0 +1,246 @@
+"""
+Async-versioner av de vyer som mest väntar på OpenAI (chatt + sektionsgenerering).
+
+Används när ASGI_ENABLED=True och appen körs under uvicorn (myproject.asgi) –
+då blockerar en väntande AI-ström inte längre en hel worker. Under WSGI används
+motsvarande vyer i views.py (se urls.py), så båda kan köras sida vid sida.
+"""
+import os
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse, StreamingHttpResponse
+from django.shortcuts import aget_object_or_404
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from openai import AsyncOpenAI
+
+from .models import ChatMessage, ChatSession, Report
+from .utils import chat_history, chat_stream
+from .utils.generation import SECTION_PROMPTS, section_statuses, store_section_text
+from .views import (
+    SECTION_ERROR_TEXT,
+    _build_openai_messages,
+    _chat_turn_messages,
+    _chunk_text,
+    _insert_sidebar_context,
+    _openai_request,
+    _openai_result,
+    _save_chat_attachments,
+    _section_payload_for_report,
+    _section_vars,
+    _sidebar_user_content,
+    _wants_stream,
+    _with_file_texts,
+    get_prompt_text,
+)
+
+# En klient per process – httpx-poolen hör till uvicorns event loop
+async_client = AsyncOpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"),
+    timeout=20,
+    max_retries=2,
+)
+
+
+def _stream_response(body, status=200):
+    resp = StreamingHttpResponse(body, content_type="text/plain; charset=utf-8", status=status)
+    resp["Cache-Control"] = "no-cache"
+    resp["X-Accel-Buffering"] = "no"
+    return resp
+
+
+def _sse_response(body, status=200):
+    resp = StreamingHttpResponse(body, content_type="text/event-stream; charset=utf-8", status=status)
+    resp["Cache-Control"] = "no-cache"
+    resp["X-Accel-Buffering"] = "no"
+    return resp
+
+
+async def _one_chunk(text):
+    yield text
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Chatt
+# ──────────────────────────────────────────────────────────────────────────────
+@csrf_exempt
+@login_required
+async def chat_send(request, session_id):
+    """Som views.chat_send, men streamar från AsyncOpenAI utan att låsa en tråd."""
+    user = await request.auser()
+    session = await aget_object_or_404(ChatSession, id=session_id, user=user)
+    if request.method != "POST":
+        return _stream_response(_one_chunk("Only POST allowed"), status=405)
+
+    user_text = (request.POST.get("message") or "").strip()
+    if not user_text and not request.FILES:
+        return _stream_response(_one_chunk(""))
+
+    # 1) Spara user-meddelande (utan filutdrag i content)
+    user_msg = await ChatMessage.objects.acreate(session=session, role="user", content=user_text)
+
+    # 2) Filer -> extrahera text -> endast för prompten (fil-I/O + parsning är synkront)
+    file_texts = await sync_to_async(_save_chat_attachments)(
+        user_msg, request.FILES.getlist("files")
+    )
+
+    # 3) Historik + verktygskontext + dold filtext (endast i prompten)
+    messages = await sync_to_async(_build_openai_messages)(session)
+    await sync_to_async(_insert_sidebar_context)(messages, user.id, request.POST)
+    messages[-1]["content"] = _with_file_texts(user_msg.content, file_texts)
+
+    return _stream_response(_astream_chat_reply(session, messages, max_tokens=1200))
+
+
+async def _astream_chat_reply(session, messages, max_tokens):
+    """Som views._stream_chat_reply: streamar svaret och sparar det i omgångar under tiden."""
+    writer = chat_stream.ReplyWriter(session)
+    await writer.aopen()
+
+    try:
+        stream = await async_client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=messages,
+            temperature=0.3,
+            max_tokens=max_tokens,
+            stream=True,
+        )
+        async for chunk in stream:
+            piece = _chunk_text(chunk)
+            if piece:
+                if writer.add(piece):
+                    await writer.aflush()
+                yield piece
+
+    except Exception as e:
+        err = f"\n\n(Ett fel inträffade vid AI-anropet: {e})"
+        writer.add(err)
+        yield err
+    finally:
+        await writer.afinish()
+
+
+@csrf_exempt
+@login_required
+@require_POST
+async def chat_sse(request, session_id):
+    """
+    Som chat_send, men svaret skickas som Server-Sent Events (se utils/chat_stream.py).
+    Svaret genereras vidare även om anslutningen bryts; klienten återupptar via
+    chat_sse_resume med Last-Event-ID. Finns bara under ASGI (se urls.py).
+    """
+    user = await request.auser()
+    session = await aget_object_or_404(ChatSession, id=session_id, user=user)
+    messages = await sync_to_async(_chat_turn_messages)(request, session)
+    if messages is None:
+        return JsonResponse({"error": "message eller files krävs"}, status=400)
+
+    reply = await sync_to_async(chat_stream.start_reply)(session, messages, max_tokens=1200)
+    return _sse_response(chat_stream.aiter_events(reply.id))
+
+
+@login_required
+async def chat_sse_resume(request, session_id, message_id):
+    """
+    GET: fortsätter ett (pågående eller klart) svar från Last-Event-ID
+    ("<meddelande-id>:<offset>", header eller ?last_event_id=).
+    """
+    user = await request.auser()
+    reply = await aget_object_or_404(
+        ChatMessage, id=message_id, role="assistant",
+        session_id=session_id, session__user=user,
+    )
+    last_event_id = request.headers.get("Last-Event-ID") or request.GET.get("last_event_id")
+    offset = chat_stream.parse_event_id(last_event_id, reply.id)
+    return _sse_response(chat_stream.aiter_events(reply.id, offset))
+
+
+@require_POST
+@login_required
+@csrf_exempt
+async def sidebar_chat(request):
+    """Som views.sidebar_chat. Returnerar JSON: {"reply": "..."}, eller streamar med stream=1."""
+    session_id = request.POST.get("session_id")
+    message = (request.POST.get("message") or "").strip()
+    context_blob = (request.POST.get("context") or "").strip()
+
+    if not session_id or not message:
+        return JsonResponse({"error": "session_id och message krävs"}, status=400)
+
+    user = await request.auser()
+    session = await aget_object_or_404(ChatSession, id=session_id, user=user)
+
+    await ChatMessage.objects.acreate(session=session, role="user", content=message)
+
+    messages = await sync_to_async(_build_openai_messages)(session)
+    messages[-1]["content"] = _sidebar_user_content(message, context_blob)
+
+    if _wants_stream(request):
+        return _stream_response(_astream_chat_reply(session, messages, max_tokens=800))
+
+    try:
+        resp = await async_client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=messages,
+            temperature=0.3,
+            max_tokens=800,
+        )
+        reply = resp.choices[0].message.content.strip()
+    except Exception as e:
+        reply = f"(Ett fel inträffade i chatten: {e})"
+
+    await ChatMessage.objects.acreate(session=session, role="assistant", content=reply)
+    await session.asave(update_fields=["updated_at"])
+    await sync_to_async(chat_history.schedule_summary_refresh)(session)
+
+    return JsonResponse({"reply": reply})
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Sektionsgenerering
+# ──────────────────────────────────────────────────────────────────────────────
+async def _arun_section(key: str, payload: dict, texts: dict, regenerate: bool = False) -> str:
+    """
+    Async motsvarighet till views._run_section. Prompt, cache och felmeddelande delas
+    med den (views._openai_request/_openai_result) – bara OpenAI-anropet är async här.
+    """
+    try:
+        prompt_text = await sync_to_async(get_prompt_text)(SECTION_PROMPTS[key], fallback="")
+        cache_key, cached, request_kwargs = await sync_to_async(_openai_request)(
+            prompt_text, payload.get("style", ""), regenerate, **_section_vars(key, payload, texts)
+        )
+        if cached is not None:
+            return cached
+
+        resp = await async_client.chat.completions.create(**request_kwargs)
+        return await sync_to_async(_openai_result)(cache_key, resp)
+
+    except Exception as e:
+        print("⚠️ OpenAI error in _arun_section:", repr(e))
+        return SECTION_ERROR_TEXT
+
+
+@login_required
+@require_POST
+async def report_section_generate(request, report_id, key):
+    """Som views.report_section_generate – skriver om en sektion och sparar den."""
+    if key not in SECTION_PROMPTS:
+        return JsonResponse({"error": "Okänd sektion"}, status=404)
+
+    rep = await aget_object_or_404(Report, id=report_id, deleted_at__isnull=True)
+    payload = await sync_to_async(_section_payload_for_report)(rep)
+
+    text = await _arun_section(key, payload, rep.data or {}, regenerate=True)
+    if text == SECTION_ERROR_TEXT:
+        return JsonResponse({"error": text}, status=502)
+
+    await sync_to_async(store_section_text)(rep.id, key, text, overwrite=True, user=request.user)
+    return JsonResponse({"key": key, "text": text})
+
+
+@login_required
+async def report_jobs(request, report_id):
+    """Som views.report_jobs – wizardens polling under pågående generering."""
+    rep = await aget_object_or_404(Report, id=report_id, deleted_at__isnull=True)
+    return JsonResponse({"sections": await sync_to_async(section_statuses)(rep.id)})
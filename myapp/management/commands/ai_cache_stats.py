@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from myapp.models import AICacheStats, AIResponseCache
+from myapp.utils import ai_cache
+
+
+class Command(BaseCommand):
+    help = "Visar träffar/missar för AI-cachen (och kan rensa den)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--evict", action="store_true", help="Ta bort utgångna/överflödiga svar.")
+        parser.add_argument("--clear", action="store_true", help="Töm cachen och nollställ räknarna.")
+
+    def handle(self, *args, **opts):
+        if opts["clear"]:
+            AIResponseCache.objects.all().delete()
+            AICacheStats.objects.filter(id=1).update(hits=0, misses=0, bypasses=0)
+            self.stdout.write("AI-cachen är tömd.")
+        elif opts["evict"]:
+            self.stdout.write(f"Tog bort {ai_cache.evict()} svar.")
+
+        s = ai_cache.stats()
+        self.stdout.write(
+            f"Svar i cachen: {s['entries']}\n"
+            f"Träffar: {s['hits']}  Missar: {s['misses']}  Förbi (skriv om): {s['bypasses']}\n"
+            f"Träffgrad: {s['hit_rate']:.1%}"
+        )
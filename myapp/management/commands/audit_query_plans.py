@@ -0,0 +1,135 @@
+import re
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from myapp.models import ChatMessage, ChatSession, Report
+
+# Tabellerna som granskas – en sekventiell skanning av någon av dem är ett fel
+AUDITED_TABLES = {m._meta.db_table for m in (ChatMessage, ChatSession, Report)}
+
+# Postgres: "Seq Scan on myapp_report"; SQLite: "SCAN myapp_report" (utan "USING ... INDEX")
+_SEQ_SCAN = {
+    "postgresql": re.compile(r"Seq Scan on (\w+)"),
+    "sqlite": re.compile(r"\bSCAN (\w+)(?!.*\bUSING\b)"),
+}
+
+
+def _hot_queries(user, session):
+    """De frågor som listor och chatt kör hela tiden (samma som i vyerna)."""
+    return {
+        "chatt: meddelanden i tidsordning (chat_session)":
+            session.messages.order_by("created_at"),
+        "chatt: senaste meddelandena (chat_history.build_history)":
+            session.messages.order_by("-created_at", "-id").values_list("role", "content")[:50],
+        "chatt: användarens sessioner (chat_home)":
+            ChatSession.objects.filter(user=user).order_by("-updated_at")[:20],
+        "sidopanel: session per steg (index)":
+            ChatSession.objects.filter(user=user, flow="domarnamnden", step=3),
+        "rapporter: listan (report_list)":
+            Report.objects.filter(deleted_at__isnull=True).select_related("created_by").order_by("-updated_at")[:50],
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Kör EXPLAIN (ANALYZE på Postgres) för de vanligaste chatt- och rapportfrågorna "
+        "och misslyckas om någon av dem gör en sekventiell skanning."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=20)
+        parser.add_argument("--sessions", type=int, default=25, help="sessioner per användare")
+        parser.add_argument("--messages", type=int, default=40, help="meddelanden per session")
+        parser.add_argument("--reports", type=int, default=5000)
+        parser.add_argument(
+            "--no-seed", action="store_true",
+            help="granska befintlig data i stället för ett seedat dataset",
+        )
+
+    def handle(self, *args, **opts):
+        vendor = connection.vendor
+        if vendor not in _SEQ_SCAN:
+            raise CommandError(f"Databasen {vendor} stöds inte (postgresql eller sqlite).")
+
+        # Seedat data läggs i en transaktion som alltid rullas tillbaka
+        with transaction.atomic():
+            if opts["no_seed"]:
+                session = ChatSession.objects.order_by("-updated_at").select_related("user").first()
+                if session is None:
+                    raise CommandError("Inga chattsessioner att granska – kör utan --no-seed.")
+                user = session.user
+            else:
+                user, session = self._seed(opts)
+            self._analyze()
+            failures = self._audit(vendor, user, session, opts["verbosity"])
+            transaction.set_rollback(True)
+
+        if failures:
+            raise CommandError(f"{len(failures)} fråga/frågor gör sekventiell skanning: " + "; ".join(failures))
+        self.stdout.write(self.style.SUCCESS("Alla frågor använder index."))
+
+    def _audit(self, vendor, user, session, verbosity) -> list:
+        options = {"analyze": True} if vendor == "postgresql" else {}
+        failures = []
+        for label, qs in _hot_queries(user, session).items():
+            plan = qs.explain(**options)
+            scanned = sorted(set(_SEQ_SCAN[vendor].findall(plan)) & AUDITED_TABLES)
+            if scanned:
+                failures.append(f"{label} ({', '.join(scanned)})")
+                self.stdout.write(self.style.ERROR(f"✗ {label}: sekventiell skanning av {', '.join(scanned)}"))
+            else:
+                self.stdout.write(f"✓ {label}")
+            if scanned or verbosity > 1:
+                self.stdout.write("    " + plan.replace("\n", "\n    "))
+        return failures
+
+    def _analyze(self):
+        # Uppdatera planerarens statistik – annars kan den tro att tabellerna är tomma
+        with connection.cursor() as cursor:
+            for table in sorted(AUDITED_TABLES):
+                cursor.execute(f"ANALYZE {connection.ops.quote_name(table)}")
+
+    def _seed(self, opts):
+        tag, now = uuid.uuid4().hex[:8], timezone.now()
+        users = User.objects.bulk_create(
+            User(username=f"audit-{tag}-{i}") for i in range(max(1, opts["users"]))
+        )
+        # de tio första per användare är sidopanelssessioner (steg 0–9)
+        sessions = ChatSession.objects.bulk_create(
+            ChatSession(
+                user=u,
+                title=f"Audit {i}",
+                flow="domarnamnden" if i < 10 else None,
+                step=i if i < 10 else None,
+            )
+            for u in users
+            for i in range(max(1, opts["sessions"]))
+        )
+        ChatMessage.objects.bulk_create(
+            (
+                ChatMessage(session=s, role="user" if i % 2 == 0 else "assistant", content=f"Meddelande {i}")
+                for s in sessions
+                for i in range(opts["messages"])
+            ),
+            batch_size=1000,
+        )
+        Report.objects.bulk_create(
+            (
+                Report(
+                    title=f"Audit {i}",
+                    created_by=users[i % len(users)],
+                    deleted_at=now if i % 10 == 0 else None,  # var tionde borttagen
+                )
+                for i in range(opts["reports"])
+            ),
+            batch_size=1000,
+        )
+        self.stdout.write(
+            f"Seedat: {len(users)} användare, {len(sessions)} sessioner, "
+            f"{len(sessions) * opts['messages']} meddelanden, {opts['reports']} rapporter"
+        )
+        return users[0], sessions[0]
@@ -0,0 +1,89 @@
+import io
+import statistics
+import time
+import tracemalloc
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+from docx import Document
+
+from myapp import views
+from myapp.utils import docx_template
+
+# 1×1 px PNG – räcker för att bildplatshållarna ska ersättas
+_PNG = (
+    "data:image/png;base64,"
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
+)
+
+
+def _sample():
+    text = "Kandidaten visar god förmåga att leda och engagera andra. " * 20
+    context = {
+        "candidate_name": "Anna Andersson",
+        "candidate_first_name": "Anna",
+        "candidate_last_name": "Andersson",
+        "candidate_role": "Rådman",
+        **{key: text for key, _ in views.SECTION_KEYS},
+    }
+    ratings = {
+        section: {label: (i % 5) + 1 for i, label in enumerate(labels)}
+        for section, labels in views.TARGETS.items()
+    }
+    images = {key: _PNG for key in views.REPORT_IMAGE_KEYS}
+    return context, ratings, images
+
+
+def _export(context, ratings, images):
+    return views._build_report_docx(context, "", ratings, images)
+
+
+def _parse_every_time():
+    """Som exporten såg ut tidigare: Document(mall) för varje export."""
+    return Document(docx_template.template_path())
+
+
+class Command(BaseCommand):
+    help = (
+        "Mäter tid och Python-heapens toppallokering per Word-export (mall parsad per "
+        "export vs cachad mall). lxml/libxml2 allokerar utanför Python och räknas inte."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=30)
+
+    @staticmethod
+    def _measure(fn, iterations):
+        fn()  # värm upp (fyller mallcachen)
+
+        timings = []
+        for _ in range(iterations):
+            t0 = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - t0) * 1000)
+
+        # Bara Python-heapen: tracemalloc ser inte libxml2:s allokeringar (XML-träden)
+        tracemalloc.start()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return statistics.median(timings), max(timings), peak / 1024
+
+    def _run(self, label, iterations, args):
+        def full_export():
+            _export(*args).save(io.BytesIO())
+
+        for stage, fn in (("mall", lambda: docx_template.load_template()), ("hel export", full_export)):
+            median, worst, peak = self._measure(fn, iterations)
+            self.stdout.write(
+                f"{label:<24}{stage:<12} median {median:7.1f} ms   "
+                f"max {worst:7.1f} ms   topp Python-heap {peak:8.0f} KiB"
+            )
+
+    def handle(self, *args, **opts):
+        iterations = opts["iterations"]
+        sample = _sample()
+        self.stdout.write(f"Mall: {docx_template.template_path()}  ({iterations} exporter per variant)")
+        with mock.patch.object(docx_template, "load_template", _parse_every_time):
+            self._run("Före (Document(mall))", iterations, sample)
+        self._run("Efter (cachad mall)", iterations, sample)
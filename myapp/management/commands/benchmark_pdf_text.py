@@ -0,0 +1,100 @@
+import os
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.utils import file_text
+
+
+def _corpus(paths) -> list:
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files += [os.path.join(root, n) for n in sorted(names) if n.lower().endswith(".pdf")]
+        elif path.lower().endswith(".pdf"):
+            files.append(path)
+    return files
+
+
+def _reset_peak_rss():
+    # ru_maxrss ärvs över fork/exec – nollställ toppvärdet (Linux) om det går
+    try:
+        with open("/proc/self/clear_refs", "w") as fh:
+            fh.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss_kib() -> int:
+    try:
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _run_engine(engine, files, iterations, max_chars):
+    """Körs i en egen process så att topp-RSS mäts per motor."""
+    blobs = [Path(f).read_bytes() for f in files]
+    _reset_peak_rss()
+    rss_before = _peak_rss_kib()
+
+    chars = empty = 0
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        for data in blobs:
+            text, used = file_text.extract_pdf_text(data, max_chars, engines=[engine])
+            chars += len(text)
+            empty += not used
+    seconds = time.perf_counter() - t0
+
+    rss_peak = _peak_rss_kib()
+    return seconds, chars, empty, sum(map(len, blobs)), rss_before, rss_peak
+
+
+class Command(BaseCommand):
+    help = "Jämför PDF-motorerna för textutdrag (genomströmning och topp-RSS) över en samling PDF:er."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "paths", nargs="*",
+            help="PDF-filer eller mappar (standard: MEDIA_ROOT/chat_uploads)",
+        )
+        parser.add_argument("--iterations", type=int, default=5)
+        parser.add_argument(
+            "--max-chars", type=int, default=0,
+            help="Teckenbudget som i _read_file_text (0 = läs hela dokumentet)",
+        )
+
+    def handle(self, *args, **opts):
+        files = _corpus(opts["paths"] or [os.path.join(settings.MEDIA_ROOT, "chat_uploads")])
+        if not files:
+            raise CommandError("Hittade inga PDF:er.")
+
+        iterations, max_chars = opts["iterations"], opts["max_chars"] or None
+        self.stdout.write(
+            f"{len(files)} PDF:er × {iterations} varv, budget: {max_chars or 'ingen'}"
+        )
+
+        for engine in file_text.PDF_ENGINES:
+            # ny process per motor – ru_maxrss sjunker aldrig inom en process
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+                seconds, chars, empty, size, rss_before, rss_peak = pool.submit(
+                    _run_engine, engine, files, iterations, max_chars
+                ).result()
+
+            docs = len(files) * iterations
+            self.stdout.write(
+                f"{engine:<10}{docs / seconds:8.1f} dok/s  {size * iterations / seconds / 1024 / 1024:7.1f} MB/s  "
+                f"{chars // iterations:>9} tecken/varv  utan text: {empty // iterations}  "
+                f"topp-RSS +{(rss_peak - rss_before) / 1024:6.1f} MiB ({rss_peak / 1024:.0f} MiB)"
+            )
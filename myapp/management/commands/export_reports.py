@@ -0,0 +1,56 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from myapp.utils import bulk_export
+
+
+def _date(value):
+    if not value:
+        return None
+    try:
+        parsed = parse_date(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise CommandError(f"Ogiltigt datum: {value} (använd ÅÅÅÅ-MM-DD)")
+    return parsed
+
+
+class Command(BaseCommand):
+    help = "Exporterar rapporter (id:n, datumintervall och/eller skapare) till en ZIP med en DOCX per rapport."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ids", nargs="*", default=[], help="Rapport-id:n (UUID)")
+        parser.add_argument("--from", dest="date_from", help="Skapad från och med (ÅÅÅÅ-MM-DD)")
+        parser.add_argument("--to", dest="date_to", help="Skapad till och med (ÅÅÅÅ-MM-DD)")
+        parser.add_argument("--created-by", help="Användarnamn på den som skapade rapporten")
+        parser.add_argument("--output", "-o", help="ZIP-fil (standard: rapporter_<datum>.zip)")
+        parser.add_argument("--workers", type=int, default=settings.BULK_EXPORT_WORKERS)
+
+    def handle(self, *args, **opts):
+        reports = bulk_export.select_reports(
+            opts["ids"],
+            _date(opts["date_from"]),
+            _date(opts["date_to"]),
+            opts["created_by"],
+        )
+        count = reports.count()
+        if not count:
+            raise CommandError("Inga rapporter matchade urvalet.")
+
+        output = opts["output"] or f"rapporter_{timezone.localdate():%Y-%m-%d}.zip"
+        t0 = time.perf_counter()
+        size = 0
+        with open(output, "wb") as fh:
+            for chunk in bulk_export.iter_report_zip(reports, workers=opts["workers"]):
+                fh.write(chunk)
+                size += len(chunk)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{count} rapporter -> {output} ({size / 1024:.0f} KiB, "
+            f"{time.perf_counter() - t0:.1f} s, {opts['workers']} processer)"
+        ))
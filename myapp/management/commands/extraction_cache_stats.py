@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from myapp.models import FileExtraction, FileExtractionStats
+from myapp.utils import extraction_cache
+
+
+class Command(BaseCommand):
+    help = "Visar träffar/missar för cachen med textutdrag ur uppladdade filer (och kan tömma den)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clear", action="store_true", help="Töm cachen och nollställ räknarna.")
+
+    def handle(self, *args, **opts):
+        if opts["clear"]:
+            FileExtraction.objects.all().delete()
+            FileExtractionStats.objects.filter(id=1).update(hits=0, misses=0)
+            self.stdout.write("Cachen för textutdrag är tömd.")
+
+        s = extraction_cache.stats()
+        self.stdout.write(
+            f"Utdrag i cachen: {s['entries']}\n"
+            f"Träffar: {s['hits']}  Missar: {s['misses']}\n"
+            f"Träffgrad: {s['hit_rate']:.1%}"
+        )
@@ -0,0 +1,97 @@
+import os
+import signal
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from myapp.utils.chat_stream import finish_stale_replies
+from myapp.utils.generation import claim_next_job, requeue_stale_jobs, run_job
+
+
+class Command(BaseCommand):
+    help = "Kör AI-jobb för rapporter (ReportJob) utanför webbprocessen."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=getattr(settings, "REPORT_GENERATION_WORKERS", 5),
+            help="Antal jobb som körs samtidigt (trådar).",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=1.0,
+            help="Sekunder att vänta när kön är tom.",
+        )
+        parser.add_argument(
+            "--stale-after",
+            type=int,
+            default=300,
+            help="Jobb som stått i 'running' längre än så här (sekunder) läggs tillbaka i kön.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Töm kön och avsluta (bra för test/cron).",
+        )
+
+    def handle(self, *args, **opts):
+        name = f"{socket.gethostname()}:{os.getpid()}"
+        stop = threading.Event()
+
+        # Heroku skickar SIGTERM vid omstart – låt pågående jobb bli klara
+        def _stop(signum, frame):
+            self.stdout.write("Stoppar efter pågående jobb...")
+            stop.set()
+
+        signal.signal(signal.SIGTERM, _stop)
+        signal.signal(signal.SIGINT, _stop)
+
+        requeued = requeue_stale_jobs(opts["stale_after"])
+        if requeued:
+            self.stdout.write(f"Lade tillbaka {requeued} jobb som fastnat.")
+
+        self.stdout.write(f"Report-worker {name} startad ({opts['concurrency']} trådar).")
+
+        def _loop(idx):
+            worker_name = f"{name}/{idx}"
+            try:
+                while not stop.is_set():
+                    close_old_connections()
+                    job = claim_next_job(worker_name)
+                    if job is None:
+                        if opts["once"]:
+                            return
+                        stop.wait(opts["sleep"])
+                        continue
+
+                    started = time.monotonic()
+                    run_job(job)
+                    self.stdout.write(
+                        f"[{worker_name}] {job.section_key} för {job.report_id} "
+                        f"klar på {time.monotonic() - started:.1f}s"
+                    )
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=_loop, args=(i,), daemon=True)
+            for i in range(max(1, opts["concurrency"]))
+        ]
+        for t in threads:
+            t.start()
+
+        # Huvudtråden städar bort hängande jobb – och chattsvar vars ström dog – då och då
+        last_sweep = time.monotonic()
+        while any(t.is_alive() for t in threads):
+            time.sleep(1)
+            if not stop.is_set() and time.monotonic() - last_sweep > 30:
+                requeue_stale_jobs(opts["stale_after"])
+                finish_stale_replies()
+                close_old_connections()
+                last_sweep = time.monotonic()
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.11 on 2026-10-18 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0014_chatsession_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmessage',
+            name='is_complete',
+            field=models.BooleanField(default=True),
+        ),
+    ]
@@ -0,0 +1,102 @@
+# Generated by Django 5.2.11 on 2026-10-18 18:08
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+# Fulltextindexet beror på databasen och hanteras därför utanför Django-modellen:
+# Postgres – genererad tsvector-kolumn (svensk stemming, titel viktas högre) + GIN.
+#            scope får vikt D, som text ur titel/brödtext aldrig får.
+# SQLite   – FTS5-tabell med extern innehållstabell, synkad med triggers.
+POSTGRES_FORWARDS = [
+    """
+    ALTER TABLE myapp_searchdocument ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('swedish', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('swedish', coalesce(body, '')), 'B') ||
+        setweight(to_tsvector('simple', scope), 'D')
+    ) STORED
+    """,
+    "CREATE INDEX searchdoc_vector_gin ON myapp_searchdocument USING gin (search_vector)",
+]
+POSTGRES_BACKWARDS = [
+    "DROP INDEX IF EXISTS searchdoc_vector_gin",
+    "ALTER TABLE myapp_searchdocument DROP COLUMN IF EXISTS search_vector",
+]
+
+# remove_diacritics 0: å, ä och ö är egna bokstäver på svenska ("får" ≠ "far")
+SQLITE_FORWARDS = [
+    """
+    CREATE VIRTUAL TABLE myapp_searchdocument_fts USING fts5(
+        title, body, scope,
+        content='myapp_searchdocument', content_rowid='id',
+        tokenize="unicode61 remove_diacritics 0"
+    )
+    """,
+    """
+    CREATE TRIGGER myapp_searchdocument_ai AFTER INSERT ON myapp_searchdocument BEGIN
+        INSERT INTO myapp_searchdocument_fts(rowid, title, body, scope)
+        VALUES (new.id, new.title, new.body, new.scope);
+    END
+    """,
+    """
+    CREATE TRIGGER myapp_searchdocument_ad AFTER DELETE ON myapp_searchdocument BEGIN
+        INSERT INTO myapp_searchdocument_fts(myapp_searchdocument_fts, rowid, title, body, scope)
+        VALUES ('delete', old.id, old.title, old.body, old.scope);
+    END
+    """,
+    """
+    CREATE TRIGGER myapp_searchdocument_au AFTER UPDATE ON myapp_searchdocument BEGIN
+        INSERT INTO myapp_searchdocument_fts(myapp_searchdocument_fts, rowid, title, body, scope)
+        VALUES ('delete', old.id, old.title, old.body, old.scope);
+        INSERT INTO myapp_searchdocument_fts(rowid, title, body, scope)
+        VALUES (new.id, new.title, new.body, new.scope);
+    END
+    """,
+]
+SQLITE_BACKWARDS = [
+    "DROP TRIGGER IF EXISTS myapp_searchdocument_au",
+    "DROP TRIGGER IF EXISTS myapp_searchdocument_ad",
+    "DROP TRIGGER IF EXISTS myapp_searchdocument_ai",
+    "DROP TABLE IF EXISTS myapp_searchdocument_fts",
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for sql in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0016_query_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('report', 'report'), ('message', 'message')], max_length=10)),
+                ('object_id', models.CharField(max_length=64)),
+                ('scope', models.CharField(default='alla', max_length=20)),
+                ('title', models.CharField(blank=True, default='', max_length=255)),
+                ('body', models.TextField(blank=True, default='')),
+                ('url', models.CharField(blank=True, default='', max_length=255)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id'), name='uniq_search_document')],
+            },
+        ),
+        migrations.RunPython(
+            _run({"postgresql": POSTGRES_FORWARDS, "sqlite": SQLITE_FORWARDS}),
+            _run({"postgresql": POSTGRES_BACKWARDS, "sqlite": SQLITE_BACKWARDS}),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.11 on 2026-10-18 18:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0018_report_revisions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activepromptconfig',
+            name='prompts_version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
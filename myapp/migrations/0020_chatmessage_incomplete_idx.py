@@ -0,0 +1,17 @@
+# Generated by Django 5.2.11 on 2026-10-18 18:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0019_activepromptconfig_prompts_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(condition=models.Q(('is_complete', False)), fields=['created_at'], name='chatmsg_incomplete_idx'),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 import uuid
+from django.utils import timezone
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.auth import get_user_model
@@ -49,6 +50,8 @@ class ActivePromptConfig(models.Model):
         on_delete=models.SET_NULL,
         related_name="+",
     )
+    # Nytt värde när något prompt/set ändras – alla processer laddar då om (utils/prompt_registry.py)
+    prompts_version = models.PositiveBigIntegerField(default=0)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
@@ -73,9 +76,28 @@ class ChatSession(models.Model):
             "Skriv tydligt och konkret, mild tonalitet, inga överdrifter."
         )
     )
+    # Löpande sammanfattning av äldre meddelanden (utils/chat_history.py).
+    # summary_until = sista meddelandet som ingår; nyare skickas ordagrant.
+    summary = models.TextField(blank=True, default="")
+    summary_until = models.ForeignKey(
+        "ChatMessage",
+        null=True, blank=True,
+        on_delete=models.SET_NULL,
+        related_name="+",
+    )
+    summary_updated_at = models.DateTimeField(null=True, blank=True)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # chattlistan: användarens sessioner, senast uppdaterad först
+            models.Index(fields=["user", "-updated_at"], name="chatsession_user_updated_idx"),
+            # sidopanelens session per steg (index-vyn)
+            models.Index(fields=["user", "flow", "step"], name="chatsession_user_flow_step_idx"),
+        ]
+
     def __str__(self):
         return f"{self.title} ({self.id})"
 
@@ -85,8 +107,22 @@ class ChatMessage(models.Model):
     session = models.ForeignKey(ChatSession, on_delete=models.CASCADE, related_name="messages")
     role = models.CharField(max_length=10, choices=ROLE_CHOICES)
     content = models.TextField(blank=True, default="")
+    # False medan ett AI-svar fortfarande streamas in (utils/chat_stream.py)
+    is_complete = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # historiken läses alltid per session i tidsordning (framlänges eller baklänges)
+            models.Index(fields=["session", "created_at", "id"], name="chatmsg_session_created_idx"),
+            # avbrutna strömmar som ska städas (chat_stream.finish_stale_replies) – bara de ofärdiga
+            models.Index(
+                fields=["created_at"],
+                name="chatmsg_incomplete_idx",
+                condition=models.Q(is_complete=False),
+            ),
+        ]
+
     def __str__(self):
         return f"[{self.role}] {self.content[:40]}..."
 
@@ -99,6 +135,13 @@ class ChatAttachment(models.Model):
     file = models.FileField(upload_to=upload_to_chat)
     original_name = models.CharField(max_length=255)
     text_excerpt = models.TextField(blank=True)  # endast ren text här
+    # Delat textutdrag för filer med samma innehåll (se utils/extraction_cache.py)
+    extraction = models.ForeignKey(
+        "FileExtraction",
+        null=True, blank=True,
+        on_delete=models.SET_NULL,
+        related_name="attachments",
+    )
 
     def __str__(self):
         return self.original_name
@@ -120,6 +163,168 @@ class Report(models.Model):
 
     class Meta:
         ordering = ["-updated_at"]
+        indexes = [
+            # rapportlistan: bara ej borttagna, senast uppdaterad först (partiellt index)
+            models.Index(
+                fields=["-updated_at", "-id"],
+                name="report_live_updated_idx",
+                condition=models.Q(deleted_at__isnull=True),
+            ),
+        ]
+
+    def __str__(self):
+        return self.title or f"Report {self.id}"
+
+class ReportRevision(models.Model):
+    """
+    En sparad version av Report.data. Lagras komprimerat som skillnaden mot
+    föregående version, med en hel ögonblicksbild med jämna mellanrum.
+    Se utils/report_revisions.py.
+    """
+    report = models.ForeignKey(Report, on_delete=models.CASCADE, related_name="revisions")
+    number = models.PositiveIntegerField()  # 1, 2, 3 ... per rapport
+    is_snapshot = models.BooleanField(default=False)
+    payload = models.BinaryField()  # zlib(json): hela data eller {"set": ..., "del": [...]}
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ["report", "number"]
+        constraints = [
+            models.UniqueConstraint(fields=["report", "number"], name="uniq_report_revision"),
+        ]
+
+    def __str__(self):
+        return f"{self.report_id} v{self.number}"
+
+class ReportJob(models.Model):
+    """
+    Ett AI-jobb: "skriv sektion X för rapport Y".
+    Körs av `manage.py run_report_worker` när REPORT_GENERATION_BACKEND = "worker".
+    """
+    STATUS_CHOICES = (
+        ("waiting", "waiting"),  # väntar på andra sektioner (t.ex. sur_text)
+        ("queued", "queued"),
+        ("running", "running"),
+        ("done", "done"),
+        ("failed", "failed"),
+    )
+    PENDING_STATUSES = ("waiting", "queued", "running")
+
+    report = models.ForeignKey(Report, on_delete=models.CASCADE, related_name="jobs")
+    section_key = models.CharField(max_length=50)  # t.ex. "leda_text"
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="queued")
+    payload = models.JSONField(default=dict, blank=True)  # stil + promptvariabler
+    error = models.TextField(blank=True, default="")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    worker = models.CharField(max_length=100, blank=True, default="")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["created_at"]
+        indexes = [
+            models.Index(fields=["status", "created_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.section_key} ({self.status}) – {self.report_id}"
+
+
+class AIResponseCache(models.Model):
+    """
+    Cachade OpenAI-svar för rapportsektionerna.
+    Nyckel = sha256 av (modell, temperatur, max_tokens, färdig prompt), se utils/ai_cache.py.
+    """
+    key = models.CharField(max_length=64, primary_key=True)
+    model = models.CharField(max_length=50)
+    response = models.TextField()
+    hits = models.PositiveIntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"{self.model} {self.key[:12]} ({self.hits} träffar)"
+
+
+class AICacheStats(models.Model):
+    """
+    Singleton: vi använder alltid id=1.
+    Räknare för AI-cachen (träffar, missar och "skriv om"-anrop som gick förbi den).
+    """
+    hits = models.PositiveBigIntegerField(default=0)
+    misses = models.PositiveBigIntegerField(default=0)
+    bypasses = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Träffar: {self.hits}, missar: {self.misses}, förbi: {self.bypasses}"
+
+
+class FileExtraction(models.Model):
+    """
+    Cachat textutdrag ur en uppladdad fil (jobbannons, chattbilaga).
+    Nyckel = sha256 av filens bytes + teckenbudgeten, se utils/extraction_cache.py.
+    """
+    sha256 = models.CharField(max_length=64)
+    max_chars = models.PositiveIntegerField(default=0)  # 0 = hela dokumentet
+    engine = models.CharField(max_length=20, blank=True, default="")  # "pymupdf", "docx", ...
+    text = models.TextField(blank=True, default="")
+    size = models.PositiveBigIntegerField(default=0)  # filens storlek i byte
+    hits = models.PositiveIntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["sha256", "max_chars"], name="uniq_file_extraction"),
+        ]
+
+    def __str__(self):
+        return f"{self.sha256[:12]} {self.engine or '-'} ({self.hits} träffar)"
+
+
+class FileExtractionStats(models.Model):
+    """
+    Singleton: vi använder alltid id=1.
+    Räknare för textutdragscachen (träffar = filen behövde inte parsas igen).
+    """
+    hits = models.PositiveBigIntegerField(default=0)
+    misses = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Träffar: {self.hits}, missar: {self.misses}"
+
+
+class SearchDocument(models.Model):
+    """
+    Sökbar text för en rapport eller ett chattmeddelande, hålls uppdaterad vid
+    sparande (utils/search_index.py). Själva indexet är databasberoende och
+    skapas i migrationen: tsvector-kolumn + GIN på Postgres, FTS5-tabell i SQLite.
+    """
+    KIND_CHOICES = (("report", "report"), ("message", "message"))
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.CharField(max_length=64)  # Report.id (uuid) eller ChatMessage.id
+    # Chattmeddelanden syns bara för sessionens ägare; None = alla inloggade (rapporter)
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.CASCADE, related_name="+")
+    # Samma behörighet som token i fulltextindexet ("alla" eller "u<user_id>"), så att
+    # indexet filtrerar på ägare innan träffarna rankas
+    scope = models.CharField(max_length=20, default="alla")
+    title = models.CharField(max_length=255, blank=True, default="")
+    body = models.TextField(blank=True, default="")
+    url = models.CharField(max_length=255, blank=True, default="")
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["kind", "object_id"], name="uniq_search_document"),
+        ]
 
     def __str__(self):
-        return self.title or f"Report {self.id}"
\ No newline at end of file
+        return f"{self.kind} {self.object_id}: {self.title[:40]}"
@@ -0,0 +1,37 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import ActivePromptConfig, ChatMessage, Prompt, PromptSet, Report
+from .utils import prompt_registry, search_index
+
+
+@receiver(post_save, sender=Prompt)
+@receiver(post_delete, sender=Prompt)
+@receiver(post_save, sender=PromptSet)
+@receiver(post_delete, sender=PromptSet)
+@receiver(post_save, sender=ActivePromptConfig)
+@receiver(post_delete, sender=ActivePromptConfig)
+def invalidate_prompt_registry(sender, **kwargs):
+    # Efter commit, annars kan en annan request hinna ladda in den gamla texten igen
+    transaction.on_commit(prompt_registry.invalidate)
+
+
+# Sökindexet (utils/search_index.py) uppdateras efter commit, med det som faktiskt sparades.
+# Uppdateringar via queryset.update() syns inte här – ReplyWriter indexerar själv.
+@receiver(post_save, sender=Report)
+def index_report(sender, instance, **kwargs):
+    transaction.on_commit(lambda: search_index.index_report(instance.pk))
+
+
+@receiver(post_save, sender=ChatMessage)
+def index_message(sender, instance, **kwargs):
+    if instance.is_complete:
+        transaction.on_commit(lambda: search_index.index_message(instance.pk))
+
+
+@receiver(post_delete, sender=Report)
+@receiver(post_delete, sender=ChatMessage)
+def remove_from_search_index(sender, instance, **kwargs):
+    kind = "report" if sender is Report else "message"
+    transaction.on_commit(lambda: search_index.remove(kind, instance.pk))
@@ -1,3 +1,866 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+import zipfile
+from concurrent.futures import Future
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import openpyxl
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import NoReverseMatch, reverse
+from django.utils import timezone
+
+from . import views
+from .models import (
+    ActivePromptConfig, AICacheStats, AIResponseCache, ChatAttachment, ChatMessage, ChatSession, FileExtraction,
+    Prompt, Report, ReportJob, ReportRevision, SearchDocument,
+)
+from .utils import (
+    ai_cache, bulk_export, chat_history, chat_stream, extraction_cache, file_text, generation, prompt_registry,
+    report_revisions, report_state, search_index,
+)
+
+
+class _InlineExecutor:
+    """Kör jobben direkt i testtråden (SQLite-testdatabasen klarar inte bakgrundstrådar)."""
+
+    def submit(self, fn, *args, **kwargs):
+        fut = Future()
+        try:
+            fut.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            fut.set_exception(e)
+        return fut
+
+
+def _patch_openai(failing=()):
+    """
+    Ersätter views._run_section. Svaret visar vilka andra sektioner texten byggde på;
+    sektionerna i failing får feltexten, precis som när OpenAI-anropet misslyckas.
+    Returnerar (patch, lista med sektionerna i den ordning de skrevs).
+    """
+    calls = []
+
+    def section(key, payload, texts, regenerate=False):
+        calls.append(key)
+        if key in failing:
+            return views.SECTION_ERROR_TEXT
+        vars_ = views._section_vars(key, payload, texts)
+        deps = sorted(k for k, v in vars_.items() if k in generation.SECTION_PROMPTS and v)
+        return f"{key}:{','.join(deps)}"
+
+    return mock.patch.object(views, "_run_section", side_effect=section), calls
+
+
+PAYLOAD = {"style": "S", "base_vars": {}, "input_vars": {"intervju_text": "I"}}
+SUMMARIES = ["sur_text", "slutsats_text"]
+
+
+class SectionSchedulerTests(TestCase):
+    """Trådbackenden (REPORT_GENERATION_BACKEND = "thread")."""
+
+    def setUp(self):
+        patches = [
+            mock.patch.object(generation, "_executor", _InlineExecutor()),
+            # _task stänger trådens DB-anslutning – här är det testets egen
+            mock.patch.object(generation, "connection", mock.Mock()),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_generates_missing_sections_with_summaries_last(self):
+        rep = Report.objects.create(data={})
+        patch, calls = _patch_openai()
+        with patch:
+            generation.schedule_report_generation(rep.id, {}, PAYLOAD)
+
+        rep.refresh_from_db()
+        self.assertEqual(set(calls), set(generation.SECTION_PROMPTS))
+        self.assertEqual(calls[-2:], SUMMARIES)
+        self.assertTrue(rep.data["slutsats_text"].startswith("slutsats_text:"))
+        self.assertIn("sur_text", rep.data["slutsats_text"])
+        self.assertFalse(generation.section_pending(rep.id, "slutsats_text"))
+
+    def test_existing_texts_are_kept(self):
+        rep = Report.objects.create(data={"leda_text": "Skriven av konsulten"})
+        patch, calls = _patch_openai()
+        with patch:
+            generation.schedule_report_generation(rep.id, {"mod_text": "Från formuläret"}, PAYLOAD)
+
+        rep.refresh_from_db()
+        self.assertNotIn("leda_text", calls)
+        self.assertNotIn("mod_text", calls)
+        self.assertEqual(rep.data["leda_text"], "Skriven av konsulten")
+
+    def test_failed_section_is_not_stored_and_summaries_are_skipped(self):
+        rep = Report.objects.create(data={})
+        patch, calls = _patch_openai(failing={"leda_text"})
+        with patch:
+            generation.schedule_report_generation(rep.id, {}, PAYLOAD)
+
+        rep.refresh_from_db()
+        self.assertNotIn("leda_text", rep.data)
+        self.assertIn("mod_text", rep.data)
+        for key in SUMMARIES:
+            self.assertNotIn(key, calls)
+            self.assertNotIn(key, rep.data)
+        self.assertEqual(generation.section_statuses(rep.id)["leda_text"], "missing")
+
+
+@override_settings(REPORT_GENERATION_BACKEND="worker", REPORT_JOB_MAX_ATTEMPTS=2)
+class ReportJobQueueTests(TestCase):
+    """Jobbkön i databasen (REPORT_GENERATION_BACKEND = "worker")."""
+
+    def _run_worker(self):
+        while (job := generation.claim_next_job("test")) is not None:
+            generation.run_job(job)
+
+    def _statuses(self, rep):
+        return dict(ReportJob.objects.filter(report=rep).values_list("section_key", "status"))
+
+    def test_enqueue_holds_summaries_until_inputs_are_done(self):
+        rep = Report.objects.create(data={"leda_text": "klar"})
+        generation.schedule_report_generation(rep.id, {}, PAYLOAD)
+
+        statuses = self._statuses(rep)
+        self.assertNotIn("leda_text", statuses)
+        self.assertEqual(statuses["mod_text"], "queued")
+        self.assertEqual(statuses["sur_text"], "waiting")
+        self.assertEqual(statuses["slutsats_text"], "waiting")
+        self.assertTrue(generation.section_pending(rep.id, "sur_text"))
+
+        # En andra schemaläggning köar inget dubbelt
+        generation.schedule_report_generation(rep.id, {}, PAYLOAD)
+        self.assertEqual(ReportJob.objects.filter(report=rep).count(), len(statuses))
+
+    def test_worker_runs_every_job_in_dependency_order(self):
+        rep = Report.objects.create(data={})
+        generation.schedule_report_generation(rep.id, {}, PAYLOAD)
+        patch, calls = _patch_openai()
+        with patch:
+            self._run_worker()
+
+        rep.refresh_from_db()
+        self.assertEqual(set(self._statuses(rep).values()), {"done"})
+        self.assertEqual(calls[-2:], SUMMARIES)
+        self.assertIn("sur_text", rep.data["slutsats_text"])
+        self.assertEqual(set(generation.section_statuses(rep.id).values()), {"done"})
+
+    def test_failed_job_is_retried_then_marked_failed(self):
+        rep = Report.objects.create(data={})
+        generation.schedule_report_generation(rep.id, {}, PAYLOAD)
+        patch, calls = _patch_openai(failing={"leda_text"})
+        with patch:
+            self._run_worker()
+
+        rep.refresh_from_db()
+        job = ReportJob.objects.get(report=rep, section_key="leda_text")
+        self.assertEqual((job.status, job.attempts), ("failed", 2))
+        self.assertEqual(calls.count("leda_text"), 2)
+        self.assertNotIn("leda_text", rep.data)
+
+        # sur/slutsats skrivs inte utan leda_text
+        statuses = self._statuses(rep)
+        for key in SUMMARIES:
+            self.assertEqual(statuses[key], "failed")
+            self.assertNotIn(key, calls)
+        self.assertEqual(generation.section_statuses(rep.id)["leda_text"], "failed")
+
+    def test_wait_for_section_does_not_block_on_queued_jobs(self):
+        rep = Report.objects.create(data={"leda_text": "klar"})
+        generation.schedule_report_generation(rep.id, {}, PAYLOAD)
+
+        with mock.patch("time.sleep", side_effect=AssertionError("väntade")):
+            self.assertEqual(generation.wait_for_section(rep.id, "mod_text"), "")
+            self.assertEqual(generation.wait_for_section(rep.id, "leda_text"), "klar")
+        self.assertTrue(generation.section_pending(rep.id, "mod_text"))
+
+    def test_stale_running_jobs_are_requeued(self):
+        rep = Report.objects.create(data={})
+        job = ReportJob.objects.create(
+            report=rep, section_key="mod_text", status="running",
+            worker="död", started_at=timezone.now() - timedelta(minutes=10),
+        )
+        self.assertEqual(generation.requeue_stale_jobs(max_age_seconds=300), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker), ("queued", ""))
+
+
+def _openai_reply(text):
+    fake = mock.MagicMock()
+    fake.chat.completions.create.return_value.choices = [mock.MagicMock(message=mock.MagicMock(content=text))]
+    return fake
+
+
+class AICacheTests(TestCase):
+    def test_identical_prompt_is_served_from_cache(self):
+        fake = _openai_reply(" Svar ")
+        with mock.patch.object(views, "client", fake):
+            self.assertEqual(views._run_openai("P {x}", "S", x=1), "Svar")
+            self.assertEqual(views._run_openai("P {x}", "S", x=1), "Svar")
+            views._run_openai("P {x}", "S", x=2)
+
+        self.assertEqual(fake.chat.completions.create.call_count, 2)
+        stats = ai_cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (1, 2, 2))
+
+    def test_regenerate_bypasses_and_replaces_the_cached_answer(self):
+        fake = _openai_reply("Första")
+        with mock.patch.object(views, "client", fake):
+            views._run_openai("P", "S")
+            fake.chat.completions.create.return_value.choices[0].message.content = "Andra"
+            self.assertEqual(views._run_openai("P", "S", regenerate=True), "Andra")
+            self.assertEqual(views._run_openai("P", "S"), "Andra")
+
+        self.assertEqual(AICacheStats.objects.get(id=1).bypasses, 1)
+
+    def test_errors_are_not_cached(self):
+        fake = mock.MagicMock()
+        fake.chat.completions.create.side_effect = RuntimeError("nere")
+        with mock.patch.object(views, "client", fake):
+            self.assertEqual(views._run_openai("P", "S"), views.SECTION_ERROR_TEXT)
+        self.assertFalse(AIResponseCache.objects.exists())
+
+    def test_async_view_shares_the_cache_with_the_sync_path(self):
+        from . import async_views
+
+        with mock.patch.object(views, "client", _openai_reply("Från WSGI")):
+            views._run_section("leda_text", PAYLOAD, {})
+
+        fake = mock.MagicMock()
+        fake.chat.completions.create = mock.AsyncMock()
+        with mock.patch.object(async_views, "async_client", fake):
+            text = async_to_sync(async_views._arun_section)("leda_text", PAYLOAD, {})
+        self.assertEqual(text, "Från WSGI")
+        fake.chat.completions.create.assert_not_called()
+
+    @override_settings(AI_CACHE_TTL=60)
+    def test_expired_answers_are_misses(self):
+        key = ai_cache.cache_key("m", 0.5, 100, "prompt")
+        ai_cache.store(key, "m", "svar")
+        AIResponseCache.objects.filter(key=key).update(created_at=timezone.now() - timedelta(seconds=120))
+        self.assertIsNone(ai_cache.get_cached(key))
+        self.assertEqual(ai_cache.evict(), 1)
+
+    @override_settings(AI_CACHE_MAX_ENTRIES=2)
+    def test_least_recently_used_answers_are_evicted(self):
+        keys = [ai_cache.cache_key("m", 0.5, 100, f"p{i}") for i in range(3)]
+        ai_cache.store(keys[0], "m", "a")
+        ai_cache.store(keys[1], "m", "b")
+        AIResponseCache.objects.filter(key=keys[1]).update(last_used_at=timezone.now() - timedelta(hours=1))
+        ai_cache.store(keys[2], "m", "c")
+
+        self.assertEqual(
+            set(AIResponseCache.objects.values_list("key", flat=True)),
+            {keys[0], keys[2]},
+        )
+
+
+class SaveReportStateTests(TestCase):
+    def setUp(self):
+        self.rep = Report.objects.create(data={"leda_text": "Bakgrundstext", "mod_text": "Mod"})
+        self.ctx = {"step": 5, "candidate_name": "Anna", "leda_text": "", "mod_text": "Mod"}
+
+    def test_empty_hidden_field_keeps_background_text(self):
+        views._save_report_state(self.rep, self.ctx, edited_key="mod_text")
+        self.rep.refresh_from_db()
+        self.assertEqual(self.rep.data["leda_text"], "Bakgrundstext")
+
+    def test_consultant_can_clear_the_section_on_screen(self):
+        views._save_report_state(self.rep, self.ctx, edited_key="leda_text")
+        self.rep.refresh_from_db()
+        self.assertEqual(self.rep.data["leda_text"], "")
+
+    def test_section_still_being_written_is_not_cleared(self):
+        with mock.patch.object(views, "section_pending", return_value=True):
+            views._save_report_state(self.rep, self.ctx, edited_key="leda_text")
+        self.rep.refresh_from_db()
+        self.assertEqual(self.rep.data["leda_text"], "Bakgrundstext")
+
+    def test_unchanged_state_is_not_written(self):
+        views._save_report_state(self.rep, self.ctx)
+        updated_at = Report.objects.get(id=self.rep.id).updated_at
+        self.assertFalse(views._save_report_state(self.rep, dict(self.ctx)))
+        self.assertEqual(Report.objects.get(id=self.rep.id).updated_at, updated_at)
+
+    def test_failed_regenerate_keeps_the_old_text(self):
+        self.client.force_login(User.objects.create_user("konsult"))
+        post = {"step": 4, "report_id": str(self.rep.id), "regenerate": "1", "leda_text": "Bakgrundstext"}
+        with mock.patch.object(views, "_run_section", return_value=views.SECTION_ERROR_TEXT):
+            resp = self.client.post(reverse("index"), post)
+
+        self.rep.refresh_from_db()
+        self.assertEqual(self.rep.data["leda_text"], "Bakgrundstext")
+        self.assertEqual(resp.context["error"], views.SECTION_ERROR_TEXT)
+
+
+class SidebarContextTests(TestCase):
+    def setUp(self):
+        self.rep = Report.objects.create(data={"candidate_name": "Anna", "leda_text": "Sparad ledartext"})
+        self.sidebar_ctx = views._build_sidebar_context(step=4, context=self.rep.data, ratings_json_str="")
+
+    def _system_messages(self, post):
+        messages = views._insert_sidebar_context([{"role": "system", "content": "bas"}], 1, post)
+        return [m["content"] for m in messages[1:]]
+
+    def test_cached_context_is_inserted_with_current_text(self):
+        key = views._store_sidebar_context(1, self.rep.id, self.sidebar_ctx)
+        [ctx] = self._system_messages({"sidebar_context_key": key, "sidebar_current_text": "Ny text"})
+        self.assertIn("Ny text", ctx)
+        self.assertIn("Anna", ctx)
+
+    def test_cache_miss_rebuilds_from_the_saved_report(self):
+        key = views._store_sidebar_context(1, self.rep.id, self.sidebar_ctx)
+        views.cache.clear()  # annan worker / omstart / TTL
+        [ctx] = self._system_messages({"sidebar_context_key": key})
+        self.assertIn("Sparad ledartext", ctx)
+        self.assertIn("Anna", ctx)
+
+    def test_unknown_report_adds_nothing(self):
+        views.cache.clear()
+        self.assertEqual(self._system_messages({"sidebar_context_key": "ny:4:abc"}), [])
+
+
+class PromptRegistryTests(TestCase):
+    def setUp(self):
+        prompt_registry._state, prompt_registry._checked = None, (0.0, None)
+        self.prompt_set = prompt_registry.get_active_prompt_set()
+        Prompt.objects.update_or_create(prompt_set=self.prompt_set, name="leda", defaults={"text": "Gammal"})
+        prompt_registry.invalidate()
+
+    def test_edit_in_another_process_is_picked_up(self):
+        self.assertEqual(prompt_registry.get_prompt_text("leda"), "Gammal")
+
+        # En annan process sparar: bara databasen ändras, inte vår cache
+        Prompt.objects.filter(prompt_set=self.prompt_set, name="leda").update(text="Ny")
+        ActivePromptConfig.objects.filter(id=1).update(prompts_version=12345)
+
+        with override_settings(PROMPT_REGISTRY_CHECK_SECONDS=60):
+            self.assertEqual(prompt_registry.get_prompt_text("leda"), "Gammal")
+        with override_settings(PROMPT_REGISTRY_CHECK_SECONDS=0):
+            self.assertEqual(prompt_registry.get_prompt_text("leda"), "Ny")
+
+    def test_save_invalidates_after_commit(self):
+        self.assertEqual(prompt_registry.get_prompt_text("leda"), "Gammal")
+        with self.captureOnCommitCallbacks(execute=True):
+            Prompt.objects.filter(prompt_set=self.prompt_set, name="leda").update(text="Ny")
+            ActivePromptConfig.objects.get(id=1).save()
+        with override_settings(PROMPT_REGISTRY_CHECK_SECONDS=60):
+            self.assertEqual(prompt_registry.get_prompt_text("leda"), "Ny")
+
+
+class ExcelReadTests(TestCase):
+    def _excel(self, rows):
+        wb = openpyxl.Workbook()
+        for row in rows:
+            wb.active.append(row)
+        buf = io.BytesIO()
+        wb.save(buf)
+        buf.seek(0)
+        return buf
+
+    def test_text_and_ratings_come_from_one_pass(self):
+        upload = self._excel([
+            ["Förnamn", "Efternamn", "Competency Score: Directing others (STIVE)", "Competency Score: Delegating (STIVE)"],
+            ["Anna", "Andersson", 4.6, 1.2],
+            ["Kommentar", None, "rad 3", None],
+        ])
+        text, rows = views._read_excel(upload)
+
+        self.assertEqual(text.splitlines()[1], "Anna\tAndersson\t4.6\t1.2")
+        self.assertEqual(text.splitlines()[2], "Kommentar\t\trad 3\t")
+        self.assertEqual(len(rows), 2)
+
+        ratings, _ = views._ratings_from_rows(rows)
+        self.assertEqual(ratings["leda_utveckla_och_engagera"]["Leda andra"], 5)
+        self.assertEqual(ratings["leda_utveckla_och_engagera"]["Delegera"], 1)
+        self.assertEqual(ratings["leda_utveckla_och_engagera"]["Engagera andra"], 3)  # saknas -> 3
+
+    @override_settings(EXCEL_MAX_ROWS=3)
+    def test_rows_beyond_the_limit_are_not_read(self):
+        upload = self._excel([[f"rad {i}"] for i in range(1, 11)])
+        text, _ = views._read_excel(upload)
+        self.assertEqual(text.splitlines(), ["rad 1", "rad 2", "rad 3"])
+
+
+class ReportBatchUploadTests(TestCase):
+    def _excel(self):
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        ws.append(["Förnamn", "Efternamn", "Competency Score: Directing others (STIVE)"])
+        ws.append(["Anna", "Andersson", 4.2])
+        ws.append(["Bo", "Berg", 3.1])
+        buf = io.BytesIO()
+        wb.save(buf)
+        return SimpleUploadedFile("testdag.xlsx", buf.getvalue())
+
+    def test_batch_reports_get_a_revision_and_a_search_entry(self):
+        user = User.objects.create_user("konsult", password="x")
+        self.client.force_login(user)
+        with mock.patch.object(views, "schedule_report_generation"):
+            self.client.post(reverse("report_batch_upload"), {"excel": self._excel(), "candidate_role": "Rådman"})
+
+        reports = Report.objects.order_by("title")
+        self.assertEqual([r.title for r in reports], ["Anna Andersson – Rådman", "Bo Berg – Rådman"])
+        for rep in reports:
+            self.assertEqual(report_revisions.data_at(rep.id, 1), rep.data)
+            self.assertEqual(ReportRevision.objects.get(report=rep).created_by, user)
+            self.assertTrue(SearchDocument.objects.filter(kind="report", object_id=str(rep.id)).exists())
+
+
+class ChatStreamTests(TestCase):
+    def setUp(self):
+        self.session = ChatSession.objects.create(user=User.objects.create_user("konsult"))
+
+    def _reply(self, content, minutes_ago=0):
+        msg = ChatMessage.objects.create(session=self.session, role="assistant", content=content, is_complete=False)
+        ChatMessage.objects.filter(id=msg.id).update(created_at=timezone.now() - timedelta(minutes=minutes_ago))
+        return msg
+
+    def test_stale_replies_are_finished_and_indexed(self):
+        stale = self._reply("Halva svaret ", minutes_ago=10)
+        running = self._reply("Pågår", minutes_ago=0)
+
+        self.assertEqual(chat_stream.finish_stale_replies(self.session.id), 1)
+
+        stale.refresh_from_db()
+        running.refresh_from_db()
+        self.assertTrue(stale.is_complete)
+        self.assertEqual(stale.content, f"Halva svaret\n\n{chat_stream.ABORTED_NOTE}")
+        self.assertTrue(SearchDocument.objects.filter(kind="message", object_id=str(stale.id)).exists())
+        self.assertFalse(running.is_complete)
+
+    def test_reply_still_generated_here_is_left_alone(self):
+        msg = self._reply("Långsamt", minutes_ago=10)
+        with mock.patch.dict(chat_stream._live, {msg.id: chat_stream._LiveReply()}):
+            self.assertEqual(chat_stream.finish_stale_replies(), 0)
+        msg.refresh_from_db()
+        self.assertFalse(msg.is_complete)
+
+    def test_events_resume_from_last_event_id(self):
+        msg = self._reply("Hej där")
+        ChatMessage.objects.filter(id=msg.id).update(is_complete=True)
+        offset = chat_stream.parse_event_id(f"{msg.id}:4", msg.id)
+
+        async def collect():
+            return [e async for e in chat_stream.aiter_events(msg.id, offset)]
+
+        events = async_to_sync(collect)()
+        self.assertIn('"t": "där"', events[2])
+        self.assertTrue(events[-1].startswith(f"id: {msg.id}:7\nevent: done"))
+        self.assertEqual(chat_stream.parse_event_id(f"{msg.id + 1}:4", msg.id), 0)
+
+    def _events(self, message_id, offset, on_sleep=None):
+        async def sleep(_seconds):
+            if on_sleep is not None:
+                await sync_to_async(on_sleep)()
+
+        async def collect():
+            return [e async for e in chat_stream.aiter_events(message_id, offset)]
+
+        with mock.patch.object(chat_stream.asyncio, "sleep", side_effect=sleep):
+            events = async_to_sync(collect)()
+        tokens = "".join(json.loads(e.split("data: ", 1)[1])["t"] for e in events if "event: token" in e)
+        return tokens, events[-1]
+
+    @override_settings(CHAT_STREAM_FLUSH_TOKENS=3, CHAT_STREAM_FLUSH_SECONDS=60)
+    def test_writer_flushes_in_batches(self):
+        writer = chat_stream.ReplyWriter(self.session)
+        msg = writer.open()
+        self.assertEqual([writer.add(p) for p in ("Hej", " där", ", ")], [False, False, True])
+        writer.flush()
+        writer.add("klart  ")
+
+        msg.refresh_from_db()
+        self.assertEqual((msg.content, msg.is_complete), ("Hej där, ", False))
+
+        writer.finish()
+        msg.refresh_from_db()
+        self.assertEqual((msg.content, msg.is_complete), ("Hej där, klart", True))
+        self.assertTrue(SearchDocument.objects.filter(kind="message", object_id=str(msg.id)).exists())
+
+    def test_interrupted_reply_resumes_from_the_saved_row(self):
+        # Anslutningen bröts efter "Hej " (offset 4); svaret blir klart i en annan process
+        msg = self._reply("Hej där")
+
+        def finish_elsewhere():
+            ChatMessage.objects.filter(id=msg.id).update(content="Hej där, välkommen", is_complete=True)
+
+        tokens, last = self._events(msg.id, 4, on_sleep=finish_elsewhere)
+        self.assertEqual(tokens, "där, välkommen")
+        self.assertTrue(last.startswith(f"id: {msg.id}:18\nevent: done"))
+
+    def test_reply_in_this_process_resumes_from_memory(self):
+        msg = self._reply("")
+        live = chat_stream._LiveReply()
+        live.append("Första biten")
+
+        def more():
+            live.append(" och resten")
+            live.finish()
+
+        with mock.patch.dict(chat_stream._live, {msg.id: live}):
+            tokens, last = self._events(msg.id, len("Första"), on_sleep=more)
+        self.assertEqual(tokens, " biten och resten")
+        self.assertIn("event: done", last)
+
+    def test_start_reply_saves_partial_text_when_openai_fails(self):
+        def stream(**kwargs):
+            yield mock.Mock(choices=[mock.Mock(delta=mock.Mock(content="Början"))])
+            raise RuntimeError("avbrott")
+
+        fake = mock.MagicMock()
+        fake.chat.completions.create.side_effect = stream
+        with mock.patch.object(chat_stream, "_executor", _InlineExecutor()), \
+                mock.patch.object(chat_stream, "connection", mock.Mock()), \
+                mock.patch.object(views, "client", fake):
+            msg = chat_stream.start_reply(self.session, [{"role": "user", "content": "Hej"}])
+
+        msg.refresh_from_db()
+        self.assertTrue(msg.is_complete)
+        self.assertTrue(msg.content.startswith("Början\n\n(Ett fel inträffade vid AI-anropet: avbrott)"))
+        self.assertNotIn(msg.id, chat_stream._live)
+
+    def test_sse_views_only_exist_under_asgi(self):
+        # urls.py registrerar SSE-vyerna bara med ASGI_ENABLED (testerna kör WSGI-inställningarna)
+        with self.assertRaises(NoReverseMatch):
+            reverse("chat_sse", args=[self.session.id])
+
+
+class BulkExportTests(TestCase):
+    def _report(self, first="Anna", last="A", role="Rådman/ordf"):
+        return Report.objects.create(
+            data={"candidate_first_name": first, "candidate_last_name": last, "candidate_role": role},
+        )
+
+    def _zip(self, chunks):
+        return zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+
+    def test_entry_names_are_flat_and_unique(self):
+        self._report()
+        self._report()
+        self._report(role="../..\\x")
+
+        with self._zip(bulk_export.iter_report_zip(bulk_export.select_reports(), workers=1)) as zf:
+            names = zf.namelist()
+            self.assertCountEqual(
+                names,
+                ["Anna_A_Rådman_ordf.docx", "Anna_A_Rådman_ordf (2).docx", "Anna_A_x.docx"],
+            )
+            self.assertIsNone(zf.testzip())
+
+    def test_process_pool_renders_every_report(self):
+        for i in range(5):
+            self._report(first=f"K{i}", role="Rådman")
+        with mock.patch.object(bulk_export, "BATCH_SIZE", 2):
+            chunks = bulk_export.iter_report_zip(bulk_export.select_reports(), workers=2)
+            with self._zip(chunks) as zf:
+                self.assertCountEqual(zf.namelist(), [f"K{i}_A_Rådman.docx" for i in range(5)])
+                self.assertTrue(all(zf.read(name).startswith(b"PK") for name in zf.namelist()))
+
+    def test_view_streams_the_selected_reports(self):
+        self.client.force_login(User.objects.create_user("konsult"))
+        picked = [self._report(first="Anna"), self._report(first="Bo")]
+        self._report(first="Cecilia")
+
+        resp = self.client.post(reverse("report_bulk_export"), {"report_ids": [str(r.id) for r in picked]})
+        self.assertEqual(resp["Content-Type"], "application/zip")
+        self.assertIn("attachment; filename=\"rapporter_", resp["Content-Disposition"])
+        with self._zip(resp.streaming_content) as zf:
+            self.assertCountEqual(zf.namelist(), ["Anna_A_Rådman_ordf.docx", "Bo_A_Rådman_ordf.docx"])
+
+    @override_settings(BULK_EXPORT_MAX_REPORTS=1)
+    def test_view_rejects_empty_and_too_large_selections(self):
+        self.client.force_login(User.objects.create_user("konsult"))
+        self.assertRedirects(self.client.post(reverse("report_bulk_export")), reverse("report_list"))
+
+        ids = [str(self._report().id), str(self._report().id)]
+        resp = self.client.post(reverse("report_bulk_export"), {"report_ids": ids})
+        self.assertRedirects(resp, reverse("report_list"), fetch_redirect_response=False)
+
+    def test_export_reports_command_writes_the_zip(self):
+        rep = self._report(role="Rådman")
+        self._report(first="Bo")
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, "ut.zip")
+            call_command("export_reports", "--ids", str(rep.id), "-o", output, "--workers", "1", stdout=io.StringIO())
+            with zipfile.ZipFile(output) as zf:
+                self.assertEqual(zf.namelist(), ["Anna_A_Rådman.docx"])
+
+        with self.assertRaises(CommandError):
+            call_command("export_reports", "--created-by", "ingen", stdout=io.StringIO())
+
+
+class ChatHistoryTests(TestCase):
+    def setUp(self):
+        self.session = ChatSession.objects.create(user=User.objects.create_user("konsult"), system_prompt="Sys")
+        self.msgs = [
+            ChatMessage.objects.create(session=self.session, role=("user", "assistant")[i % 2], content=f"meddelande {i}")
+            for i in range(5)
+        ]
+
+    def _contents(self, history):
+        return [m["content"] for m in history]
+
+    def _cost(self, *contents):
+        return sum(chat_history.message_tokens({"content": c}) for c in contents)
+
+    def test_older_turns_are_dropped_at_the_budget(self):
+        budget = self._cost("Sys", "meddelande 3", "meddelande 4")
+        history = chat_history.build_history(self.session, budget=budget)
+        self.assertEqual(self._contents(history), ["Sys", "meddelande 3", "meddelande 4"])
+        self.assertEqual(history[1]["role"], "assistant")
+
+    def test_newest_message_is_always_included(self):
+        ChatMessage.objects.create(session=self.session, role="user", content="lång " * 500)
+        history = chat_history.build_history(self.session, budget=10)
+        self.assertEqual(len(history), 2)
+        self.assertTrue(history[-1]["content"].startswith("lång"))
+
+    def test_reads_past_the_first_page(self):
+        with mock.patch.object(chat_history, "PAGE_SIZE", 2):
+            history = chat_history.build_history(self.session, budget=10_000)
+        self.assertEqual(self._contents(history), ["Sys"] + [f"meddelande {i}" for i in range(5)])
+
+    def test_summarized_messages_are_left_out(self):
+        self.session.summary = "Tidigare"
+        self.session.summary_until = self.msgs[2]
+        history = chat_history.build_history(self.session, budget=10_000)
+        self.assertEqual(
+            self._contents(history),
+            ["Sys", chat_history.SUMMARY_PREFIX + "Tidigare", "meddelande 3", "meddelande 4"],
+        )
+
+
+@override_settings(CHAT_SUMMARY_KEEP_RECENT=2, CHAT_SUMMARY_CHUNK_TOKENS=50)
+class ChatSummaryTests(TestCase):
+    def setUp(self):
+        self.session = ChatSession.objects.create(user=User.objects.create_user("konsult"))
+        # 10 meddelanden à ~20 tokens -> två per bit om 50 tokens
+        self.ids = [
+            ChatMessage.objects.create(session=self.session, role="user", content="x" * 48).id
+            for _ in range(10)
+        ]
+        patch = mock.patch.object(chat_history, "connection", mock.Mock())
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def _refresh(self):
+        chunks = []
+
+        def summarize(previous, rows):
+            chunks.append([row[0] for row in rows])
+            return f"sammanfattning {len(chunks)}"
+
+        with mock.patch.object(chat_history, "_summarize", side_effect=summarize):
+            chat_history._refresh_summary(self.session.id)
+        self.session.refresh_from_db()
+        return chunks
+
+    def test_summarizes_in_chunks_and_keeps_the_newest(self):
+        chunks = self._refresh()
+        self.assertEqual(chunks, [self.ids[i:i + 2] for i in range(0, 8, 2)])
+        self.assertEqual(self.session.summary_until_id, self.ids[7])
+
+        # Inget nytt att sammanfatta förrän fler meddelanden kommit
+        self.assertEqual(self._refresh(), [])
+
+    def test_reads_one_page_at_a_time(self):
+        with mock.patch.object(chat_history, "PAGE_SIZE", 3), CaptureQueriesContext(connection) as ctx:
+            self._refresh()
+        self.assertEqual(self.session.summary_until_id, self.ids[7])
+
+        reads = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith('SELECT "myapp_chatmessage"')]
+        self.assertEqual(len(reads), 5)  # markören + en sida per bit
+        self.assertTrue(all(sql.endswith(("LIMIT 2", "LIMIT 3")) for sql in reads))
+
+
+class SearchIndexTests(TestCase):
+    def setUp(self):
+        self.anna = User.objects.create_user("anna")
+        self.bo = User.objects.create_user("bo")
+
+    def _message(self, user, content):
+        session = ChatSession.objects.create(user=user, title="Chatt")
+        with self.captureOnCommitCallbacks(execute=True):
+            return ChatMessage.objects.create(session=session, role="user", content=content)
+
+    def _report(self, **data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Report.objects.create(title=data.get("candidate_name", "Rapport"), data=data)
+
+    def _hits(self, q, user=None, **kwargs):
+        result = search_index.search(q, (user or self.anna).id, **kwargs)
+        return [(r["kind"], r["object_id"]) for r in result["results"]]
+
+    def test_other_users_messages_are_not_found(self):
+        own = self._message(self.anna, "Kandidaten har starkt ledarskap")
+        self._message(self.bo, "Bos anteckning om ledarskap")
+        rep = self._report(candidate_name="Cecilia", leda_text="Tydligt ledarskap i gruppen")
+
+        self.assertCountEqual(self._hits("ledarskap"), [("message", str(own.id)), ("report", str(rep.id))])
+        self.assertEqual(self._hits("ledarskap", kind="message"), [("message", str(own.id))])
+
+    def test_swedish_words_match_as_prefixes(self):
+        rep = self._report(candidate_name="Åsa Öberg", mod_text="Visar ledarskapet och självkännedomen")
+        self.assertEqual(self._hits("ledarskap själv"), [("report", str(rep.id))])
+        self.assertEqual(self._hits("åsa"), [("report", str(rep.id))])
+        self.assertEqual(self._hits("ledarskap saknas"), [])
+
+    def test_report_is_reindexed_on_write_and_dropped_on_soft_delete(self):
+        rep = self._report(candidate_name="Anna", leda_text="Gammal text")
+        with self.captureOnCommitCallbacks(execute=True):
+            report_state.write(rep.id, rep.data, {"leda_text": "Helt ny formulering"})
+
+        self.assertEqual(self._hits("formulering"), [("report", str(rep.id))])
+        self.assertEqual(self._hits("gammal"), [])
+
+        rep.deleted_at = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            rep.save(update_fields=["deleted_at"])
+        self.assertEqual(self._hits("formulering"), [])
+
+    def test_pages(self):
+        for i in range(3):
+            self._message(self.anna, f"Intervju nummer {i}")
+
+        first = search_index.search("intervju", self.anna.id, size=2)
+        second = search_index.search("intervju", self.anna.id, page=2, size=2)
+        self.assertEqual((len(first["results"]), first["has_next"]), (2, True))
+        self.assertEqual((len(second["results"]), second["has_next"]), (1, False))
+
+    def test_snippets_are_html_escaped(self):
+        self._message(self.anna, "<script>alert(1)</script> stresstålig")
+        snippet = search_index.search("stresstålig", self.anna.id)["results"][0]["snippet"]
+        self.assertNotIn("<script>", snippet)
+        self.assertIn("&lt;script&gt;", snippet)
+        self.assertIn("<mark>stresstålig</mark>", snippet)
+        self.assertEqual(search_index._highlight("a ⟦<b>⟧"), "a <mark>&lt;b&gt;</mark>")
+
+
+class ReportRevisionTests(TestCase):
+    def _write(self, rep, changed, removed=()):
+        saved = Report.objects.get(id=rep.id).data
+        report_state.write(rep.id, saved, changed, removed)
+
+    @override_settings(REPORT_REVISION_SNAPSHOT_EVERY=3)
+    def test_versions_are_rebuilt_across_snapshots(self):
+        rep = Report.objects.create(data={})
+        expected = {}
+        for i in range(1, 8):
+            self._write(rep, {"leda_text": f"v{i}", f"k{i}": i}, removed=[f"k{i - 1}"] if i > 1 else ())
+            expected[i] = {"leda_text": f"v{i}", f"k{i}": i}
+
+        snapshots = list(rep.revisions.filter(is_snapshot=True).values_list("number", flat=True))
+        self.assertEqual(snapshots, [1, 4, 7])
+        for number, data in expected.items():
+            self.assertEqual(report_revisions.data_at(rep.id, number), data)
+        self.assertEqual(Report.objects.get(id=rep.id).data, expected[7])
+
+    def test_report_from_before_history_gets_an_implicit_version_1(self):
+        rep = Report.objects.create(data={"leda_text": "Gammal"})
+        self._write(rep, {"leda_text": "Ny"})
+
+        self.assertEqual(report_revisions.data_at(rep.id, 1), {"leda_text": "Gammal"})
+        self.assertEqual(report_revisions.data_at(rep.id, 2), {"leda_text": "Ny"})
+        self.assertEqual([r["number"] for r in report_revisions.history(rep.id)], [1, 2])
+
+    def test_compare(self):
+        rep = Report.objects.create(data={})
+        self._write(rep, {"leda_text": "A", "mod_text": "M"})
+        self._write(rep, {"leda_text": "B", "slutsats_text": "S"}, removed=["mod_text"])
+
+        self.assertEqual(report_revisions.compare(rep.id, 1, 2), {
+            "from": 1,
+            "to": 2,
+            "added": {"slutsats_text": "S"},
+            "removed": {"mod_text": "M"},
+            "changed": {"leda_text": {"before": "A", "after": "B"}},
+        })
+        with self.assertRaises(report_revisions.RevisionNotFound):
+            report_revisions.compare(rep.id, 1, 3)
+
+    def test_views(self):
+        self.client.force_login(User.objects.create_user("konsult"))
+        rep = Report.objects.create(data={})
+        self._write(rep, {"leda_text": "A"})
+        self._write(rep, {"leda_text": "B"})
+
+        resp = self.client.get(reverse("report_revision_list", args=[rep.id]))
+        self.assertEqual([r["changed"] for r in resp.json()["revisions"]], [["leda_text"], ["leda_text"]])
+
+        resp = self.client.get(reverse("report_revision_detail", args=[rep.id, 1]))
+        self.assertEqual(resp.json(), {"number": 1, "data": {"leda_text": "A"}})
+        self.assertEqual(self.client.get(reverse("report_revision_detail", args=[rep.id, 9])).status_code, 404)
+
+        diff_url = reverse("report_revision_diff", args=[rep.id])
+        self.assertEqual(self.client.get(diff_url, {"from": 1}).json()["to"], 2)
+        self.assertEqual(self.client.get(diff_url, {"from": "ett"}).status_code, 400)
+        self.assertEqual(self.client.get(diff_url, {"from": 1, "to": 9}).status_code, 404)
+
+
+class ExtractionCacheTests(TestCase):
+    def setUp(self):
+        patch = mock.patch.object(file_text, "extract_bytes", wraps=file_text.extract_bytes)
+        self.parse = patch.start()
+        self.addCleanup(patch.stop)
+
+    def _file(self, content="Jobbannons för rådman", name="annons.txt"):
+        return SimpleUploadedFile(name, content.encode("utf-8"))
+
+    def test_same_bytes_are_parsed_once(self):
+        first = extraction_cache.extract(self._file(name="a.txt"))
+        second = extraction_cache.extract(self._file(name="kopia.txt"))
+
+        self.assertEqual(second.pk, first.pk)
+        self.assertEqual((second.text, second.engine), ("Jobbannons för rådman", "text"))
+        self.assertEqual(self.parse.call_count, 1)
+        self.assertEqual(FileExtraction.objects.get(pk=first.pk).hits, 1)
+        stats = extraction_cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (1, 1, 1))
+
+    def test_each_character_budget_gets_its_own_row(self):
+        full = extraction_cache.extract(self._file())
+        short = extraction_cache.extract(self._file(), max_chars=100)
+        self.assertNotEqual(full.pk, short.pk)
+        self.assertEqual((full.max_chars, short.max_chars), (0, 100))
+        self.assertEqual(self.parse.call_count, 2)
+
+    @override_settings(FILE_TEXT_CACHE_MAX_ENTRIES=2)
+    def test_least_recently_used_extractions_are_evicted(self):
+        rows = [extraction_cache.extract(self._file(f"fil {i}")) for i in range(2)]
+        FileExtraction.objects.filter(pk=rows[1].pk).update(last_used_at=timezone.now() - timedelta(hours=1))
+        extraction_cache.extract(self._file("fil 2"))
+
+        self.assertEqual(FileExtraction.objects.count(), 2)
+        self.assertFalse(FileExtraction.objects.filter(pk=rows[1].pk).exists())
+
+    @override_settings(FILE_TEXT_CACHE_ENABLED=False)
+    def test_disabled_cache_stores_nothing(self):
+        row = extraction_cache.extract(self._file())
+        self.assertIsNone(row.pk)
+        self.assertEqual(row.text, "Jobbannons för rådman")
+        self.assertFalse(FileExtraction.objects.exists())
+
+    def test_chat_attachments_share_the_extraction(self):
+        session = ChatSession.objects.create(user=User.objects.create_user("konsult"))
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            for name in ("cv.txt", "cv-igen.txt"):
+                msg = ChatMessage.objects.create(session=session, role="user", content="")
+                texts = views._save_chat_attachments(msg, [self._file("Kandidatens CV", name)])
+                self.assertIn("Kandidatens CV", texts[0])
+
+        attachments = list(ChatAttachment.objects.all())
+        self.assertEqual(len(attachments), 2)
+        self.assertIsNotNone(attachments[0].extraction_id)
+        self.assertEqual(attachments[0].extraction_id, attachments[1].extraction_id)
+        self.assertEqual(self.parse.call_count, 1)
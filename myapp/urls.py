@@ -1,8 +1,16 @@
+from django.conf import settings
 from django.urls import path
 from .views import index, prompt_editor
 from django.contrib.auth import views as auth_views
 from . import views
 
+# Under ASGI (uvicorn) används async-vyerna för chatt och AI-generering,
+# under WSGI de vanliga – så båda kan köras sida vid sida under utrullningen.
+if settings.ASGI_ENABLED:
+    from . import async_views as ai_views
+else:
+    ai_views = views
+
 
 urlpatterns = [
     path('', index, name='index'),
@@ -11,12 +19,41 @@ urlpatterns = [
     path("logout/", auth_views.LogoutView.as_view(), name="logout"),
     path("chat/", views.chat_home, name="chat_home"),
     path("chat/<int:session_id>/", views.chat_session, name="chat_session"),
-    path("chat/<int:session_id>/send/", views.chat_send, name="chat_send"),
+    path("chat/<int:session_id>/send/", ai_views.chat_send, name="chat_send"),
     path("chat/<int:session_id>/delete/", views.chat_delete, name="chat_delete"),
-    path("sidebar-chat/", views.sidebar_chat, name="sidebar_chat"),
+    path("sidebar-chat/", ai_views.sidebar_chat, name="sidebar_chat"),
     path("reports/<uuid:report_id>/download/", views.report_download, name="report_download"),
     path("reports/", views.report_list, name="report_list"),
+    path("reports/page/", views.report_list_page, name="report_list_page"),
+    path("search/", views.search, name="search"),
+    path("reports/export/", views.report_bulk_export, name="report_bulk_export"),
+    path("reports/batch/", views.report_batch_upload, name="report_batch_upload"),
     path("reports/<uuid:report_id>/", views.report_open, name="report_open"),
     path("reports/<uuid:report_id>/edit/", views.report_edit, name="report_edit"),
     path("reports/<uuid:report_id>/delete/", views.report_delete, name="report_delete"),
-]
\ No newline at end of file
+    path("reports/<uuid:report_id>/jobs/", ai_views.report_jobs, name="report_jobs"),
+    path("reports/<uuid:report_id>/revisions/", views.report_revision_list, name="report_revision_list"),
+    path("reports/<uuid:report_id>/revisions/diff/", views.report_revision_diff, name="report_revision_diff"),
+    path(
+        "reports/<uuid:report_id>/revisions/<int:number>/",
+        views.report_revision_detail,
+        name="report_revision_detail",
+    ),
+    path(
+        "reports/<uuid:report_id>/sections/<str:key>/generate/",
+        ai_views.report_section_generate,
+        name="report_section_generate",
+    ),
+]
+
+# SSE håller anslutningen öppen tills svaret är klart (upp till CHAT_STREAM_MAX_SECONDS)
+# – bara under ASGI, under WSGI skulle varje anslutning låsa en synkron worker.
+if settings.ASGI_ENABLED:
+    urlpatterns += [
+        path("chat/<int:session_id>/sse/", ai_views.chat_sse, name="chat_sse"),
+        path(
+            "chat/<int:session_id>/sse/<int:message_id>/",
+            ai_views.chat_sse_resume,
+            name="chat_sse_resume",
+        ),
+    ]
@@ -0,0 +1,109 @@
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import F
+from django.utils import timezone
+
+from ..models import AICacheStats, AIResponseCache
+
+
+def _enabled() -> bool:
+    return getattr(settings, "AI_CACHE_ENABLED", True)
+
+
+def cache_key(model: str, temperature: float, max_tokens: int, prompt: str) -> str:
+    """Samma modell + inställningar + färdig prompt ger samma nyckel."""
+    raw = "\x1f".join([model, repr(float(temperature)), str(int(max_tokens)), prompt or ""])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def record(field: str) -> None:
+    """Räkna upp "hits", "misses" eller "bypasses" (atomiskt, utan att läsa raden)."""
+    try:
+        updated = AICacheStats.objects.filter(id=1).update(**{field: F(field) + 1})
+        if not updated:
+            AICacheStats.objects.get_or_create(id=1, defaults={field: 1})
+    except DatabaseError:
+        pass
+
+
+def get_cached(key: str):
+    """Returnerar cachat svar eller None. Utgångna svar räknas som miss."""
+    if not _enabled():
+        return None
+
+    ttl = getattr(settings, "AI_CACHE_TTL", 30 * 24 * 3600)
+    try:
+        row = (
+            AIResponseCache.objects
+            .filter(key=key, created_at__gte=timezone.now() - timedelta(seconds=ttl))
+            .only("response")
+            .first()
+        )
+        if row is None:
+            record("misses")
+            return None
+
+        # LRU: håll koll på när svaret senast användes
+        AIResponseCache.objects.filter(key=key).update(
+            hits=F("hits") + 1,
+            last_used_at=timezone.now(),
+        )
+    except DatabaseError:
+        return None
+
+    record("hits")
+    return row.response
+
+
+def store(key: str, model: str, response: str) -> None:
+    if not _enabled() or not response:
+        return
+    try:
+        AIResponseCache.objects.update_or_create(
+            key=key,
+            defaults={
+                "model": model,
+                "response": response,
+                "created_at": timezone.now(),
+                "last_used_at": timezone.now(),
+            },
+        )
+        evict()
+    except DatabaseError:
+        pass
+
+
+def evict() -> int:
+    """Ta bort utgångna svar och, om cachen är för stor, de minst nyligen använda."""
+    ttl = getattr(settings, "AI_CACHE_TTL", 30 * 24 * 3600)
+    max_entries = getattr(settings, "AI_CACHE_MAX_ENTRIES", 5000)
+
+    removed, _ = AIResponseCache.objects.filter(
+        created_at__lt=timezone.now() - timedelta(seconds=ttl)
+    ).delete()
+
+    overflow = AIResponseCache.objects.count() - max_entries
+    if overflow > 0:
+        oldest = list(
+            AIResponseCache.objects.order_by("last_used_at").values_list("key", flat=True)[:overflow]
+        )
+        deleted, _ = AIResponseCache.objects.filter(key__in=oldest).delete()
+        removed += deleted
+    return removed
+
+
+def stats() -> dict:
+    s = AICacheStats.objects.filter(id=1).first()
+    hits = s.hits if s else 0
+    misses = s.misses if s else 0
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "bypasses": s.bypasses if s else 0,
+        "hit_rate": (hits / total) if total else 0.0,
+        "entries": AIResponseCache.objects.count(),
+    }
@@ -0,0 +1,141 @@
+import io
+import multiprocessing
+import os
+import uuid
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.conf import settings
+
+from ..models import Report
+from . import export_process
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Bulkexport: många rapporter som en ZIP med en DOCX per rapport.
+#
+# Rapporterna renderas i en processpool (python-docx är ren Python, så trådar
+# hjälper inte) och ZIP:en streamas ut allteftersom dokumenten blir klara.
+# Arbetsprocesserna (utils/export_process.py) rör aldrig databasen – de får
+# Report.data från föräldern. De startas med spawn, inte fork: exporten körs i
+# en webbworker med andra trådar, och en fork medan någon av dem håller ett lås
+# (mallcachen, logging, DB-drivrutinen) kan låsa barnprocessen för alltid.
+# ──────────────────────────────────────────────────────────────────────────────
+BATCH_SIZE = 50
+
+
+def select_reports(ids=None, date_from=None, date_to=None, created_by=None):
+    """Urval för exporten: id:n, datumintervall (skapad) och/eller skapare (användarnamn)."""
+    qs = Report.objects.filter(deleted_at__isnull=True)
+    if ids:
+        valid = []
+        for value in ids:
+            try:
+                valid.append(uuid.UUID(str(value)))
+            except ValueError:
+                continue
+        qs = qs.filter(id__in=valid)
+    if date_from:
+        qs = qs.filter(created_at__date__gte=date_from)
+    if date_to:
+        qs = qs.filter(created_at__date__lte=date_to)
+    if created_by:
+        qs = qs.filter(created_by__username=created_by)
+    return qs.order_by("created_at")
+
+
+def _batches(queryset):
+    ids = list(queryset.values_list("id", flat=True))
+    for i in range(0, len(ids), BATCH_SIZE):
+        chunk = ids[i:i + BATCH_SIZE]
+        rows = dict(Report.objects.filter(id__in=chunk).values_list("id", "data"))
+        yield [rows[pk] for pk in chunk if pk in rows]
+
+
+def _render_all(queryset, workers: int):
+    """Ger (filnamn, bytes) i den ordning dokumenten blir klara."""
+    batches = _batches(queryset)
+    pending_data = next(batches, [])
+
+    # Att starta processerna (spawn, ny tolk + Django) tar några sekunder –
+    # små exporter (högst en batch) går fortare direkt i den här processen
+    if workers <= 1 or len(pending_data) < BATCH_SIZE:
+        for batch in (pending_data, *batches):
+            for data in batch:
+                yield export_process.render_report(data)
+        return
+
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=export_process.init,
+    )
+    in_flight = set()
+    try:
+        while pending_data or in_flight:
+            while pending_data and len(in_flight) < workers * 2:
+                in_flight.add(pool.submit(export_process.render_report, pending_data.pop(0)))
+                if not pending_data:
+                    pending_data = next(batches, [])
+
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for fut in done:
+                yield fut.result()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+class _ZipStream(io.RawIOBase):
+    """Skrivbar ström som samlar det zipfile skriver tills vi hämtar ut det."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _unique_name(filename: str, used: set) -> str:
+    """
+    Namnet i ZIP:en. Namnet byggs av kandidatens namn och roll, så "/", "\\"
+    och ".." städas bort – annars blir t.ex. "Rådman/ordf" en katalog i arkivet.
+    """
+    # Sen import: views importerar den här modulen
+    from ..views import _safe_filename
+
+    stem, ext = os.path.splitext(filename)
+    base = _safe_filename(stem)
+    ext = "." + _safe_filename(ext.lstrip("."), fallback="docx")
+    name, n = f"{base}{ext}", 1
+    while name in used:
+        n += 1
+        name = f"{base} ({n}){ext}"
+    used.add(name)
+    return name
+
+
+def iter_report_zip(queryset, workers: int | None = None):
+    """
+    Generator med ZIP-bytes för alla rapporter i urvalet – skickas direkt till
+    StreamingHttpResponse eller skrivs till fil av `manage.py export_reports`.
+    """
+    if workers is None:
+        workers = getattr(settings, "BULK_EXPORT_WORKERS", 2)
+
+    stream = _ZipStream()
+    used = set()
+    # DOCX är redan komprimerade – ZIP_STORED sparar bara CPU
+    with zipfile.ZipFile(stream, "w", compression=zipfile.ZIP_STORED) as zf:
+        for filename, content in _render_all(queryset, workers):
+            zf.writestr(_unique_name(filename, used), content)
+            yield stream.drain()
+    yield stream.drain()
@@ -0,0 +1,221 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Sum
+from django.db.models.functions import Length
+from django.utils import timezone
+
+from ..models import ChatMessage, ChatSession
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Historik till OpenAI för en chattsession, begränsad till en tokenbudget.
+#
+# Systemprompten + ev. löpande sammanfattning + de senaste meddelandena som
+# ryms i CHAT_HISTORY_TOKEN_BUDGET. Meddelandena läses bakifrån i sidor
+# (LIMIT/OFFSET), så en lång sidopanelschatt kostar lika mycket per tur som en
+# ny – både i databasen och i tokens.
+#
+# Sammanfattningen uppdateras i en bakgrundstråd när de osammanfattade
+# meddelandena blir för många (CHAT_SUMMARY_TRIGGER_TOKENS), aldrig i requesten.
+# ──────────────────────────────────────────────────────────────────────────────
+PAGE_SIZE = 50
+SUMMARY_PREFIX = "Sammanfattning av det tidigare samtalet (äldre meddelanden visas inte):\n"
+SUMMARY_MODEL = "gpt-4o-mini"
+SUMMARY_INSTRUCTION = (
+    "Du för en löpande sammanfattning av en chatt mellan en konsult och en AI-assistent. "
+    "Uppdatera sammanfattningen med de nya meddelandena. Behåll fakta om kandidaten, "
+    "beslut, önskemål om formuleringar och öppna frågor; skippa artighetsfraser. "
+    "Skriv på svenska, högst cirka 300 ord. Svara endast med den nya sammanfattningen."
+)
+MESSAGE_OVERHEAD = 4  # roll + avgränsare per meddelande i chat-formatet
+
+try:
+    import tiktoken
+
+    _encoding = tiktoken.get_encoding("o200k_base")  # gpt-4o / gpt-4o-mini
+except Exception:  # tiktoken saknas eller kan inte hämta kodningen
+    _encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """Antal tokens (tiktoken om det finns, annars en försiktig uppskattning)."""
+    text = text or ""
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    # svensk text blir ~3 tecken per token, räkna hellre för många än för få
+    return len(text) // 3 + 1
+
+
+def message_tokens(message: dict) -> int:
+    return count_tokens(message.get("content", "")) + MESSAGE_OVERHEAD
+
+
+def build_history(session, budget: int | None = None) -> list:
+    """
+    [systemprompt, ...senaste meddelandena i kronologisk ordning].
+    Det allra senaste meddelandet kommer alltid med, även om det ensamt är över budget.
+    """
+    if budget is None:
+        budget = getattr(settings, "CHAT_HISTORY_TOKEN_BUDGET", 6000)
+
+    head = [{"role": "system", "content": session.system_prompt}]
+    newest_first = session.messages.order_by("-created_at", "-id")
+    if session.summary:
+        head.append({"role": "system", "content": SUMMARY_PREFIX + session.summary})
+        if session.summary_until_id:
+            newest_first = newest_first.filter(id__gt=session.summary_until_id)
+    remaining = budget - sum(map(message_tokens, head))
+
+    tail = []
+    newest_first = newest_first.values_list("role", "content")
+    offset = 0
+    while True:
+        page = list(newest_first[offset:offset + PAGE_SIZE])
+        for role, content in page:
+            msg = {"role": role, "content": content}
+            cost = message_tokens(msg)
+            if tail and cost > remaining:
+                return head + tail[::-1]
+            tail.append(msg)
+            remaining -= cost
+        if len(page) < PAGE_SIZE:
+            return head + tail[::-1]
+        offset += PAGE_SIZE
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Löpande sammanfattning
+# ──────────────────────────────────────────────────────────────────────────────
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="chat-summary")
+_inflight = set()
+_inflight_lock = threading.Lock()
+
+
+def _unsummarized(session_id, until_id):
+    qs = ChatMessage.objects.filter(session_id=session_id)
+    if until_id:
+        qs = qs.filter(id__gt=until_id)
+    return qs
+
+
+def schedule_summary_refresh(session) -> bool:
+    """
+    Anropas efter varje sparat AI-svar. Startar en sammanfattning i bakgrunden om
+    de osammanfattade meddelandena överstiger CHAT_SUMMARY_TRIGGER_TOKENS.
+    Kostar en aggregatfråga; väntar aldrig på OpenAI.
+    """
+    if not getattr(settings, "CHAT_SUMMARY_ENABLED", True):
+        return False
+
+    chars = (
+        _unsummarized(session.id, session.summary_until_id)
+        .aggregate(n=Sum(Length("content")))["n"]
+        or 0
+    )
+    # samma försiktiga uppskattning som count_tokens utan tiktoken
+    if chars // 3 < getattr(settings, "CHAT_SUMMARY_TRIGGER_TOKENS", 4000):
+        return False
+
+    with _inflight_lock:
+        if session.id in _inflight:
+            return False
+        _inflight.add(session.id)
+    _executor.submit(_refresh_summary, session.id)
+    return True
+
+
+def _summarize(previous: str, messages: list) -> str:
+    from ..views import client  # samma OpenAI-klient som chatten
+
+    transcript = "\n\n".join(f"[{role}] {content}" for _, role, content in messages)
+    try:
+        resp = client.chat.completions.create(
+            model=SUMMARY_MODEL,
+            messages=[
+                {"role": "system", "content": SUMMARY_INSTRUCTION},
+                {
+                    "role": "user",
+                    "content": f"Nuvarande sammanfattning:\n{previous or '(ingen ännu)'}\n\n"
+                               f"Nya meddelanden:\n{transcript}",
+                },
+            ],
+            temperature=0.2,
+            max_tokens=600,
+        )
+        return (resp.choices[0].message.content or "").strip()
+    except Exception as e:
+        print("⚠️ OpenAI error in chat summary:", repr(e))
+        return ""
+
+
+def _next_chunk(session_id, until_id, cutoff_id, budget: int):
+    """
+    De äldsta osammanfattade meddelandena (id efter until_id, före cutoff_id) upp till
+    budget tokens. Läses i sidor om PAGE_SIZE, så en lång session kostar inte mer än en
+    kort. Returnerar (rader, finns_det_fler).
+    """
+    rows = ChatMessage.objects.filter(session_id=session_id).order_by("id")
+    if cutoff_id is not None:
+        rows = rows.filter(id__lt=cutoff_id)
+    rows = rows.values_list("id", "role", "content")
+
+    chunk, used, after = [], 0, until_id or 0
+    while True:
+        page = list(rows.filter(id__gt=after)[:PAGE_SIZE])
+        for row in page:
+            cost = count_tokens(row[2]) + MESSAGE_OVERHEAD
+            if chunk and used + cost > budget:
+                return chunk, True
+            chunk.append(row)
+            used += cost
+        if len(page) < PAGE_SIZE:
+            return chunk, False
+        after = page[-1][0]
+
+
+def _refresh_summary(session_id) -> None:
+    """
+    Bakgrundsjobb: för in äldre meddelanden i sammanfattningen, i bitar om högst
+    CHAT_SUMMARY_CHUNK_TOKENS. De CHAT_SUMMARY_KEEP_RECENT senaste lämnas orörda.
+    """
+    keep = getattr(settings, "CHAT_SUMMARY_KEEP_RECENT", 6)
+    chunk_budget = getattr(settings, "CHAT_SUMMARY_CHUNK_TOKENS", 8000)
+    try:
+        # Gränsen för det som får sammanfattas: id för det äldsta av de `keep` senaste
+        cutoff_id = None
+        if keep:
+            recent = list(
+                ChatMessage.objects.filter(session_id=session_id)
+                .order_by("-id")
+                .values_list("id", flat=True)[:keep]
+            )
+            if len(recent) < keep:
+                return
+            cutoff_id = recent[-1]
+
+        for _ in range(5):  # tak per körning; nästa AI-svar startar en ny vid behov
+            session = ChatSession.objects.filter(id=session_id).only("summary", "summary_until").first()
+            if session is None:
+                return
+
+            chunk, more = _next_chunk(session_id, session.summary_until_id, cutoff_id, chunk_budget)
+            if not chunk:
+                return
+
+            summary = _summarize(session.summary, chunk)
+            if not summary:
+                return
+
+            # Villkorat på markören: bara en uppdatering vinner om två körs samtidigt
+            updated = ChatSession.objects.filter(
+                id=session_id, summary_until_id=session.summary_until_id
+            ).update(summary=summary, summary_until_id=chunk[-1][0], summary_updated_at=timezone.now())
+            if not updated or not more:
+                return
+    finally:
+        with _inflight_lock:
+            _inflight.discard(session_id)
+        # Trådarna i poolen återanvänds – släpp DB-anslutningen efter varje jobb
+        connection.close()
@@ -0,0 +1,254 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from ..models import ChatMessage, ChatSession
+from . import chat_history, search_index
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Återupptagbara AI-svar för chatten (Server-Sent Events).
+#
+# Svaret genereras i en bakgrundstråd, oberoende av HTTP-anslutningen, och
+# skrivs löpande till ett assistant-meddelande (is_complete=False tills det är
+# klart). Händelserna har id "<meddelande-id>:<antal tecken>", så en klient som
+# tappar nätet ansluter igen med Last-Event-ID och får resten.
+#
+# I samma process läses tokens direkt ur minnet; en återanslutning som hamnar
+# i en annan worker läser det som hunnit sparas i databasen.
+#
+# Kräver ASGI (ASGI_ENABLED=True, uvicorn): händelserna är en async-generator som
+# bara väntar på event loopen. Under WSGI skulle varje anslutning låsa en
+# synkron worker i upp till CHAT_STREAM_MAX_SECONDS, så där registreras inte
+# SSE-vyerna alls (urls.py) och chatten använder text/plain-strömmen.
+#
+# ReplyWriter (sparande i omgångar) används även av de vanliga text/plain-strömmarna.
+# ──────────────────────────────────────────────────────────────────────────────
+HEARTBEAT_SECONDS = 15
+LIVE_POLL_SECONDS = 0.05
+DB_POLL_SECONDS = 0.5
+ABORTED_NOTE = "(Svaret avbröts innan det blev klart.)"
+
+_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, "CHAT_STREAM_WORKERS", 8),
+    thread_name_prefix="chat-stream",
+)
+_live = {}  # meddelande-id -> _LiveReply (svar som genereras i den här processen)
+_live_lock = threading.Lock()
+
+
+class _LiveReply:
+    def __init__(self):
+        self.text = ""
+        self.done = False
+        self._lock = threading.Lock()
+
+    def append(self, piece: str) -> None:
+        with self._lock:
+            self.text += piece
+
+    def finish(self) -> None:
+        with self._lock:
+            self.done = True
+
+    def snapshot(self):
+        with self._lock:
+            return self.text, self.done
+
+
+class ReplyWriter:
+    """
+    Skriver ett assistant-svar till databasen medan det streamas: raden skapas
+    direkt (is_complete=False) och texten sparas i omgångar – var
+    CHAT_STREAM_FLUSH_TOKENS:e bit eller efter CHAT_STREAM_FLUSH_SECONDS – med
+    UPDATE som bara rör content. Dör workern finns allt fram till senaste omgången kvar.
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self.message = ChatMessage(session=session, role="assistant", content="", is_complete=False)
+        self.text = ""
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        self._flush_tokens = getattr(settings, "CHAT_STREAM_FLUSH_TOKENS", 20)
+        self._flush_seconds = getattr(settings, "CHAT_STREAM_FLUSH_SECONDS", 1.0)
+
+    def add(self, piece: str) -> bool:
+        """Lägger till en bit; True när det är dags att spara (flush/aflush)."""
+        self.text += piece
+        self._pending += 1
+        return (
+            self._pending >= self._flush_tokens
+            or time.monotonic() - self._last_flush >= self._flush_seconds
+        )
+
+    def _rows(self):
+        self._pending, self._last_flush = 0, time.monotonic()
+        return ChatMessage.objects.filter(id=self.message.id)
+
+    def _final_text(self) -> str:
+        # rstrip – inledande tecken ändras inte, så redan skickade event-id:n stämmer
+        return self.text.rstrip()
+
+    def open(self) -> ChatMessage:
+        self.message.save()
+        return self.message
+
+    def flush(self) -> None:
+        self._rows().update(content=self.text)
+
+    def finish(self) -> None:
+        self._rows().update(content=self._final_text(), is_complete=True)
+        # bara updated_at – sammanfattningen kan ha uppdaterats i bakgrunden
+        ChatSession.objects.filter(id=self.session.id).update(updated_at=timezone.now())
+        chat_history.schedule_summary_refresh(self.session)
+        search_index.index_message(self.message.id)  # update() skickar ingen post_save
+
+    async def aopen(self) -> ChatMessage:
+        await self.message.asave()
+        return self.message
+
+    async def aflush(self) -> None:
+        await self._rows().aupdate(content=self.text)
+
+    async def afinish(self) -> None:
+        await self._rows().aupdate(content=self._final_text(), is_complete=True)
+        await ChatSession.objects.filter(id=self.session.id).aupdate(updated_at=timezone.now())
+        await sync_to_async(chat_history.schedule_summary_refresh)(self.session)
+        await sync_to_async(search_index.index_message)(self.message.id)
+
+
+def finish_stale_replies(session_id=None) -> int:
+    """
+    Svar som fortfarande är is_complete=False långt efter att de borde vara klara
+    (workern dödades eller startades om mitt i strömmen) markeras som avbrutna –
+    annars visas de som halvskrivna för alltid och kommer aldrig in i sökindexet.
+    Körs för sessionen när den visas och för alla av run_report_worker.
+    """
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, "CHAT_STREAM_MAX_SECONDS", 300))
+    stale = ChatMessage.objects.filter(role="assistant", is_complete=False, created_at__lt=cutoff)
+    if session_id is not None:
+        stale = stale.filter(session_id=session_id)
+    with _live_lock:
+        live_ids = set(_live)
+
+    finished = 0
+    for msg in stale.only("id", "content"):
+        if msg.id in live_ids:
+            continue
+        content = f"{msg.content.rstrip()}\n\n{ABORTED_NOTE}".strip()
+        # villkorad update – blev svaret klart under tiden vinner det
+        if ChatMessage.objects.filter(id=msg.id, is_complete=False).update(content=content, is_complete=True):
+            search_index.index_message(msg.id)
+            finished += 1
+    return finished
+
+
+def start_reply(session, messages: list, max_tokens: int = 1200) -> ChatMessage:
+    """Skapar assistant-meddelandet och startar genereringen i bakgrunden."""
+    writer = ReplyWriter(session)
+    msg = writer.open()
+    live = _LiveReply()
+    with _live_lock:
+        _live[msg.id] = live
+    _executor.submit(_produce, writer, messages, max_tokens, live)
+    return msg
+
+
+def _produce(writer: ReplyWriter, messages, max_tokens, live: _LiveReply) -> None:
+    from ..views import _chunk_text, client
+
+    try:
+        stream = client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=messages,
+            temperature=0.3,
+            max_tokens=max_tokens,
+            stream=True,
+        )
+        for chunk in stream:
+            piece = _chunk_text(chunk)
+            if not piece:
+                continue
+            live.append(piece)
+            if writer.add(piece):
+                writer.flush()
+
+    except Exception as e:
+        err = f"\n\n(Ett fel inträffade vid AI-anropet: {e})"
+        live.append(err)
+        writer.add(err)
+    finally:
+        try:
+            writer.finish()
+        finally:
+            live.finish()
+            with _live_lock:
+                _live.pop(writer.message.id, None)
+            # Trådarna i poolen återanvänds – släpp DB-anslutningen efter varje jobb
+            connection.close()
+
+
+def parse_event_id(raw: str | None, message_id) -> int:
+    """Last-Event-ID "<meddelande-id>:<offset>" -> offset (0 om det gäller ett annat svar)."""
+    try:
+        msg_part, offset = (raw or "").split(":", 1)
+        if int(msg_part) == int(message_id):
+            return max(0, int(offset))
+    except ValueError:
+        pass
+    return 0
+
+
+def _event(name: str, data: dict, event_id: str | None = None) -> str:
+    head = f"id: {event_id}\n" if event_id else ""
+    return f"{head}event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def aiter_events(message_id, offset: int = 0):
+    """
+    SSE-händelser för ett svar från offset: "start", "token" ({"t": text}) och
+    till sist "done" – eller "error" om svaret inte blir klart inom CHAT_STREAM_MAX_SECONDS.
+    """
+    max_seconds = getattr(settings, "CHAT_STREAM_MAX_SECONDS", 300)
+    deadline = time.monotonic() + max_seconds
+    last_sent = time.monotonic()
+
+    yield "retry: 2000\n"
+    yield _event("start", {"message_id": message_id}, f"{message_id}:{offset}")
+
+    with _live_lock:
+        live = _live.get(message_id)
+
+    while time.monotonic() < deadline:
+        if live is not None:
+            text, done = live.snapshot()
+        else:
+            row = await ChatMessage.objects.filter(id=message_id).values("content", "is_complete").afirst()
+            if row is None:
+                yield _event("error", {"error": "Meddelandet finns inte"})
+                return
+            text, done = row["content"], row["is_complete"]
+
+        if len(text) > offset:
+            piece, offset = text[offset:], len(text)
+            last_sent = time.monotonic()
+            yield _event("token", {"t": piece}, f"{message_id}:{offset}")
+        elif time.monotonic() - last_sent >= HEARTBEAT_SECONDS:
+            last_sent = time.monotonic()
+            yield ": ping\n\n"
+
+        if done and offset >= len(text):
+            yield _event("done", {"message_id": message_id}, f"{message_id}:{offset}")
+            return
+
+        await asyncio.sleep(LIVE_POLL_SECONDS if live is not None else DB_POLL_SECONDS)
+
+    yield _event("error", {"error": "Svaret blev inte klart i tid"})
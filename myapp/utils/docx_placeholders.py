@@ -0,0 +1,131 @@
+import re
+from collections import defaultdict
+
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.oxml.ns import qn
+from docx.text.paragraph import Paragraph
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Index över {platshållare} i ett Word-dokument.
+#
+# Dokumentet gås igenom en gång (body inkl. nästlade tabeller, sidhuvuden och
+# sidfötter) och sedan görs alla ersättningar direkt mot rätt paragrafer.
+# Word delar ofta upp en tagg i flera runs ("{", "leda_text", "}") – ersättningen
+# sker därför run för run så att övrig formatering i stycket behålls.
+# ──────────────────────────────────────────────────────────────────────────────
+PLACEHOLDER_RE = re.compile(r"\{[A-Za-z0-9_]+\}")
+
+_W_P = qn("w:p")
+_W_T = qn("w:t")
+
+
+class _StoryParent:
+    """Paragraph behöver bara .part av sin förälder (för bilder/relationer)."""
+
+    def __init__(self, part):
+        self.part = part
+
+
+def _story_roots(doc):
+    yield doc.part, doc.element.body
+    for rel in doc.part.rels.values():
+        if not rel.is_external and rel.reltype in (RT.HEADER, RT.FOOTER):
+            yield rel.target_part, rel.target_part.element
+
+
+def _replace_in_runs(paragraph, placeholder: str, value: str) -> int:
+    """
+    Ersätter placeholder i paragrafens runs. Texten hamnar i den run där taggen
+    börjar; övriga runs behåller sin text och formatering.
+    Returnerar index för den run där (sista) ersättningen gjordes, annars -1.
+    """
+    runs = paragraph.runs
+    texts = [r.text for r in runs]
+    full = "".join(texts)
+    if placeholder not in full:
+        return -1
+
+    starts = []
+    pos = 0
+    for t in texts:
+        starts.append(pos)
+        pos += len(t)
+
+    def _run_at(offset):
+        i = len(starts) - 1
+        while starts[i] > offset:
+            i -= 1
+        return i
+
+    changed = set()
+    first_run = -1
+    # bakifrån så att offseten framför inte flyttas
+    begin = full.rfind(placeholder)
+    while begin != -1:
+        end = begin + len(placeholder)
+        i, j = _run_at(begin), _run_at(end - 1)
+        a, b = begin - starts[i], end - starts[j]
+        if i == j:
+            texts[i] = texts[i][:a] + value + texts[i][b:]
+        else:
+            texts[i] = texts[i][:a] + value
+            for k in range(i + 1, j):
+                texts[k] = ""
+            texts[j] = texts[j][b:]
+            changed.update(range(i + 1, j + 1))
+        changed.add(i)
+        first_run = i
+        begin = full.rfind(placeholder, 0, begin)
+
+    for k in changed:
+        runs[k].text = texts[k]
+    return first_run
+
+
+class PlaceholderIndex:
+    def __init__(self, doc):
+        self.doc = doc
+        self._paragraphs = defaultdict(list)  # "{namn}" -> [Paragraph, ...]
+
+        for part, root in _story_roots(doc):
+            parent = _StoryParent(part)
+            for p in root.iter(_W_P):
+                # snabb förkontroll på rå XML-text innan vi bygger Paragraph
+                if "{" not in "".join(t.text or "" for t in p.iter(_W_T)):
+                    continue
+                paragraph = Paragraph(p, parent)
+                for placeholder in dict.fromkeys(PLACEHOLDER_RE.findall(paragraph.text)):
+                    self._paragraphs[placeholder].append(paragraph)
+
+    def __contains__(self, placeholder):
+        return bool(self._paragraphs.get(placeholder))
+
+    def paragraphs(self, placeholder: str) -> list:
+        return list(self._paragraphs.get(placeholder, ()))
+
+    def replace_text(self, mapping: dict) -> None:
+        """Ersätter alla förekomster av varje {tagg} i mapping."""
+        for placeholder, value in mapping.items():
+            for paragraph in self._paragraphs.get(placeholder, ()):
+                _replace_in_runs(paragraph, placeholder, value or "")
+
+    def insert_table_after(self, placeholder: str, table) -> bool:
+        """Flyttar in tabellen direkt efter första paragrafen med taggen och tar bort taggen."""
+        paragraphs = self._paragraphs.get(placeholder)
+        if not paragraphs:
+            return False
+        paragraph = paragraphs[0]
+        paragraph._p.addnext(table._tbl)
+        _replace_in_runs(paragraph, placeholder, "")
+        return True
+
+    def insert_picture(self, placeholder: str, image_stream, width) -> bool:
+        """Ersätter första förekomsten av taggen med en bild."""
+        paragraphs = self._paragraphs.get(placeholder)
+        if not paragraphs:
+            return False
+        paragraph = paragraphs[0]
+        i = _replace_in_runs(paragraph, placeholder, "")
+        run = paragraph.runs[i] if i >= 0 else paragraph.add_run()
+        run.add_picture(image_stream, width=width)
+        return True
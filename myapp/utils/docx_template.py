@@ -0,0 +1,39 @@
+import copy
+import os
+import threading
+
+from django.conf import settings
+from docx import Document
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Word-mallen för rapportexport, parsad en gång per process.
+# Varje export får en egen djupkopia (XML-träden kopieras, zip + parsning sparas).
+# ──────────────────────────────────────────────────────────────────────────────
+_lock = threading.Lock()
+_templates = {}  # sökväg -> (mtime_ns, Document)
+
+
+def template_path() -> str:
+    return getattr(
+        settings,
+        "REPORT_TEMPLATE_PATH",
+        os.path.join(settings.BASE_DIR, "reports", "domarnamnden_template.docx"),
+    )
+
+
+def _cached_template(path: str):
+    mtime = os.stat(path).st_mtime_ns
+    with _lock:
+        cached = _templates.get(path)
+        if cached is None or cached[0] != mtime:
+            # Första gången, eller mallen har bytts ut på disk
+            cached = (mtime, Document(path))
+            _templates[path] = cached
+        return cached[1]
+
+
+def load_template(path: str | None = None):
+    """
+    Returnerar ett nytt Document från mallen som exporten får ändra fritt i.
+    """
+    return copy.deepcopy(_cached_template(path or template_path()))
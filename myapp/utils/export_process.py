@@ -0,0 +1,25 @@
+import io
+
+import django
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Det som körs i bulkexportens arbetsprocesser (utils/bulk_export.py).
+#
+# Processerna startas med spawn och importerar den här modulen innan Django är
+# uppsatt – därför inga modell- eller vy-importer på modulnivå här.
+# ──────────────────────────────────────────────────────────────────────────────
+
+
+def init():
+    # En ny tolk: sätt upp Django (DJANGO_SETTINGS_MODULE ärvs via miljön)
+    django.setup()
+
+
+def render_report(data: dict):
+    """Report.data -> (filnamn, docx-bytes). Rör aldrig databasen."""
+    from ..views import _report_docx_from_data
+
+    doc, filename = _report_docx_from_data(data or {})
+    out = io.BytesIO()
+    doc.save(out)
+    return filename, out.getvalue()
@@ -0,0 +1,92 @@
+import hashlib
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import F
+from django.utils import timezone
+
+from ..models import FileExtraction, FileExtractionStats
+from . import file_text
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Cache för textutdrag, nycklad på sha256 av filens bytes (+ teckenbudget).
+# Samma jobbannons för alla kandidater i en rekrytering, eller samma CV i flera
+# chattar, kostar då en hash i stället för en hel PDF/DOCX-parsning.
+# ──────────────────────────────────────────────────────────────────────────────
+
+
+def _enabled() -> bool:
+    return getattr(settings, "FILE_TEXT_CACHE_ENABLED", True)
+
+
+def record(field: str) -> None:
+    """Räkna upp "hits" eller "misses" (atomiskt, utan att läsa raden)."""
+    try:
+        updated = FileExtractionStats.objects.filter(id=1).update(**{field: F(field) + 1})
+        if not updated:
+            FileExtractionStats.objects.get_or_create(id=1, defaults={field: 1})
+    except DatabaseError:
+        pass
+
+
+def extract(django_file, max_chars: int | None = None) -> FileExtraction:
+    """
+    Textutdrag för filen – från cachen om samma innehåll redan har lästs.
+    Returnerar en FileExtraction (.text, .engine); den är osparad (pk=None)
+    om cachen är avstängd eller databasen inte svarar.
+    """
+    try:
+        data = file_text.read_bytes(django_file)
+    except Exception:
+        return FileExtraction(text="", engine="")
+
+    key = {"sha256": hashlib.sha256(data).hexdigest(), "max_chars": max_chars or 0}
+    if _enabled():
+        try:
+            row = FileExtraction.objects.filter(**key).first()
+            if row is not None:
+                FileExtraction.objects.filter(pk=row.pk).update(hits=F("hits") + 1, last_used_at=timezone.now())
+                record("hits")
+                return row
+        except DatabaseError:
+            pass
+
+    text, engine = file_text.extract_bytes(data, django_file.name, max_chars)
+    row = FileExtraction(text=text, engine=engine, size=len(data), **key)
+    if not _enabled():
+        return row
+
+    record("misses")
+    try:
+        # get_or_create: två samtidiga uppladdningar av samma fil ger en rad
+        row, _ = FileExtraction.objects.get_or_create(
+            **key, defaults={"text": text, "engine": engine, "size": len(data)}
+        )
+        evict()
+    except DatabaseError:
+        pass
+    return row
+
+
+def evict() -> int:
+    """Om cachen är för stor: ta bort de minst nyligen använda utdragen."""
+    max_entries = getattr(settings, "FILE_TEXT_CACHE_MAX_ENTRIES", 2000)
+    overflow = FileExtraction.objects.count() - max_entries
+    if overflow <= 0:
+        return 0
+    oldest = list(FileExtraction.objects.order_by("last_used_at").values_list("pk", flat=True)[:overflow])
+    deleted, _ = FileExtraction.objects.filter(pk__in=oldest).delete()
+    return deleted
+
+
+def stats() -> dict:
+    s = FileExtractionStats.objects.filter(id=1).first()
+    hits = s.hits if s else 0
+    misses = s.misses if s else 0
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": (hits / total) if total else 0.0,
+        "entries": FileExtraction.objects.count(),
+    }
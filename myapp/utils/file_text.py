@@ -0,0 +1,124 @@
+import io
+
+import chardet
+from django.conf import settings
+from docx import Document
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Textutdrag ur uppladdade filer (jobbannonser, chattbilagor).
+#
+# PDF läses med den första motor i settings.PDF_TEXT_ENGINES som ger text
+# (PyMuPDF som standard, PyPDF2 som reserv). Med en teckenbudget läses bara
+# sidorna framifrån/bakifrån som behövs – _trim/_trim_middle behåller ändå bara
+# början och slutet, så resultatet efter trimning blir detsamma.
+# ──────────────────────────────────────────────────────────────────────────────
+TEXT_SUFFIXES = (".txt", ".csv", ".md", ".json", ".py", ".html")
+
+
+def _clean(text: str) -> str:
+    # CRUCIAL för Postgres: inga NUL-tecken i TextField
+    return (text or "").replace("\x00", "")
+
+
+def _collect_pages(page_count: int, page_text, max_chars: int | None) -> str:
+    """
+    Sidtexter sammanfogade med radbrytning. Med max_chars läses sidor framifrån
+    tills halva budgeten är fylld och sedan bakifrån för andra halvan.
+    """
+    if not max_chars:
+        return "\n".join(_clean(page_text(i)) for i in range(page_count))
+
+    need = max_chars // 2 + 2  # marginal för radbrytningen mellan sidorna
+    head, head_len, i = [], 0, 0
+    while i < page_count and head_len < need:
+        head.append(_clean(page_text(i)))
+        head_len += len(head[-1]) + 1
+        i += 1
+
+    tail, tail_len, j = [], 0, page_count
+    while j > i and tail_len < need:
+        j -= 1
+        tail.append(_clean(page_text(j)))
+        tail_len += len(tail[-1]) + 1
+
+    return "\n".join(head + tail[::-1])
+
+
+def _pdf_pymupdf(data: bytes, max_chars: int | None) -> str:
+    import fitz  # PyMuPDF
+
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        return _collect_pages(doc.page_count, lambda i: doc.load_page(i).get_text("text"), max_chars)
+
+
+def _pdf_pypdf2(data: bytes, max_chars: int | None) -> str:
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(io.BytesIO(data))
+    return _collect_pages(len(reader.pages), lambda i: reader.pages[i].extract_text() or "", max_chars)
+
+
+PDF_ENGINES = {
+    "pymupdf": _pdf_pymupdf,
+    "pypdf2": _pdf_pypdf2,
+}
+
+
+def pdf_engines() -> list:
+    names = getattr(settings, "PDF_TEXT_ENGINES", None) or list(PDF_ENGINES)
+    return [n for n in names if n in PDF_ENGINES]
+
+
+def extract_pdf_text(data: bytes, max_chars: int | None = None, engines=None) -> tuple[str, str]:
+    """
+    Provar motorerna i tur och ordning; en motor som kraschar (eller saknas)
+    eller inte hittar någon text hoppas över. Returnerar (text, motor).
+    """
+    for name in engines or pdf_engines():
+        try:
+            text = PDF_ENGINES[name](data, max_chars)
+        except Exception:
+            continue
+        if text.strip():
+            return text, name
+    return "", ""
+
+
+def extract_bytes(data: bytes, name: str, max_chars: int | None = None) -> tuple[str, str]:
+    """
+    Textutdrag ur filinnehåll. Returnerar (text, motor) där motor är t.ex.
+    "pymupdf", "pypdf2", "docx" eller "text" – tom sträng om inget gick att läsa.
+    """
+    name = (name or "").lower()
+    try:
+        if name.endswith(".pdf"):
+            return extract_pdf_text(data, max_chars)
+        if name.endswith(".docx"):
+            doc = Document(io.BytesIO(data))
+            return _clean("\n".join(p.text for p in doc.paragraphs)), "docx"
+        if name.endswith(TEXT_SUFFIXES):
+            enc = chardet.detect(data).get("encoding") or "utf-8"
+            return _clean(data.decode(enc, errors="ignore")), "text"
+    except Exception:
+        pass
+    return "", ""
+
+
+def read_bytes(django_file) -> bytes:
+    # se till att vi läser från början
+    if hasattr(django_file, "open"):
+        django_file.open(mode="rb")
+    try:
+        django_file.seek(0)
+    except Exception:
+        pass
+    return django_file.read()
+
+
+def extract_text(django_file, max_chars: int | None = None) -> tuple[str, str]:
+    """Som extract_bytes, för en uppladdad/sparad fil."""
+    try:
+        data = read_bytes(django_file)
+    except Exception:
+        return "", ""
+    return extract_bytes(data, django_file.name, max_chars)
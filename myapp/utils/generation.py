@@ -0,0 +1,381 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from ..models import Report, ReportJob
+from . import report_state
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Sektioner som genereras av AI och vilka texter de bygger på
+# ──────────────────────────────────────────────────────────────────────────────
+SECTION_PROMPTS = {
+    "tq_fardighet_text": "tq_fardighet",
+    "tq_motivation_text": "tq_motivation",
+    "leda_text": "leda",
+    "mod_text": "mod",
+    "sjalkannedom_text": "sjalkannedom",
+    "strategi_text": "strategi",
+    "kommunikation_text": "kommunikation",
+    "sur_text": "styrkor_utveckling_risk",
+    "slutsats_text": "sammanfattande_slutsats",
+}
+
+_SUMMARY_INPUTS = [
+    "tq_fardighet_text",
+    "tq_motivation_text",
+    "leda_text",
+    "mod_text",
+    "sjalkannedom_text",
+    "strategi_text",
+    "kommunikation_text",
+]
+
+# Tom lista = kan köras direkt när steg 1 är klart.
+SECTION_DEPENDENCIES = {
+    "tq_fardighet_text": [],
+    "tq_motivation_text": [],
+    "leda_text": [],
+    "mod_text": [],
+    "sjalkannedom_text": [],
+    "strategi_text": [],
+    "kommunikation_text": [],
+    "sur_text": _SUMMARY_INPUTS,
+    "slutsats_text": _SUMMARY_INPUTS + ["sur_text"],
+}
+
+_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, "REPORT_GENERATION_WORKERS", 5),
+    thread_name_prefix="report-gen",
+)
+
+# (report_id, section_key) -> Future med färdig text (endast denna process)
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+# select_for_update räcker på Postgres men är en no-op i SQLite, så vi låser även
+# inom processen när Report.data läses och skrivs om.
+report_data_lock = threading.Lock()
+
+
+def _use_worker() -> bool:
+    return getattr(settings, "REPORT_GENERATION_BACKEND", "thread") == "worker"
+
+
+class SectionGenerationError(RuntimeError):
+    """OpenAI-anropet för en sektion misslyckades (views._run_openai gav feltexten)."""
+
+
+def _run_section(key, payload, texts) -> str:
+    # Sen import: views importerar den här modulen
+    from ..views import SECTION_ERROR_TEXT, _run_section as run
+    text = run(key, payload, texts)
+    # Feltexten får aldrig sparas som sektionstext – då låses den in (fältet är
+    # inte längre tomt) och sur/slutsats skrivs utifrån den.
+    if text == SECTION_ERROR_TEXT:
+        raise SectionGenerationError(key)
+    return text
+
+
+def store_section_text(report_id, key: str, text: str, overwrite: bool = False, user=None) -> bool:
+    """
+    Skriver in en genererad text i Report.data, men bara om fältet fortfarande är tomt
+    (så vi aldrig skriver över något användaren hunnit redigera).
+    overwrite=True används när användaren uttryckligen bett om en ny text (user = vem).
+    """
+    if not text:
+        return False
+    with report_data_lock, transaction.atomic():
+        row = Report.objects.select_for_update().filter(id=report_id).values_list("data").first()
+        if row is None:
+            return False
+        saved = row[0] or {}
+        if not overwrite and (saved.get(key) or "").strip():
+            return False
+        # Bara den här nyckeln skrivs (jsonb på Postgres) – och inget om texten redan står där
+        report_state.write(report_id, saved, *report_state.diff(saved, {**saved, key: text}), user=user)
+    return True
+
+
+def _known_texts(report_id, context: dict) -> dict:
+    saved = Report.objects.filter(id=report_id).values_list("data", flat=True).first() or {}
+    return {
+        key: (context.get(key) or "").strip() or (saved.get(key) or "").strip()
+        for key in SECTION_PROMPTS
+    }
+
+
+def schedule_report_generation(report_id, context: dict, payload: dict) -> None:
+    """
+    Startar generering av alla sektioner som saknar text för en rapport.
+
+    - Oberoende sektioner (TQ + de fem kompetenserna) körs parallellt direkt.
+    - sur_text/slutsats_text startas så fort alla texter de bygger på finns.
+    - Varje text sparas i Report.data så fort den är klar.
+
+    `payload` är stil + promptvariabler från steg 1 (se views._section_payload).
+    Med REPORT_GENERATION_BACKEND = "worker" läggs jobben i databasen i stället
+    och körs av `manage.py run_report_worker`.
+    """
+    report_id = str(report_id)
+    texts = _known_texts(report_id, context)
+
+    if _use_worker():
+        enqueue_report_jobs(report_id, texts, payload)
+    else:
+        _schedule_threads(report_id, texts, payload)
+
+
+def _schedule_threads(report_id, texts, payload):
+    results = {}
+    with _inflight_lock:
+        for key in SECTION_PROMPTS:
+            if texts[key] or (report_id, key) in _inflight:
+                continue
+            results[key] = Future()
+            _inflight[(report_id, key)] = results[key]
+
+    if not results:
+        return
+
+    remaining = set(results)
+    submitted = set()
+    failed = set()
+    # RLock: add_done_callback kan köras direkt i samma tråd om jobbet redan är klart
+    state_lock = threading.RLock()
+
+    def _task(key, known):
+        try:
+            text = _run_section(key, payload, known) or ""
+            store_section_text(report_id, key, text)
+            return text
+        finally:
+            # Trådarna i poolen återanvänds – släpp DB-anslutningen efter varje jobb
+            connection.close()
+
+    def _submit_ready():
+        # anropas med state_lock låst
+        for key in results:
+            if key in submitted:
+                continue
+            if failed.intersection(SECTION_DEPENDENCIES[key]):
+                # Bygger på en sektion som misslyckades – skriv den inte på halvt underlag
+                submitted.add(key)
+                _finish(key, "", ok=False)
+                continue
+            if remaining.intersection(SECTION_DEPENDENCIES[key]):
+                continue
+            submitted.add(key)
+            fut = _executor.submit(_task, key, dict(texts))
+            fut.add_done_callback(lambda f, key=key: _on_done(key, f))
+
+    def _finish(key, text, ok=True):
+        # anropas med state_lock låst
+        with _inflight_lock:
+            _inflight.pop((report_id, key), None)
+        results[key].set_result(text)
+        texts[key] = text
+        remaining.discard(key)
+        if not ok:
+            failed.add(key)
+
+    def _on_done(key, fut):
+        try:
+            text, ok = fut.result(), True
+        except Exception as e:
+            print(f"⚠️ Generering av {key} misslyckades:", repr(e))
+            text, ok = "", False
+
+        with state_lock:
+            _finish(key, text, ok)
+            _submit_ready()
+
+    with state_lock:
+        _submit_ready()
+
+
+def section_pending(report_id, key: str) -> bool:
+    """Är sektionen fortfarande under generering (tråd eller worker-jobb)?"""
+    if not report_id:
+        return False
+    if _use_worker():
+        return ReportJob.objects.filter(
+            report_id=report_id,
+            section_key=key,
+            status__in=ReportJob.PENDING_STATUSES,
+        ).exists()
+    with _inflight_lock:
+        return (str(report_id), key) in _inflight
+
+
+def wait_for_section(report_id, key: str, timeout=None) -> str:
+    """
+    Hämtar en förgenererad text. I trådläget väntar vi högst `timeout` sekunder
+    på en pågående generering; med workern returneras direkt det som finns i
+    Report.data (ev. "") – sidan pollar report_jobs tills jobbet är klart.
+    """
+    if not report_id:
+        return ""
+
+    if not _use_worker():
+        if timeout is None:
+            timeout = getattr(settings, "REPORT_GENERATION_WAIT", 25)
+        with _inflight_lock:
+            fut = _inflight.get((str(report_id), key))
+        if fut is not None:
+            try:
+                text = fut.result(timeout=max(0, timeout))
+            except FutureTimeout:
+                text = ""
+            if text:
+                return text
+
+    data = Report.objects.filter(id=report_id).values_list("data", flat=True).first() or {}
+    return (data.get(key) or "").strip()
+
+
+def section_statuses(report_id) -> dict:
+    """
+    {section_key: "done" | "pending" | "failed" | "missing"} – används av wizardens polling.
+    """
+    data = Report.objects.filter(id=report_id).values_list("data", flat=True).first() or {}
+
+    job_status = {}
+    if _use_worker():
+        for key, status in (
+            ReportJob.objects.filter(report_id=report_id)
+            .order_by("created_at")
+            .values_list("section_key", "status")
+        ):
+            job_status[key] = status  # senaste jobbet vinner
+
+    out = {}
+    for key in SECTION_PROMPTS:
+        if (data.get(key) or "").strip():
+            out[key] = "done"
+        elif job_status.get(key) in ReportJob.PENDING_STATUSES or (
+            not _use_worker() and section_pending(report_id, key)
+        ):
+            out[key] = "pending"
+        elif job_status.get(key) == "failed":
+            out[key] = "failed"
+        else:
+            out[key] = "missing"
+    return out
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Jobbkö i databasen (REPORT_GENERATION_BACKEND = "worker")
+# ──────────────────────────────────────────────────────────────────────────────
+def enqueue_report_jobs(report_id, texts: dict, payload: dict) -> list:
+    """Skapar ReportJob för varje sektion som saknar text och inte redan är köad."""
+    with transaction.atomic():
+        pending = set(
+            ReportJob.objects.filter(
+                report_id=report_id,
+                status__in=ReportJob.PENDING_STATUSES,
+            ).values_list("section_key", flat=True)
+        )
+        new_keys = [k for k in SECTION_PROMPTS if not texts.get(k) and k not in pending]
+        unfinished = pending.union(new_keys)
+
+        jobs = [
+            ReportJob(
+                report_id=report_id,
+                section_key=key,
+                status="waiting" if unfinished.intersection(SECTION_DEPENDENCIES[key]) else "queued",
+                payload=payload,
+            )
+            for key in new_keys
+        ]
+        return ReportJob.objects.bulk_create(jobs)
+
+
+def claim_next_job(worker_name: str):
+    """Plockar äldsta köade jobbet och markerar det som "running"."""
+    with transaction.atomic():
+        qs = ReportJob.objects.filter(status="queued").order_by("created_at")
+        if connection.features.has_select_for_update_skip_locked:
+            # Postgres: flera workers kan plocka samtidigt utan att krocka
+            qs = qs.select_for_update(skip_locked=True)
+        job = qs.first()
+        if job is None:
+            return None
+
+        job.status = "running"
+        job.worker = worker_name
+        job.attempts += 1
+        job.started_at = timezone.now()
+        job.save(update_fields=["status", "worker", "attempts", "started_at"])
+    return job
+
+
+def run_job(job: ReportJob) -> None:
+    """Kör ett jobb, sparar texten i Report.data och släpper ev. beroende jobb."""
+    data = Report.objects.filter(id=job.report_id).values_list("data", flat=True).first()
+    if data is None:
+        ReportJob.objects.filter(id=job.id).update(
+            status="failed", error="Rapporten finns inte längre.", finished_at=timezone.now()
+        )
+        return
+
+    try:
+        text = _run_section(job.section_key, job.payload, data) or ""
+        store_section_text(job.report_id, job.section_key, text)
+    except Exception as e:
+        max_attempts = getattr(settings, "REPORT_JOB_MAX_ATTEMPTS", 3)
+        gave_up = job.attempts >= max_attempts
+        ReportJob.objects.filter(id=job.id).update(
+            status="failed" if gave_up else "queued",
+            error=repr(e)[:2000],
+            finished_at=timezone.now(),
+        )
+        if gave_up:
+            _fail_dependents(job)
+    else:
+        ReportJob.objects.filter(id=job.id).update(
+            status="done", error="", finished_at=timezone.now()
+        )
+
+    release_waiting_jobs(job.report_id)
+
+
+def _fail_dependents(job: ReportJob) -> int:
+    """Jobb som väntar på en sektion som gett upp skulle skrivas på halvt underlag."""
+    waiting = ReportJob.objects.filter(report_id=job.report_id, status="waiting")
+    keys = [j.section_key for j in waiting if job.section_key in SECTION_DEPENDENCIES.get(j.section_key, [])]
+    if not keys:
+        return 0
+    return waiting.filter(section_key__in=keys).update(
+        status="failed",
+        error=f"{job.section_key} kunde inte skrivas.",
+        finished_at=timezone.now(),
+    )
+
+
+def release_waiting_jobs(report_id) -> int:
+    """Flyttar "waiting"-jobb till kön när inget av det de bygger på är kvar."""
+    unfinished = set(
+        ReportJob.objects.filter(
+            report_id=report_id,
+            status__in=ReportJob.PENDING_STATUSES,
+        ).values_list("section_key", flat=True)
+    )
+    released = 0
+    for job in ReportJob.objects.filter(report_id=report_id, status="waiting"):
+        if unfinished.intersection(SECTION_DEPENDENCIES.get(job.section_key, [])):
+            continue
+        # villkorad update så att två workers inte släpper samma jobb
+        released += ReportJob.objects.filter(id=job.id, status="waiting").update(status="queued")
+    return released
+
+
+def requeue_stale_jobs(max_age_seconds: int = 300) -> int:
+    """Jobb som fastnat i "running" (t.ex. worker som dödats) läggs tillbaka i kön."""
+    cutoff = timezone.now() - timedelta(seconds=max_age_seconds)
+    return ReportJob.objects.filter(status="running", started_at__lt=cutoff).update(
+        status="queued", worker=""
+    )
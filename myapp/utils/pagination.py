@@ -0,0 +1,54 @@
+import base64
+import uuid
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Keyset-paginering på (updated_at, id), nyast först.
+#
+# Markören är den sista radens (updated_at, id) kodad i en url-säker sträng.
+# Nästa sida hämtas med WHERE (updated_at, id) < markören – ingen OFFSET, så
+# sida 50 kostar lika lite som sida 1 och rader som ändras under bläddringen
+# varken dubbleras eller hoppas över i onödan.
+# ──────────────────────────────────────────────────────────────────────────────
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(obj) -> str:
+    raw = f"{obj.updated_at.isoformat()}|{obj.pk}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """Markör -> (updated_at, id). InvalidCursor om den inte går att läsa."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        ts_raw, pk_raw = raw.split("|", 1)
+        ts = parse_datetime(ts_raw)
+        pk = uuid.UUID(pk_raw)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursor(str(e)) from e
+    if ts is None:
+        raise InvalidCursor(ts_raw)
+    return ts, pk
+
+
+def keyset_page(queryset, cursor: str | None, size: int):
+    """
+    En sida ur queryset, nyast först. Returnerar (rader, nästa markör eller None).
+    Hämtar size + 1 rader för att veta om det finns fler.
+    """
+    queryset = queryset.order_by("-updated_at", "-id")
+    if cursor:
+        ts, pk = decode_cursor(cursor)
+        queryset = queryset.filter(Q(updated_at__lt=ts) | Q(updated_at=ts, id__lt=pk))
+
+    rows = list(queryset[:size + 1])
+    if len(rows) <= size:
+        return rows, None
+    rows = rows[:size]
+    return rows, encode_cursor(rows[-1])
@@ -0,0 +1,103 @@
+import secrets
+import threading
+import time
+from types import MappingProxyType
+
+from django.conf import settings
+
+from ..models import ActivePromptConfig, Prompt, PromptSet
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Aktivt promptset + dess prompts, laddat en gång per process.
+#
+# Signalerna i myapp/signals.py ger ActivePromptConfig.prompts_version ett nytt
+# slumpvärde när något Prompt/PromptSet/ActivePromptConfig ändras. Varje process
+# (webb-workers, run_report_worker) jämför sin laddade version mot databasen
+# högst var PROMPT_REGISTRY_CHECK_SECONDS och laddar om när den ändrats.
+# ──────────────────────────────────────────────────────────────────────────────
+
+# Seten som alltid ska finnas (förvalt aktivt set först)
+DEFAULT_SET_NAMES = ("Veronika", "Frida")
+
+_lock = threading.Lock()
+_state = None  # {"version": int, "prompt_set": PromptSet, "prompts": {namn: text}}
+_checked = (0.0, None)  # (time.monotonic() vid senaste kollen, versionen då)
+
+
+def _current_version(fresh: bool = False) -> int:
+    global _checked
+    now = time.monotonic()
+    checked_at, version = _checked
+    interval = getattr(settings, "PROMPT_REGISTRY_CHECK_SECONDS", 2.0)
+    if fresh or version is None or now - checked_at >= interval:
+        version = (
+            ActivePromptConfig.objects.filter(id=1)
+            .values_list("prompts_version", flat=True)
+            .first()
+        ) or 0
+        _checked = (now, version)
+    return version
+
+
+def invalidate() -> None:
+    """Tvingar omladdning i alla processer (anropas från signalerna)."""
+    global _checked
+    # Slumpvärde, inte +1: en save() med ett gammalt inläst objekt kan ha skrivit
+    # tillbaka en äldre version. update() skickar ingen post_save (ingen loop).
+    ActivePromptConfig.objects.filter(id=1).update(prompts_version=secrets.randbits(62))
+    _checked = (0.0, None)  # den egna processen ser ändringen direkt
+
+
+def _load_active_set() -> PromptSet:
+    default_sets = [PromptSet.objects.get_or_create(name=n)[0] for n in DEFAULT_SET_NAMES]
+
+    cfg, _ = ActivePromptConfig.objects.select_related("active_set").get_or_create(id=1)
+    if cfg.active_set is None:
+        cfg.active_set = default_sets[0]
+        cfg.save(update_fields=["active_set", "updated_at"])
+    return cfg.active_set
+
+
+def _load() -> dict:
+    # Sen import: views importerar den här modulen
+    from ..views import ensure_default_prompts_exist
+
+    prompt_set = _load_active_set()
+    ensure_default_prompts_exist(prompt_set)
+
+    # Versionen läses före prompterna: ändras något under tiden laddar vi om nästa gång
+    version = _current_version(fresh=True)
+    prompts = dict(
+        Prompt.objects.filter(prompt_set=prompt_set).values_list("name", "text")
+    )
+    return {
+        "version": version,
+        "prompt_set": prompt_set,
+        "prompts": MappingProxyType(prompts),
+    }
+
+
+def _get_state() -> dict:
+    global _state
+    state = _state
+    if state is not None and state["version"] == _current_version():
+        return state
+
+    with _lock:
+        if _state is None or _state["version"] != _current_version():
+            _state = _load()
+        return _state
+
+
+def get_active_prompt_set() -> PromptSet:
+    """Det globalt aktiva promptsetet (skapar Veronika/Frida + standardprompts vid behov)."""
+    return _get_state()["prompt_set"]
+
+
+def get_prompts():
+    """Alla prompts i det aktiva setet som {namn: text} (skrivskyddad)."""
+    return _get_state()["prompts"]
+
+
+def get_prompt_text(name: str, fallback: str = "") -> str:
+    return get_prompts().get(name, fallback) or fallback
@@ -0,0 +1,131 @@
+import hashlib
+import json
+from functools import lru_cache
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from PIL import Image, ImageDraw, ImageFont
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Betygsskalorna (etikett + beskrivning + fem prickar) ritade som PNG på servern,
+# så att Word-exporten inte behöver html2canvas-bilder från webbläsaren.
+# Utseendet följer .dn-table/.dn-dot i _ratings_table_html (i dubbel skala).
+# ──────────────────────────────────────────────────────────────────────────────
+RENDER_VERSION = 1  # höj när utseendet ändras, så gamla cachade bilder inte används
+
+WIDTH = 1100
+LABEL_WIDTH = 640
+PAD_X, PAD_Y = 20, 22
+DOT_SIZE = 50
+
+TEXT_COLOR = (17, 24, 39)         # #111827
+DESC_COLOR = (75, 85, 99)         # #4b5563
+LINE_COLOR = (229, 231, 235)      # #e5e7eb
+DOT_FILL = (228, 228, 228)        # #E4E4E4
+DOT_BORDER = (190, 190, 190)      # #BEBEBE
+ACTIVE = (123, 44, 191)           # #7b2cbf
+ACTIVE_HALO = (229, 213, 242)     # rgba(123,44,191,0.18) på vitt
+
+_FONT_CANDIDATES = {
+    False: ["DejaVuSans.ttf", "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", "Arial.ttf"],
+    True: ["DejaVuSans-Bold.ttf", "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", "Arial Bold.ttf"],
+}
+
+
+@lru_cache(maxsize=8)
+def _font(size: int, bold: bool = False):
+    custom = getattr(settings, "RATING_CHART_FONT_BOLD" if bold else "RATING_CHART_FONT", "")
+    for path in ([custom] if custom else []) + _FONT_CANDIDATES[bold]:
+        try:
+            return ImageFont.truetype(path, size)
+        except OSError:
+            continue
+    return ImageFont.load_default(size)
+
+
+def _score(raw) -> int:
+    try:
+        v = int(raw)
+    except Exception:
+        v = 3
+    return max(1, min(5, v))
+
+
+def _wrap(draw, text: str, font, max_width: int) -> list:
+    lines, line = [], ""
+    for word in (text or "").split():
+        candidate = f"{line} {word}".strip()
+        if line and draw.textlength(candidate, font=font) > max_width:
+            lines.append(line)
+            line = word
+        else:
+            line = candidate
+    if line:
+        lines.append(line)
+    return lines
+
+
+def chart_key(section_key: str, section_ratings: dict, labels: list, descriptions: dict) -> str:
+    raw = json.dumps(
+        [RENDER_VERSION, section_key, labels, {l: _score(section_ratings.get(l, 3)) for l in labels}, descriptions],
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return "rating_chart:" + hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _render(labels: list, section_ratings: dict, descriptions: dict) -> bytes:
+    title_font, desc_font = _font(28, bold=True), _font(22)
+    measure = ImageDraw.Draw(Image.new("RGB", (1, 1)))
+    text_width = LABEL_WIDTH - 2 * PAD_X
+
+    rows = []
+    for label in labels:
+        desc_lines = _wrap(measure, descriptions.get(label, ""), desc_font, text_width)
+        height = 2 * PAD_Y + 36 + 33 * len(desc_lines)
+        rows.append((label, desc_lines, max(height, DOT_SIZE + 2 * PAD_Y)))
+
+    img = Image.new("RGB", (WIDTH, sum(h for *_, h in rows) or 1), "white")
+    draw = ImageDraw.Draw(img)
+    cell_width = (WIDTH - LABEL_WIDTH) / 5
+
+    y = 0
+    for idx, (label, desc_lines, height) in enumerate(rows):
+        if idx:
+            draw.line([(0, y), (WIDTH, y)], fill=LINE_COLOR, width=2)
+
+        draw.text((PAD_X, y + PAD_Y), label, font=title_font, fill=TEXT_COLOR)
+        for n, line in enumerate(desc_lines):
+            draw.text((PAD_X, y + PAD_Y + 40 + 33 * n), line, font=desc_font, fill=DESC_COLOR)
+
+        value = _score(section_ratings.get(label, 3))
+        cy = y + height / 2
+        for i in range(1, 6):
+            cx = LABEL_WIDTH + cell_width * (i - 0.5)
+            r = DOT_SIZE / 2
+            if i == value:
+                draw.ellipse([cx - r - 6, cy - r - 6, cx + r + 6, cy + r + 6], fill=ACTIVE_HALO)
+                draw.ellipse([cx - r, cy - r, cx + r, cy + r], fill=ACTIVE, outline=ACTIVE, width=2)
+            else:
+                draw.ellipse([cx - r, cy - r, cx + r, cy + r], fill=DOT_FILL, outline=DOT_BORDER, width=2)
+        y += height
+
+    out = BytesIO()
+    img.save(out, format="PNG", optimize=True)
+    return out.getvalue()
+
+
+def render_section_png(section_key: str, section_ratings: dict, labels: list, descriptions: dict) -> bytes:
+    """
+    PNG för en sektions betyg. Cachas på en hash av betygen (+ etiketter/beskrivningar),
+    så samma kandidat/betyg ritas bara en gång.
+    """
+    if not labels:
+        return b""
+    key = chart_key(section_key, section_ratings, labels, descriptions)
+    png = cache.get(key)
+    if png is None:
+        png = _render(labels, section_ratings, descriptions)
+        cache.set(key, png, getattr(settings, "RATING_CHART_CACHE_TTL", 24 * 3600))
+    return png
@@ -0,0 +1,160 @@
+import json
+import zlib
+
+from django.conf import settings
+
+from ..models import ReportRevision
+from . import report_state
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Versionshistorik för Report.data.
+#
+# Varje skrivning via report_state.write() blir en ny version. En version lagras
+# som skillnaden mot den föregående ({"set": ändrade nycklar, "del": borttagna}),
+# zlib-komprimerad – oförändrade underlag (intervju, testresultat ...) sparas
+# alltså inte om. Var REPORT_REVISION_SNAPSHOT_EVERY:e version är en hel
+# ögonblicksbild, så att återskapa en version kräver högst så många deltan.
+# ──────────────────────────────────────────────────────────────────────────────
+
+
+class RevisionNotFound(LookupError):
+    pass
+
+
+def _snapshot_every() -> int:
+    return max(1, getattr(settings, "REPORT_REVISION_SNAPSHOT_EVERY", 20))
+
+
+def _pack(obj) -> bytes:
+    raw = json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+    return zlib.compress(raw.encode("utf-8"), 9)
+
+
+def _unpack(payload) -> dict:
+    return json.loads(zlib.decompress(bytes(payload)).decode("utf-8"))
+
+
+def _apply(data: dict, rev: ReportRevision) -> dict:
+    payload = _unpack(rev.payload)
+    if rev.is_snapshot:
+        return payload
+    for key in payload["del"]:
+        data.pop(key, None)
+    data.update(payload["set"])
+    return data
+
+
+def record(report_id, saved: dict, changed: dict, removed=(), user=None) -> int:
+    """
+    Sparar ändringen saved -> saved + changed - removed som en ny version.
+    Anropas inom samma låsta transaktion som skrivningen (report_state.write).
+    Returnerar versionsnumret.
+    """
+    number = (
+        ReportRevision.objects.filter(report_id=report_id)
+        .order_by("-number")
+        .values_list("number", flat=True)
+        .first()
+    ) or 0
+    if number == 0 and saved:
+        # Rapporter från före historiken: spara det som fanns som version 1,
+        # annars går den första texten som skrivs över förlorad.
+        number = 1
+        ReportRevision.objects.create(report_id=report_id, number=1, is_snapshot=True, payload=_pack(saved))
+
+    number += 1
+    if number == 1 or (number - 1) % _snapshot_every() == 0:
+        data = {k: v for k, v in saved.items() if k not in removed}
+        data.update(changed)
+        is_snapshot, payload = True, _pack(data)
+    else:
+        is_snapshot, payload = False, _pack({"set": changed, "del": list(removed)})
+
+    ReportRevision.objects.create(
+        report_id=report_id,
+        number=number,
+        is_snapshot=is_snapshot,
+        payload=payload,
+        created_by_id=getattr(user, "id", None),
+    )
+    return number
+
+
+def record_created(reports, user=None) -> None:
+    """
+    Version 1 för rapporter som skapats med bulk_create (ingen write() har körts
+    och ingen signal skickats), så att historiken börjar med det som importerades.
+    """
+    ReportRevision.objects.bulk_create(
+        ReportRevision(
+            report_id=rep.id,
+            number=1,
+            is_snapshot=True,
+            payload=_pack(rep.data or {}),
+            created_by_id=getattr(user, "id", None),
+        )
+        for rep in reports
+    )
+
+
+def data_at(report_id, number: int) -> dict:
+    """Report.data som den såg ut i version number. RevisionNotFound om den saknas."""
+    start = (
+        ReportRevision.objects.filter(report_id=report_id, number__lte=number, is_snapshot=True)
+        .order_by("-number")
+        .values_list("number", flat=True)
+        .first()
+    )
+    revs = list(
+        ReportRevision.objects.filter(report_id=report_id, number__gte=start or 1, number__lte=number)
+        .order_by("number")
+        .only("number", "is_snapshot", "payload")
+    )
+    if start is None or not revs or revs[-1].number != number:
+        raise RevisionNotFound(f"{report_id} v{number}")
+
+    data = {}
+    for rev in revs:
+        data = _apply(data, rev)
+    return data
+
+
+def history(report_id) -> list[dict]:
+    """Alla versioner, äldst först, med vilka nycklar som ändrades i varje."""
+    revs = (
+        ReportRevision.objects.filter(report_id=report_id)
+        .select_related("created_by")
+        .order_by("number")
+    )
+    out, data = [], {}
+    for rev in revs.iterator():
+        before = data
+        data = _apply(dict(data), rev)
+        changed, removed = report_state.diff(before, data)
+        user = rev.created_by
+        out.append({
+            "number": rev.number,
+            "created_at": rev.created_at,
+            "created_by": (user.get_full_name() or user.username) if user else None,
+            "changed": sorted(changed),
+            "removed": sorted(removed),
+        })
+    return out
+
+
+def compare(report_id, a: int, b: int) -> dict:
+    """
+    Skillnaden mellan version a och b:
+    {"added": {nyckel: värde}, "removed": {nyckel: värde}, "changed": {nyckel: {"before", "after"}}}
+    """
+    before, after = data_at(report_id, a), data_at(report_id, b)
+    changed, removed = report_state.diff(before, after)
+    return {
+        "from": a,
+        "to": b,
+        "added": {k: v for k, v in changed.items() if k not in before},
+        "removed": {k: before[k] for k in removed},
+        "changed": {
+            k: {"before": before[k], "after": v} for k, v in changed.items() if k in before
+        },
+    }
@@ -0,0 +1,54 @@
+import json
+
+from django.db import connection, transaction
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from ..models import Report
+from . import report_revisions
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Skrivningar av Report.data som bara rör det som ändrats.
+#
+# Wizarden postar hela rapporttillståndet vid varje klick (även "Föregående").
+# diff() jämför mot det som redan är sparat och write() skriver ingenting om
+# inget ändrats. Annars skrivs bara de ändrade nycklarna – på Postgres med
+# jsonb-operatorer (data || ändringar - borttagna), i SQLite hela objektet.
+# Anropas inom samma select_for_update-transaktion som läste det sparade.
+# Varje ändring av data sparas också som en version (report_revisions.py).
+# ──────────────────────────────────────────────────────────────────────────────
+
+
+def diff(saved: dict, new: dict) -> tuple[dict, list]:
+    """(ändrade/nya nycklar -> nytt värde, borttagna nycklar)"""
+    changed = {k: v for k, v in new.items() if k not in saved or saved[k] != v}
+    removed = [k for k in saved if k not in new]
+    return changed, removed
+
+
+def write(report_id, saved: dict, changed: dict, removed=(), user=None, **fields) -> bool:
+    """
+    Skriver ändringarna i data + övriga fält (t.ex. title, current_step) som
+    skiljer sig från det sparade. False om det inte fanns något att skriva.
+    user = den som gjorde ändringen (None för bakgrundsgenerering).
+    """
+    removed = list(removed)
+    updates = dict(fields)
+    if changed or removed:
+        if connection.vendor == "postgresql":
+            updates["data"] = RawSQL("(data || %s::jsonb) - %s::text[]", (json.dumps(changed), removed))
+        else:
+            data = {k: v for k, v in saved.items() if k not in removed}
+            data.update(changed)
+            updates["data"] = data
+        report_revisions.record(report_id, saved, changed, removed, user=user)
+    if not updates:
+        return False
+
+    updates["updated_at"] = timezone.now()
+    Report.objects.filter(id=report_id).update(**updates)
+
+    # update() skickar ingen post_save – håll sökindexet uppdaterat själva
+    from . import search_index  # sen import: search_index -> generation -> report_state
+    transaction.on_commit(lambda: search_index.index_report(report_id))
+    return True
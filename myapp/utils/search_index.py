@@ -0,0 +1,251 @@
+import re
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.html import escape, strip_tags
+
+from ..models import ChatMessage, Report, SearchDocument
+from .generation import SECTION_PROMPTS
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Fulltextsökning över rapporter (titel, kandidat, sektionstexter) och
+# chattmeddelanden.
+#
+# Varje rapport/meddelande har en SearchDocument-rad som skrivs om när objektet
+# sparas (signals.py, och ReplyWriter när ett streamat svar är klart). Indexet
+# ligger i databasen – Postgres: tsvector + GIN med svensk stemming, SQLite:
+# FTS5 (unicode61, å/ä/ö behålls) med prefixsökning i stället för stemming.
+# Se migrationen 0017_search_index.
+# ──────────────────────────────────────────────────────────────────────────────
+MAX_BODY_CHARS = 200_000  # Postgres tsvector tål högst 1 MB
+REPORT_TEXT_KEYS = ["candidate_name", "candidate_role", *SECTION_PROMPTS]
+
+# Markörer runt träffarna i utdragen; ersätts med <mark> efter HTML-escaping
+_HL_START, _HL_STOP = "⟦", "⟧"
+SHARED_SCOPE = "alla"  # rapporter syns för alla inloggade
+
+
+def _scope(user_id) -> str:
+    return f"u{user_id}" if user_id else SHARED_SCOPE
+
+
+def _enabled() -> bool:
+    return getattr(settings, "SEARCH_INDEX_ENABLED", True)
+
+
+def _store(kind: str, object_id, **fields) -> None:
+    try:
+        SearchDocument.objects.update_or_create(kind=kind, object_id=str(object_id), defaults=fields)
+    except DatabaseError as e:
+        # Sökindexet får aldrig stoppa själva sparandet
+        print("⚠️ search index update failed:", repr(e))
+
+
+def _drop(kind: str, object_id) -> None:
+    try:
+        SearchDocument.objects.filter(kind=kind, object_id=str(object_id)).delete()
+    except DatabaseError as e:
+        print("⚠️ search index delete failed:", repr(e))
+
+
+def _report_document(rep: Report) -> dict:
+    data = rep.data or {}
+    texts = [strip_tags(str(data.get(key) or "")).strip() for key in REPORT_TEXT_KEYS]
+    return {
+        "title": (rep.title or data.get("candidate_name") or "Rapport")[:255],
+        "body": "\n\n".join(t for t in texts if t)[:MAX_BODY_CHARS],
+        "user_id": None,
+        "scope": SHARED_SCOPE,
+        "url": reverse("report_open", args=[rep.id]),
+        "updated_at": rep.updated_at or timezone.now(),
+    }
+
+
+def _message_document(msg: ChatMessage, session_title: str, user_id) -> dict:
+    return {
+        "title": (session_title or "")[:255],
+        "body": msg.content[:MAX_BODY_CHARS],
+        "user_id": user_id,
+        "scope": _scope(user_id),
+        "url": reverse("chat_session", args=[msg.session_id]) + f"#m{msg.id}",
+        "updated_at": msg.created_at or timezone.now(),
+    }
+
+
+def _indexable_message(msg: ChatMessage) -> bool:
+    return msg.role in ("user", "assistant") and msg.is_complete and bool(msg.content.strip())
+
+
+def index_report(report_id) -> None:
+    if not _enabled():
+        return
+    rep = Report.objects.filter(id=report_id).first()
+    if rep is None or rep.deleted_at is not None:
+        _drop("report", report_id)
+        return
+    _store("report", rep.id, **_report_document(rep))
+
+
+def index_message(message_id) -> None:
+    if not _enabled():
+        return
+    msg = (
+        ChatMessage.objects
+        .filter(id=message_id)
+        .select_related("session")
+        .only("id", "role", "content", "is_complete", "created_at", "session__title", "session__user_id")
+        .first()
+    )
+    if msg is None or not _indexable_message(msg):
+        _drop("message", message_id)
+        return
+    _store("message", msg.id, **_message_document(msg, msg.session.title, msg.session.user_id))
+
+
+def remove(kind: str, object_id) -> None:
+    if _enabled():
+        _drop(kind, object_id)
+
+
+def rebuild(batch_size: int = 1000) -> dict:
+    """Bygger om hela indexet (befintlig data, eller efter att det varit avstängt)."""
+    SearchDocument.objects.all().delete()
+    counts = {"report": 0, "message": 0}
+
+    def flush(batch):
+        SearchDocument.objects.bulk_create(batch)
+        batch.clear()
+
+    batch = []
+    for rep in Report.objects.filter(deleted_at__isnull=True).iterator(chunk_size=batch_size):
+        doc = _report_document(rep)
+        batch.append(SearchDocument(kind="report", object_id=str(rep.id), **doc))
+        counts["report"] += 1
+        if len(batch) >= batch_size:
+            flush(batch)
+
+    messages = (
+        ChatMessage.objects
+        .filter(role__in=("user", "assistant"), is_complete=True)
+        .select_related("session")
+        .only("id", "role", "content", "is_complete", "created_at", "session__title", "session__user_id")
+    )
+    for msg in messages.iterator(chunk_size=batch_size):
+        if not _indexable_message(msg):
+            continue
+        doc = _message_document(msg, msg.session.title, msg.session.user_id)
+        batch.append(SearchDocument(kind="message", object_id=str(msg.id), **doc))
+        counts["message"] += 1
+        if len(batch) >= batch_size:
+            flush(batch)
+
+    flush(batch)
+    return counts
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Sökning
+# ──────────────────────────────────────────────────────────────────────────────
+# numnode(q) > 0: en fråga med bara stoppord ("och") blir tom och ska inte ge allt
+_POSTGRES_SEARCH = f"""
+    SELECT hit.id, hit.kind, hit.object_id, hit.title, hit.url, hit.updated_at, hit.rank,
+           ts_headline('swedish', d.body, hit.query,
+                       'StartSel={_HL_START}, StopSel={_HL_STOP}, MaxWords=30, MinWords=12, MaxFragments=2')
+    FROM (
+        SELECT d.id, d.kind, d.object_id, d.title, d.url, d.updated_at,
+               ts_rank_cd(d.search_vector, q) AS rank, q AS query
+        FROM myapp_searchdocument d, websearch_to_tsquery('swedish', %s) q, to_tsquery('simple', %s) owner_q
+        WHERE numnode(q) > 0 AND d.search_vector @@ (q && owner_q) {{kind_filter}}
+        ORDER BY rank DESC, d.updated_at DESC
+        LIMIT %s OFFSET %s
+    ) hit
+    JOIN myapp_searchdocument d ON d.id = hit.id
+    ORDER BY hit.rank DESC, hit.updated_at DESC
+"""
+
+# bm25: lägre är bättre; titeln väger tio gånger mer än brödtexten, scope inte alls
+_SQLITE_SEARCH = f"""
+    SELECT d.id, d.kind, d.object_id, d.title, d.url, d.updated_at,
+           -bm25(myapp_searchdocument_fts, 10.0, 1.0, 0.0) AS score,
+           snippet(myapp_searchdocument_fts, 1, '{_HL_START}', '{_HL_STOP}', '…', 16)
+    FROM myapp_searchdocument_fts
+    JOIN myapp_searchdocument d ON d.id = myapp_searchdocument_fts.rowid
+    WHERE myapp_searchdocument_fts MATCH %s {{kind_filter}}
+    ORDER BY score DESC, d.updated_at DESC
+    LIMIT %s OFFSET %s
+"""
+
+
+def _fts5_query(q: str, user_id) -> str:
+    # Varje ord som prefix ("ledarskap*" hittar även "ledarskapet"), alla ord måste finnas
+    words = re.findall(r"\w+", q)
+    if not words:
+        return ""
+    terms = " ".join(f'"{w}"*' for w in words)
+    return f"scope:({_scope(user_id)} OR {SHARED_SCOPE}) AND {{title body}}:({terms})"
+
+
+def _datetime(value):
+    # SQLite ger naiva tidsstämplar (UTC) – ibland som text – i råa frågor
+    if isinstance(value, str):
+        value = parse_datetime(value)
+    if value is not None and timezone.is_naive(value):
+        value = timezone.make_aware(value, dt_timezone.utc)
+    return value
+
+
+def _highlight(snippet: str) -> str:
+    snippet = " ".join((snippet or "").split())
+    return escape(snippet).replace(_HL_START, "<mark>").replace(_HL_STOP, "</mark>")
+
+
+def search(q: str, user_id, kind: str | None = None, page: int = 1, size: int | None = None) -> dict:
+    """
+    Rankade träffar för q bland rapporter och user_ids egna chattmeddelanden.
+    {"results": [{kind, title, url, snippet (html), updated_at, rank}], "page", "has_next"}
+    """
+    size = size or getattr(settings, "SEARCH_PAGE_SIZE", 20)
+    page = max(1, page)
+    empty = {"results": [], "page": page, "has_next": False}
+
+    # Ägarfiltret ligger i själva indexfrågan – bara användarens egna meddelanden
+    # och rapporterna rankas, oavsett hur många träffar andra användare har
+    vendor = connection.vendor
+    if vendor == "postgresql":
+        term = (q or "").strip()
+        sql, params = _POSTGRES_SEARCH, [term, f"{_scope(user_id)}:D | {SHARED_SCOPE}:D"]
+    elif vendor == "sqlite":
+        term = _fts5_query(q or "", user_id)
+        sql, params = _SQLITE_SEARCH, [term]
+    else:
+        return empty
+    if not term:
+        return empty
+
+    kind_filter = ""
+    if kind in ("report", "message"):
+        kind_filter = "AND d.kind = %s"
+        params.append(kind)
+    params += [size + 1, (page - 1) * size]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql.format(kind_filter=kind_filter), params)
+        rows = cursor.fetchall()
+
+    results = [
+        {
+            "kind": row[1],
+            "object_id": row[2],
+            "title": row[3],
+            "url": row[4],
+            "updated_at": _datetime(row[5]),
+            "rank": float(row[6] or 0),
+            "snippet": _highlight(row[7]),
+        }
+        for row in rows[:size]
+    ]
+    return {"results": results, "page": page, "has_next": len(rows) > size}
@@ -2,12 +2,15 @@ import os
 import io
 import re
 import json
+import hashlib
+import tempfile
+import time
+import uuid
 import textwrap
 import openpyxl
 import markdown2
 from markdown2 import markdown
 import math
-from docx import Document
 from docx.oxml import OxmlElement
 from docx.oxml.ns import qn
 from django.shortcuts import render
@@ -17,8 +20,9 @@ from django.utils.safestring import mark_safe
 from dotenv import load_dotenv
 from openai import OpenAI
 from django.conf import settings
+from django.core.cache import cache
 from .models import Prompt, ChatSession, ChatMessage, ChatAttachment, PromptSet, ActivePromptConfig
-from django.http import StreamingHttpResponse, JsonResponse
+from django.http import FileResponse, StreamingHttpResponse, JsonResponse
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import get_object_or_404, redirect
 from django.views.decorators.http import require_POST
@@ -30,10 +34,30 @@ from docx.shared import Inches
 from io import BytesIO
 from .models import Report
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.urls import reverse
 from django.utils.text import slugify
 from django.contrib import messages
 from django.shortcuts import render, redirect
+from django.template.loader import render_to_string
+from django.db import transaction
+from .utils import (
+    ai_cache, bulk_export, chat_history, chat_stream, docx_template,
+    extraction_cache, pagination, rating_charts, report_revisions, report_state,
+    search_index,
+)
+from .utils.docx_placeholders import PlaceholderIndex
+from .utils.prompt_registry import get_prompt_text, get_prompts
+from .utils.generation import (
+    SECTION_DEPENDENCIES,
+    SECTION_PROMPTS,
+    report_data_lock,
+    schedule_report_generation,
+    section_pending,
+    section_statuses,
+    store_section_text,
+    wait_for_section,
+)
 
 # ──────────────────────────────────────────────────────────────────────────────
 # Miljö
@@ -103,29 +127,6 @@ def ensure_default_prompts_exist_for_set(prompt_set: PromptSet):
 
 
 
-def get_active_prompt_set():
-    cfg, _ = ActivePromptConfig.objects.get_or_create(id=1)
-    active = cfg.active_set
-    if active:
-        return active
-
-    # fallback: välj Veronika om den finns, annars första set, annars skapa Veronika
-    active = PromptSet.objects.filter(name__iexact="Veronika").first()
-    if not active:
-        active = PromptSet.objects.first()
-    if not active:
-        active = PromptSet.objects.create(name="Veronika")
-
-    cfg.active_set = active
-    cfg.save(update_fields=["active_set"])
-    return active
-
-
-def get_prompt_text(name: str) -> str:
-    active_set = get_active_prompt_set()
-    p = Prompt.objects.filter(prompt_set=active_set, name=name).first()
-    return p.text if p else ""
-
 def _report_title_from_context(ctx: dict) -> str:
     name = (ctx.get("candidate_name") or "").strip()
     role = (ctx.get("candidate_role") or "").strip()
@@ -191,28 +192,50 @@ def _extract_png_bytes(data_url: str) -> bytes | None:
         return None
 
 
-def get_active_prompt_set():
-    cfg, _ = ActivePromptConfig.objects.get_or_create(id=1)
-    if cfg.active_set:
-        return cfg.active_set
-    return PromptSet.objects.order_by("id").first()
-
-def get_prompt_text(name: str, fallback: str = "") -> str:
-    ps = get_active_prompt_set()
-    if not ps:
-        return fallback
-    p = Prompt.objects.filter(prompt_set=ps, name=name).first()
-    return (p.text if p else fallback) or fallback
-
-def _save_report_state(rep: Report, ctx: dict):
-    rep.current_step = int(ctx.get("step") or rep.current_step or 1)
-    rep.title = _report_title_from_context(ctx)
+def _save_report_state(rep: Report, ctx: dict, user=None, edited_key: str | None = None) -> bool:
+    """
+    Sparar wizardens tillstånd. Skriver bara det som skiljer sig från det sparade
+    (utils/report_state.py) – inget alls om inget ändrats. True om något skrevs.
+    user hamnar i versionshistoriken. edited_key = sektionen som visades på det
+    postade steget – bara den kan användaren ha tömt med flit.
+    """
+    current_step = int(ctx.get("step") or rep.current_step or 1)
+    title = _report_title_from_context(ctx)
 
     # Spara ENDAST "riktig" rapportdata (text, ratings, inputs osv)
-    rep.data = _extract_report_data_from_context(ctx)
+    data = _extract_report_data_from_context(ctx)
+
+    with report_data_lock, transaction.atomic():
+        saved = (
+            Report.objects.select_for_update()
+            .filter(id=rep.id)
+            .values("data", "current_step", "title")
+            .first()
+        )
+        if saved is None:
+            return False
+        saved_data = saved["data"] or {}
+
+        # Texter som genererats i bakgrunden finns bara i databasen tills användaren
+        # når sitt steg – skriv inte över dem med tomma formulärfält. Ett tomt fält
+        # räknas bara som "töm texten" när användaren hade sektionen framför sig
+        # och den inte fortfarande skrivs.
+        for key in SECTION_PROMPTS:
+            if (data.get(key) or "").strip() or not saved_data.get(key):
+                continue
+            if key != edited_key or section_pending(rep.id, key):
+                data[key] = saved_data[key]
 
-    rep.save(update_fields=["current_step", "title", "data", "updated_at"])
+        changed, removed = report_state.diff(saved_data, data)
+        fields = {}
+        if current_step != saved["current_step"]:
+            fields["current_step"] = current_step
+        if title != saved["title"]:
+            fields["title"] = title
+        written = report_state.write(rep.id, saved_data, changed, removed, user=user, **fields)
 
+    rep.current_step, rep.title, rep.data = current_step, title, data
+    return written
 
 
 def _safe_filename(s: str, fallback: str = "Rapport") -> str:
@@ -236,6 +259,24 @@ SECTION_KEYS = [
     ("kommunikation_text", "Kommunikation och samarbete"),
 ]
 
+# Vilken sektion skrivs när man klickar "Nästa" på ett visst steg
+STEP_SECTIONS = {
+    3: "leda_text",
+    4: "mod_text",
+    5: "sjalkannedom_text",
+    6: "strategi_text",
+    7: "kommunikation_text",
+    8: "sur_text",
+    9: "slutsats_text",
+}
+
+# Vilken sektion visas på ett visst steg (steget efter det där den skrevs)
+DISPLAY_STEP_SECTIONS = {
+    2: "tq_fardighet_text",
+    3: "tq_motivation_text",
+    **{s + 1: key for s, key in STEP_SECTIONS.items()},
+}
+
 # ── Koppling från STIVE-kompetenser -> (sektion_key, svensk_rad) ────────────
 HEADER_TO_TARGET = {
     # Leda, utveckla och engagera
@@ -432,7 +473,16 @@ def _to_str(v):
 
 
 # ── NYTT: liten wrapper för OpenAI-anrop per rubrik ───────────────────────────
-def _run_openai(prompt_text: str, style: str, **vars_) -> str:
+SECTION_MODEL, SECTION_TEMPERATURE, SECTION_MAX_TOKENS = "gpt-4o", 0.2, 900
+
+SECTION_ERROR_TEXT = (
+    "Tyvärr tog AI-svaret för lång tid eller gick inte att hämta just nu. "
+    "Försök igen om en liten stund."
+)
+
+
+def _fill_prompt(prompt_text: str, style: str, **vars_) -> str:
+    """Fyller i {placeholders} i prompten och lägger stilinstruktionen först."""
     def _to_str(v):
         """
         Säker konvertering till str så .replace() aldrig får list/dict.
@@ -449,54 +499,179 @@ def _run_openai(prompt_text: str, style: str, **vars_) -> str:
                 return str(v)
         return str(v)
 
-    try:
-        # ✅ DEBUG: se om motivation_notes finns och hur lång den är
-        mn = vars_.get("motivation_notes", None)
-        print("DEBUG motivation_notes type:", type(mn))
-        print("DEBUG motivation_notes len:", len(mn) if isinstance(mn, str) else "not str")
-        print("DEBUG motivation_notes preview:", repr((mn or "")[:200]))
+    # ✅ DEBUG: se om motivation_notes finns och hur lång den är
+    mn = vars_.get("motivation_notes", None)
+    print("DEBUG motivation_notes type:", type(mn))
+    print("DEBUG motivation_notes len:", len(mn) if isinstance(mn, str) else "not str")
+    print("DEBUG motivation_notes preview:", repr((mn or "")[:200]))
 
-        # ✅ DEBUG: se om placeholdern ens finns i prompten
-        print("DEBUG prompt has {motivation_notes}:", "{motivation_notes}" in prompt_text)
+    # ✅ DEBUG: se om placeholdern ens finns i prompten
+    print("DEBUG prompt has {motivation_notes}:", "{motivation_notes}" in prompt_text)
 
-        # Gör en kopia av prompt_text så vi inte muterar original
-        pt = str(prompt_text or "")
+    # Gör en kopia av prompt_text så vi inte muterar original
+    pt = str(prompt_text or "")
 
-        # Behåll dina två "snabba" replacements (men säkra)
-        pt = pt.replace("{excel_text}", _to_str(vars_.get("excel_text", "")))
-        pt = pt.replace("{intervju_text}", _to_str(vars_.get("intervju_text", "")))
+    # Behåll dina två "snabba" replacements (men säkra)
+    pt = pt.replace("{excel_text}", _to_str(vars_.get("excel_text", "")))
+    pt = pt.replace("{intervju_text}", _to_str(vars_.get("intervju_text", "")))
 
-        # ✅ stöd för fler placeholders utan att krascha (fixen!)
-        for k, v in vars_.items():
-            placeholder = "{" + k + "}"
-            pt = pt.replace(placeholder, _to_str(v))
+    # ✅ stöd för fler placeholders utan att krascha (fixen!)
+    for k, v in vars_.items():
+        placeholder = "{" + k + "}"
+        pt = pt.replace(placeholder, _to_str(v))
 
-        filled = (style or "") + "\n\n" + pt
+    filled = (style or "") + "\n\n" + pt
 
-        # ✅ DEBUG: kolla om motivation_notes faktiskt hamnade i filled
-        mn_preview = (mn or "")
-        idx = filled.find(str(mn_preview)[:50]) if isinstance(mn_preview, str) else -1
-        print("DEBUG motivation_notes appears in filled:", idx != -1)
-        print("DEBUG filled length:", len(filled))
+    # ✅ DEBUG: kolla om motivation_notes faktiskt hamnade i filled
+    mn_preview = (mn or "")
+    idx = filled.find(str(mn_preview)[:50]) if isinstance(mn_preview, str) else -1
+    print("DEBUG motivation_notes appears in filled:", idx != -1)
+    print("DEBUG filled length:", len(filled))
+    return filled
 
-        resp = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": filled}],
-            temperature=0.2,
-            max_tokens=900,
-            timeout=20,
-        )
-        content = resp.choices[0].message.content
-        if not content:
-            raise ValueError("Tomt svar från OpenAI")
-        return content.strip()
+
+def _openai_request(prompt_text: str, style: str, regenerate: bool = False, **vars_):
+    """
+    Allt före själva OpenAI-anropet – delas av _run_openai och async_views._arun_section,
+    så att prompt, cachenyckel och anrop alltid är desamma.
+    Returnerar (cachenyckel, cachat svar eller None, argument till chat.completions.create).
+    """
+    filled = _fill_prompt(prompt_text, style, **vars_)
+
+    key = ai_cache.cache_key(SECTION_MODEL, SECTION_TEMPERATURE, SECTION_MAX_TOKENS, filled)
+    cached = None
+    if regenerate:
+        ai_cache.record("bypasses")
+    else:
+        cached = ai_cache.get_cached(key)
+
+    request_kwargs = {
+        "model": SECTION_MODEL,
+        "messages": [{"role": "user", "content": filled}],
+        "temperature": SECTION_TEMPERATURE,
+        "max_tokens": SECTION_MAX_TOKENS,
+    }
+    return key, cached, request_kwargs
+
+
+def _openai_result(cache_key: str, resp) -> str:
+    """Svarstexten ur anropet, sparad i cachen. ValueError om svaret är tomt."""
+    content = resp.choices[0].message.content
+    if not content:
+        raise ValueError("Tomt svar från OpenAI")
+
+    content = content.strip()
+    ai_cache.store(cache_key, SECTION_MODEL, content)
+    return content
+
+
+def _run_openai(prompt_text: str, style: str, regenerate: bool = False, **vars_) -> str:
+    """
+    Fyller i prompten och kör den mot OpenAI.
+    Svaren cachas (utils/ai_cache) – regenerate=True går förbi cachen och skriver om.
+    """
+    try:
+        key, cached, request_kwargs = _openai_request(prompt_text, style, regenerate, **vars_)
+        if cached is not None:
+            return cached
+
+        resp = client.chat.completions.create(**request_kwargs, timeout=20)
+        return _openai_result(key, resp)
 
     except Exception as e:
         print("⚠️ OpenAI error in _run_openai:", repr(e))
-        return (
-            "Tyvärr tog AI-svaret för lång tid eller gick inte att hämta just nu. "
-            "Försök igen om en liten stund."
-        )
+        return SECTION_ERROR_TEXT
+
+
+def _section_payload(context, style, betygsskala_prompt, ratings_json_str, selected_motivations) -> dict:
+    """
+    Allt som behövs för att skriva sektionerna i efterhand (i bakgrundstråd eller
+    av run_report_worker), utan request/context. Måste gå att spara som JSON.
+    """
+    return {
+        "style": style,
+        "base_vars": dict(
+            uploaded_files=_trim(
+                context.get("uploaded_files_markdown")
+                or context.get("uploaded_files_text", "")
+            ),
+            candidate_name=context.get("candidate_name", ""),
+            candidate_role=context.get("candidate_role", ""),
+            candidate_first_name=context.get("candidate_first_name", ""),
+            candidate_last_name=context.get("candidate_last_name", ""),
+            job_ad_text=context.get("job_ad_text", ""),
+            motivation_notes=context.get("motivation_notes", ""),
+            logical_score=_to_str(context.get("logical_score")),
+            verbal_score=_to_str(context.get("verbal_score")),
+            selected_motivations=selected_motivations,
+        ),
+        # Underlaget från steg 1 – används av sektioner utan beroenden
+        "input_vars": dict(
+            excel_text=_trim(context.get("test_text", "")),
+            intervju_text=_trim(context.get("intervju_text", "")),
+            ratings_json=ratings_json_str,
+            betygsskala_forklaring=betygsskala_prompt,
+        ),
+    }
+
+
+def _section_payload_for_report(rep: Report) -> dict:
+    """
+    Samma payload som wizarden bygger i steg 1, men från en sparad rapport
+    (används när en enskild sektion skrivs om via API:t).
+    """
+    data = rep.data or {}
+    prompts = get_prompts()
+    selected_motivations = [
+        {
+            "key": k,
+            "label": MOTIVATION_FACTORS[k]["label"],
+            "definition": MOTIVATION_FACTORS[k]["definition"],
+        }
+        for k in data.get("selected_motivation_keys") or []
+        if k in MOTIVATION_FACTORS
+    ]
+    return _section_payload(
+        data,
+        prompts.get("global_style", getattr(settings, "STYLE_INSTRUCTION", "")),
+        prompts.get("betygsskala_forklaring", ""),
+        data.get("ratings_json", ""),
+        selected_motivations,
+    )
+
+
+def _run_section(key: str, payload: dict, texts: dict, regenerate: bool = False) -> str:
+    """
+    Skriver en sektion (t.ex. "leda_text") med OpenAI.
+    `texts` behövs för sammanställningarna (sur/slutsats) som bygger på andra sektioner.
+    regenerate=True hoppar över svarscachen.
+    """
+    prompt_text = get_prompt_text(SECTION_PROMPTS[key], fallback="")
+    vars_ = _section_vars(key, payload, texts)
+    return _run_openai(prompt_text, payload.get("style", ""), regenerate=regenerate, **vars_)
+
+
+def _run_section_into(context: dict, key: str, payload: dict, regenerate: bool = False) -> None:
+    """
+    _run_section för wizarden: texten hamnar i context[key] och sparas med rapporten.
+    Misslyckas anropet visas felet och context[key] lämnas orörd – feltexten får
+    aldrig sparas som sektion.
+    """
+    text = _run_section(key, payload, context, regenerate=regenerate)
+    if text == SECTION_ERROR_TEXT:
+        context["error"] = text
+        return
+    context[key] = text
+
+
+def _section_vars(key: str, payload: dict, texts: dict) -> dict:
+    vars_ = dict(payload.get("base_vars") or {})
+    deps = SECTION_DEPENDENCIES[key]
+    if deps:
+        vars_.update({d: texts.get(d, "") for d in deps})
+    else:
+        vars_.update(payload.get("input_vars") or {})
+    return vars_
 
 
 def _round_to_1_5(x) -> int:
@@ -519,7 +694,7 @@ def _round_to_1_5(x) -> int:
 
     return int(math.floor(v + 0.5))
 
-def _build_sidebar_context(prompt_set, step, context, ratings_json_str):
+def _build_sidebar_context(step, context, ratings_json_str):
     """
     Bygger ett context-paket till sidobarschattens AI.
     Innehåller kandidatinfo, test/intervju/CV + aktuell sektion och dess prompt(er).
@@ -535,16 +710,12 @@ def _build_sidebar_context(prompt_set, step, context, ratings_json_str):
         "sections": [],
     }
 
-    # Använd prompt_set som "active_set" i denna funktion
-    active_set = prompt_set
+    # Prompterna i det aktiva setet (prompt-registret, ingen DB-fråga)
+    prompts = get_prompts()
 
     # Gör add_section enkel igen (ingen extra parameter-cirkus)
     def add_section(title, key, prompt_name):
-        try:
-            prompt_obj = Prompt.objects.get(prompt_set=active_set, name=prompt_name)
-            prompt_text = prompt_obj.text
-        except Prompt.DoesNotExist:
-            prompt_text = ""
+        prompt_text = prompts.get(prompt_name, "")
 
         base["sections"].append({
             "field_label": title,
@@ -1110,14 +1281,68 @@ def _normalize_header_cell(value: str) -> str:
     return text.strip().lower()
 
 
-def _ratings_from_worksheet(ws):
+def _iter_excel_rows(file, max_rows: int | None = None):
+    """
+    Rader (tupler med cellvärden) ur första bladet, strömmande: read_only +
+    data_only, så arbetsboken laddas aldrig i sin helhet. Högst EXCEL_MAX_ROWS rader.
+    """
+    wb = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        yield from wb.active.iter_rows(max_row=max_rows or settings.EXCEL_MAX_ROWS, values_only=True)
+    finally:
+        wb.close()
+
+
+def _excel_line(row) -> str:
+    return "\t".join([str(c) if c is not None else "" for c in row]) + "\n"
+
+
+def _read_excel(file, max_rows: int | None = None):
+    """
+    Läser testplattformens Excel i en genomgång. Returnerar (excel_text, rows) där
+    excel_text är tabbseparerad text för AI:n och rows de två första raderna
+    (rubriker + resultat) som betygen läses från.
+    """
+    out = io.StringIO()
+    rows = []
+    for row in _iter_excel_rows(file, max_rows):
+        if len(rows) < 2:
+            rows.append(row)
+        out.write(_excel_line(row))
+    return out.getvalue(), rows
+
+
+def _read_excel_candidates(file, max_rows: int | None = None) -> list:
+    """
+    Batchläge: testplattformens export av en hel testdag (rubriker på rad 1, sedan
+    en kandidat per rad med förnamn/efternamn i kolumn 1–2). En genomgång av bladet.
+    Returnerar [(förnamn, efternamn, excel_text, ratings)] – excel_text är rubrikraden
+    + kandidatens rad, så AI:n bara ser sin kandidats resultat.
+    """
+    candidates = []
+    header = None
+    for row in _iter_excel_rows(file, max_rows):
+        if header is None:
+            header, header_line = row, _excel_line(row)
+            continue
+
+        first = str(row[0] or "").strip() if len(row) > 0 else ""
+        last = str(row[1] or "").strip() if len(row) > 1 else ""
+        if not (first or last):
+            continue
+
+        ratings, _ = _ratings_from_rows([header, row])
+        candidates.append((first, last, header_line + _excel_line(row), ratings))
+    return candidates
+
+
+def _ratings_from_rows(rows):
     """
     STIVE-format:
       - Rad 1: rubriker ('Competency Score: Leading others (STIVE)')
       - Rad 2: värden (1–5, ev. decimal)
     Mappar med HEADER_TO_TARGET till svenska etiketter per sektion.
     """
-    rows = list(ws.iter_rows(values_only=True))
     debug = []
 
     if len(rows) < 2:
@@ -1173,10 +1398,11 @@ IMAGE_WIDTHS_IN = {
 
 
 
-def replace_image_placeholder(doc, placeholder: str, data_url: str, width_in: float | None = None):
+def replace_image_placeholder(doc, placeholder: str, data_url: str, width_in: float | None = None, index=None):
     """
     Ersätter placeholder i Word med en bild (base64 dataURL).
     width_in: om None -> hämtas från IMAGE_WIDTHS_IN, fallback 5.8
+    index: PlaceholderIndex för dokumentet (byggs annars här)
     """
     if not data_url:
         return
@@ -1190,67 +1416,30 @@ def replace_image_placeholder(doc, placeholder: str, data_url: str, width_in: fl
     except Exception:
         return
 
-    target_width = width_in if width_in is not None else IMAGE_WIDTHS_IN.get(placeholder, 5.8)
+    insert_image_bytes(doc, placeholder, img_bytes, width_in=width_in, index=index)
 
-    def _insert_into_paragraph(p):
-        if placeholder not in (p.text or ""):
-            return False
 
-        # töm runs
-        for r in p.runs:
-            r.text = ""
+def insert_image_bytes(doc, placeholder: str, img_bytes: bytes, width_in: float | None = None, index=None):
+    """Som replace_image_placeholder, men med färdiga PNG-bytes (t.ex. från utils/rating_charts)."""
+    if not img_bytes:
+        return
 
-        img_stream = BytesIO(img_bytes)
-        img_stream.seek(0)
+    target_width = width_in if width_in is not None else IMAGE_WIDTHS_IN.get(placeholder, 5.8)
 
-        run = p.add_run()
-        run.add_picture(img_stream, width=Inches(target_width))
-        return True
+    if index is None:
+        index = PlaceholderIndex(doc)
+    index.insert_picture(placeholder, BytesIO(img_bytes), Inches(target_width))
 
-    # 1) vanliga paragrafer
-    for p in doc.paragraphs:
-        if _insert_into_paragraph(p):
-            return
 
-    # 2) tabeller
-    for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                for p in cell.paragraphs:
-                    if _insert_into_paragraph(p):
-                        return
-
-
-def docx_replace_text(doc, mapping: dict):
-    """
-    Ersätter t.ex. {candidate_name} i alla paragrafer och tabellceller.
-    Enkel variant som funkar bra om du inte har massa blandad formatering
-    mitt i samma mening.
-    """
-    def replace_in_paragraph(paragraph):
-        if not paragraph.text:
-            return
-        full_text = paragraph.text
-        changed = False
-        for k, v in mapping.items():
-            if k in full_text:
-                full_text = full_text.replace(k, v or "")
-                changed = True
-        if changed:
-            # nollställ runs och skriv allt i första run
-            for run in paragraph.runs:
-                run.text = ""
-            if paragraph.runs:
-                paragraph.runs[0].text = full_text
-
-    for p in doc.paragraphs:
-        replace_in_paragraph(p)
-
-    for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                for p in cell.paragraphs:
-                    replace_in_paragraph(p)
+def docx_replace_text(doc, mapping: dict, index=None):
+    """
+    Ersätter t.ex. {candidate_name} i alla paragrafer, tabellceller (även nästlade),
+    sidhuvuden och sidfötter. Taggar som Word delat upp i flera runs hanteras,
+    och formateringen i resten av stycket behålls.
+    """
+    if index is None:
+        index = PlaceholderIndex(doc)
+    index.replace_text(mapping)
 
 TABLE_PLACEHOLDERS = {
     "{leda_table}": "leda_utveckla_och_engagera",
@@ -1386,41 +1575,122 @@ def build_ratings_table_for_section(doc, ratings: dict, section_key: str):
     return table
 
 
-def replace_table_placeholder(doc, placeholder: str, ratings: dict, section_key: str):
+def replace_table_placeholder(doc, placeholder: str, ratings: dict, section_key: str, index=None):
     """
     Hittar paragrafen som innehåller t.ex. {leda_table},
     lägger in tabellen direkt efter paragrafen (i samma cell eller i body),
     och tar bort själva taggen.
     """
+    if index is None:
+        index = PlaceholderIndex(doc)
+    if placeholder not in index:
+        return
 
-    def _handle_paragraph(p):
-        if placeholder not in p.text:
-            return False
+    # Skapa tabellen (först i dokumentets body) och flytta den till taggen
+    table = build_ratings_table_for_section(doc, ratings, section_key)
+    index.insert_table_after(placeholder, table)
+
+# Bildtagg i Word-mallen -> sektion i ratings_json
+REPORT_IMAGE_SECTIONS = {
+    "leda_image": "leda_utveckla_och_engagera",
+    "mod_image": "mod_och_handlingskraft",
+    "sjalkannedom_image": "sjalkannedom_och_emotionell_stabilitet",
+    "strategi_image": "strategiskt_tankande_och_anpassningsformaga",
+    "kommunikation_image": "kommunikation_och_samarbete",
+}
+REPORT_IMAGE_KEYS = list(REPORT_IMAGE_SECTIONS)
+
+
+def rating_chart_png(ratings: dict, section_key: str) -> bytes:
+    """Betygsskalan för en sektion som PNG (ritas på servern, cachas på betygen)."""
+    section_ratings = (ratings or {}).get(section_key)
+    if not section_ratings:
+        return b""
+    return rating_charts.render_section_png(
+        section_key,
+        section_ratings,
+        TARGETS.get(section_key) or list(section_ratings.keys()),
+        SUBSCALE_DESCRIPTIONS.get(section_key, {}),
+    )
 
-        # Skapa tabellen (först i dokumentets body)
-        table = build_ratings_table_for_section(doc, ratings, section_key)
 
-        # Flytta tabellen så att den hamnar direkt efter paragrafen p
-        p._p.addnext(table._tbl)
+def _parse_ratings_json(raw) -> dict:
+    if isinstance(raw, dict):
+        return raw
+    if isinstance(raw, str) and raw.strip():
+        try:
+            return json.loads(raw)
+        except Exception:
+            return {}
+    return {}
 
-        # Ta bort taggen ur paragrafens text
-        for run in p.runs:
-            if placeholder in run.text:
-                run.text = run.text.replace(placeholder, "")
-        return True
 
-    # 1) Sök i body-paragrafer
-    for p in doc.paragraphs:
-        if _handle_paragraph(p):
-            return
+def _build_report_docx(context: dict, selected_motivations_text: str, ratings_doc: dict, images: dict):
+    """
+    Fyller Word-mallen med texter, betygstabeller och betygsbilder.
+    Mallen parsas bara en gång per process (utils/docx_template), här jobbar vi på en kopia.
+    """
+    doc = docx_template.load_template()
+
+    mapping = {
+        "{candidate_name}": context.get("candidate_name", ""),
+        "{candidate_first_name}": context.get("candidate_first_name", ""),
+        "{candidate_last_name}": context.get("candidate_last_name", ""),
+        "{candidate_role}": context.get("candidate_role", ""),
+        "{tq_fardighet_text}": html_to_text(context.get("tq_fardighet_text", "")),
+        "{sur_text}": html_to_text(context.get("sur_text", "")),
+        "{tq_motivation_text}": html_to_text(context.get("tq_motivation_text", "")),
+        "{leda_text}": html_to_text(context.get("leda_text", "")),
+        "{mod_text}": html_to_text(context.get("mod_text", "")),
+        "{sjalkannedom_text}": html_to_text(context.get("sjalkannedom_text", "")),
+        "{strategi_text}": html_to_text(context.get("strategi_text", "")),
+        "{kommunikation_text}": html_to_text(context.get("kommunikation_text", "")),
+        "{selected_motivations}": selected_motivations_text,
+    }
+    # Ett enda svep över dokumentet – alla ersättningar görs sedan mot indexet
+    index = PlaceholderIndex(doc)
+    docx_replace_text(doc, mapping, index=index)
+
+    if ratings_doc:
+        for placeholder, section_key in TABLE_PLACEHOLDERS.items():
+            replace_table_placeholder(doc, placeholder, ratings_doc, section_key, index=index)
+
+    # ✅ Betygsbilder ritas på servern; uppladdad bild (html2canvas) används bara
+    #    för sektioner som saknar betyg
+    for key, section_key in REPORT_IMAGE_SECTIONS.items():
+        png = rating_chart_png(ratings_doc, section_key)
+        if png:
+            insert_image_bytes(doc, "{" + key + "}", png, index=index)
+        else:
+            replace_image_placeholder(doc, "{" + key + "}", (images or {}).get(key, ""), index=index)
+
+    return doc
+
+
+DOCX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+
+def _docx_file_response(doc, filename: str):
+    """
+    Skriver dokumentet till en SpooledTemporaryFile (i minnet upp till
+    DOCX_SPOOL_MAX_SIZE, sedan på disk) och streamar den i bitar med
+    Content-Length, i stället för att bygga hela zip:en i en HttpResponse-buffert.
+    """
+    tmp = tempfile.SpooledTemporaryFile(
+        max_size=getattr(settings, "DOCX_SPOOL_MAX_SIZE", 512 * 1024)
+    )
+    doc.save(tmp)
+    tmp.seek(0)
+
+    response = FileResponse(
+        tmp,
+        as_attachment=True,
+        filename=filename,
+        content_type=DOCX_CONTENT_TYPE,
+    )
+    response.block_size = 64 * 1024
+    return response
 
-    # 2) Sök i alla tabellceller
-    for t in doc.tables:
-        for row in t.rows:
-            for cell in row.cells:
-                for p in cell.paragraphs:
-                    if _handle_paragraph(p):
-                        return
 
 # ── NYTT: statisk skalförklaring (HTML) med header ───────────────────────────
 def _scale_demo_html() -> str:
@@ -1527,12 +1797,18 @@ def ensure_default_prompts_exist(prompt_set: PromptSet):
         ),
     }
 
-    for name, text in defaults.items():
-        Prompt.objects.get_or_create(
-            prompt_set=prompt_set,
-            name=name,
-            defaults={"text": text},
-        )
+    # En fråga + en bulk-insert i stället för en get_or_create per prompt
+    existing = set(
+        Prompt.objects.filter(prompt_set=prompt_set, name__in=defaults).values_list("name", flat=True)
+    )
+    Prompt.objects.bulk_create(
+        [
+            Prompt(prompt_set=prompt_set, name=name, text=text)
+            for name, text in defaults.items()
+            if name not in existing
+        ],
+        ignore_conflicts=True,  # två processer kan skapa samtidigt (unique_together)
+    )
 
 
 
@@ -1745,22 +2021,9 @@ def _build_sidebar_ratings(ratings: dict):
 @csrf_exempt
 def index(request):
 
-    # 1) Hämta/skap "Veronika" & "Frida" sets (bara för att de alltid ska finnas)
-    veronika_set, _ = PromptSet.objects.get_or_create(name="Veronika")
-    frida_set, _ = PromptSet.objects.get_or_create(name="Frida")
-    active_set = get_active_prompt_set()
-
-    # 2) Hämta global config (singleton id=1) och bestäm aktivt set
-    cfg, _ = ActivePromptConfig.objects.get_or_create(id=1)
-    active_set = cfg.active_set or veronika_set  # default om ingen vald ännu
-
-    # 3) Spara default om det behövs
-    if cfg.active_set_id is None:
-        cfg.active_set = active_set
-        cfg.save(update_fields=["active_set", "updated_at"])
-
-    # 4) Se till att prompts finns i det aktiva setet
-    ensure_default_prompts_exist(active_set)
+    # Aktivt promptset: prompt-registret ser till att Veronika/Frida och
+    # standardprompts finns, och laddar bara om när något prompt ändrats
+    prompts = get_prompts()
 
     # ---------- 1) Läs nuvarande steg (GET eller POST) ----------
     try:
@@ -1768,6 +2031,9 @@ def index(request):
     except ValueError:
         step = 1
 
+    # Sektionen som visades på det postade steget (den enda användaren kan ha tömt)
+    edited_key = DISPLAY_STEP_SECTIONS.get(step) if request.method == "POST" else None
+
     # --- NYTT (FIX): Ladda report_id / report-data tidigt så loaded_data kan användas i steglogiken ---
     report_id = request.GET.get("report_id") or request.POST.get("report_id")
     loaded_report = None
@@ -1947,40 +2213,12 @@ def index(request):
                 rep = _get_report_or_404(report_id)
 
                 context_for_save = dict(context)
-                for k in ["leda_image", "mod_image", "sjalkannedom_image", "strategi_image", "kommunikation_image"]:
+                for k in REPORT_IMAGE_KEYS:
                     context_for_save.pop(k, None)
 
-                _save_report_state(rep, context_for_save)
-            
-            from django.http import HttpResponse
-            from docx import Document
-            
-            template_path = os.path.join(
-                settings.BASE_DIR, "reports", "domarnamnden_template.docx"
-            )
-            doc = Document(template_path)
-            
-            leda_image_data = request.POST.get("leda_image", "")
-            mod_image_data = request.POST.get("mod_image", "")
-            sjalkannedom_image_data = request.POST.get("sjalkannedom_image", "")
-            strategi_image_data = request.POST.get("strategi_image", "")
-            kommunikation_image_data = request.POST.get("kommunikation_image", "")
-        
-            from django.http import HttpResponse
-            from docx import Document
-
-            template_path = os.path.join(
-                settings.BASE_DIR,
-                "reports",
-                "domarnamnden_template.docx"
-            )
-            doc = Document(template_path)
+                _save_report_state(rep, context_for_save, request.user, edited_key)
 
-            leda_image_data = request.POST.get("leda_image", "")
-            mod_image_data = request.POST.get("mod_image", "")
-            sjalkannedom_image_data = request.POST.get("sjalkannedom_image", "")
-            strategi_image_data = request.POST.get("strategi_image", "")
-            kommunikation_image_data = request.POST.get("kommunikation_image", "")
+            images = {k: request.POST.get(k, "") for k in REPORT_IMAGE_KEYS}
 
             # --- bygg text för valda motivationsfaktorer ---
             selected_motivations_doc = context.get("selected_motivations") or []
@@ -1999,73 +2237,22 @@ def index(request):
 
             selected_motivations_text = "\n\n".join(motivation_lines)
 
-            mapping = {
-                "{candidate_name}": context.get("candidate_name", ""),
-                "{candidate_first_name}": context.get("candidate_first_name", ""),
-                "{candidate_last_name}": context.get("candidate_last_name", ""),
-                "{candidate_role}": context.get("candidate_role", ""),
-                "{tq_fardighet_text}": html_to_text(context.get("tq_fardighet_text", "")),
-                "{sur_text}": html_to_text(context.get("sur_text", "")),
-                "{tq_motivation_text}": html_to_text(context.get("tq_motivation_text", "")),
-                "{leda_text}": html_to_text(context.get("leda_text", "")),
-                "{mod_text}": html_to_text(context.get("mod_text", "")),
-                "{sjalkannedom_text}": html_to_text(context.get("sjalkannedom_text", "")),
-                "{strategi_text}": html_to_text(context.get("strategi_text", "")),
-                "{kommunikation_text}": html_to_text(context.get("kommunikation_text", "")),
-                "{selected_motivations}": selected_motivations_text,
-            }
-            docx_replace_text(doc, mapping)
-
             ratings_json_raw = (
                 request.POST.get("ratings_json")
                 or context.get("ratings_json")
                 or ""
             )
 
-            ratings_doc = {}
-            if isinstance(ratings_json_raw, dict):
-                ratings_doc = ratings_json_raw
-            elif isinstance(ratings_json_raw, str) and ratings_json_raw.strip():
-                try:
-                    ratings_doc = json.loads(ratings_json_raw)
-                except json.JSONDecodeError:
-                    ratings_doc = {}
+            print("DEBUG leda_image startswith data:", (images["leda_image"] or "")[:30])
+            print("DEBUG leda_image length:", len(images["leda_image"] or ""))
 
-            if ratings_doc:
-                replace_table_placeholder(
-                    doc, "{leda_table}", ratings_doc, "leda_utveckla_och_engagera"
-                )
-                replace_table_placeholder(
-                    doc, "{mod_table}", ratings_doc, "mod_och_handlingskraft"
-                )
-                replace_table_placeholder(
-                    doc, "{sjalkannedom_table}", ratings_doc,
-                    "sjalkannedom_och_emotionell_stabilitet"
-                )
-                replace_table_placeholder(
-                    doc, "{strategi_table}", ratings_doc,
-                    "strategiskt_tankande_och_anpassningsformaga"
-                )
-                replace_table_placeholder(
-                    doc, "{kommunikation_table}", ratings_doc,
-                    "kommunikation_och_samarbete"
-                )
-
-            print("DEBUG leda_image startswith data:", (leda_image_data or "")[:30])
-            print("DEBUG leda_image length:", len(leda_image_data or ""))
-
-            replace_image_placeholder(doc, "{leda_image}", leda_image_data)
-            replace_image_placeholder(doc, "{mod_image}", mod_image_data)
-            replace_image_placeholder(doc, "{sjalkannedom_image}", sjalkannedom_image_data)
-            replace_image_placeholder(doc, "{strategi_image}", strategi_image_data)
-            replace_image_placeholder(doc, "{kommunikation_image}", kommunikation_image_data)
-
-            response = HttpResponse(
-                content_type=(
-                    "application/vnd.openxmlformats-"
-                    "officedocument.wordprocessingml.document"
-                )
+            doc = _build_report_docx(
+                context,
+                selected_motivations_text,
+                _parse_ratings_json(ratings_json_raw),
+                images,
             )
+
             candidate = _safe_filename(context.get("candidate_name", ""))
             role = _safe_filename(context.get("candidate_role", ""))
 
@@ -2075,28 +2262,13 @@ def index(request):
                 filename = f"{candidate}.docx"
             else:
                 filename = "Rapport.docx"
-            response["Content-Disposition"] = f'attachment; filename=\"{filename}\"'
-            doc.save(response)
-            return response
+            return _docx_file_response(doc, filename)
 
-        # Nästa (inkl AI)
-        elif "next" in request.POST:
+        # Nästa (inkl AI) eller "skriv om"
+        elif "next" in request.POST or "regenerate" in request.POST:
 
-            try:
-                style = Prompt.objects.get(
-                    prompt_set=active_set,
-                    name="global_style"
-                ).text
-            except Prompt.DoesNotExist:
-                style = getattr(settings, "STYLE_INSTRUCTION", "")
-
-            try:
-                betygsskala_prompt = Prompt.objects.get(
-                    prompt_set=active_set,
-                    name="betygsskala_forklaring"
-                ).text
-            except Prompt.DoesNotExist:
-                betygsskala_prompt = ""
+            style = prompts.get("global_style", getattr(settings, "STYLE_INSTRUCTION", ""))
+            betygsskala_prompt = prompts.get("betygsskala_forklaring", "")
 
             ratings_json_str = (
                 request.POST.get("ratings_json")
@@ -2104,10 +2276,22 @@ def index(request):
                 or ""
             )
 
+            # Skriv om texten för detta steg (går förbi AI-cachen)
+            if "regenerate" in request.POST:
+                key = DISPLAY_STEP_SECTIONS.get(step)
+                if key:
+                    payload = _section_payload(
+                        context,
+                        style,
+                        betygsskala_prompt,
+                        ratings_json_str,
+                        selected_motivations_for_ai,
+                    )
+                    _run_section_into(context, key, payload, regenerate=True)
+
             # ---------- STEG 1 ----------
-            if step == 1:
+            elif step == 1:
                 excel_text = ""
-                ws = None
 
                 # Läs för- och efternamn från formuläret
                 first = (request.POST.get("candidate_first_name") or "").strip()
@@ -2130,7 +2314,7 @@ def index(request):
                 job_ad_file = request.FILES.get("job_ad_pdf")
 
                 if job_ad_file:
-                    job_ad_text = _trim(_read_file_text(job_ad_file), 6500).strip()
+                    job_ad_text = _trim(_read_file_text(job_ad_file, 6500), 6500).strip()
                     if not job_ad_text:
                         context["error"] = "Kunde inte läsa någon text från jobbannons-PDF:en."
                 else:
@@ -2200,14 +2384,7 @@ def index(request):
                 # Excel
                 if "excel" in request.FILES:
                     try:
-                        file = request.FILES["excel"]
-                        wb = openpyxl.load_workbook(file)
-                        ws = wb.active
-
-                        out = io.StringIO()
-                        for row in ws.iter_rows(values_only=True):
-                            out.write("\t".join([str(c) if c is not None else "" for c in row]) + "\n")
-                        excel_text = out.getvalue()
+                        excel_text, excel_rows = _read_excel(request.FILES["excel"])
                     except Exception as e:
                         context["error"] = "Kunde inte läsa excelfilen: " + str(e)[:400]
                 else:
@@ -2235,7 +2412,7 @@ def index(request):
                     context["intervju_text"] = intervju_raw
 
                     try:
-                        ratings, dbg = _ratings_from_worksheet(ws)
+                        ratings, dbg = _ratings_from_rows(excel_rows)
                         ratings_json_str = json.dumps(ratings, ensure_ascii=False)
                         context["ratings_json"] = ratings_json_str
                         context["ratings_sidebar"] = _build_sidebar_ratings(ratings)
@@ -2244,272 +2421,56 @@ def index(request):
                         step = 1
 
                     if not context["error"]:
-                        uploaded_trimmed = _trim(context["uploaded_files_markdown"])
-
-                        if not context["tq_fardighet_text"]:
-                            P = Prompt.objects.get(prompt_set=active_set, name="tq_fardighet").text
-                            context["tq_fardighet_text"] = _run_openai(
-                                P,
-                                style,
-                                excel_text=_trim(excel_text),
-                                intervju_text=_trim(intervju_raw),
-                                ratings_json=ratings_json_str,
-                                betygsskala_forklaring=betygsskala_prompt,
-                                uploaded_files=uploaded_trimmed,
-                                candidate_name=context["candidate_name"],
-                                candidate_role=context["candidate_role"],
-                                candidate_first_name=context["candidate_first_name"],
-                                candidate_last_name=context["candidate_last_name"],
-
-                                job_ad_text=context.get("job_ad_text", ""),
-                                motivation_notes=context.get("motivation_notes", ""),
-                                logical_score=str(context.get("logical_score") or ""),
-                                verbal_score=str(context.get("verbal_score") or ""),
-
-                                # FIX: skicka valda motivationsfaktorer
-                                selected_motivations=selected_motivations_for_ai,
-                            )
-
-                            if not context["tq_motivation_text"]:
-                                P = Prompt.objects.get(prompt_set=active_set, name="tq_motivation").text
-                                context["tq_motivation_text"] = _run_openai(
-                                    P,
-                                    style,
-                                    excel_text=_trim(excel_text),
-                                    intervju_text=_trim(intervju_raw),
-                                    ratings_json=ratings_json_str,
-                                    betygsskala_forklaring=betygsskala_prompt,
-                                    uploaded_files=uploaded_trimmed,
-                                    candidate_name=context["candidate_name"],
-                                    candidate_role=context["candidate_role"],
-                                    candidate_first_name=context["candidate_first_name"],
-                                    candidate_last_name=context["candidate_last_name"],
-
-                                    job_ad_text=context.get("job_ad_text", ""),
-                                    motivation_notes=context.get("motivation_notes", ""),
-                                    logical_score=str(context.get("logical_score") or ""),
-                                    verbal_score=str(context.get("verbal_score") or ""),
-
-                                    # FIX: skicka valda motivationsfaktorer
-                                    selected_motivations=selected_motivations_for_ai,
-                                )
-
-                        step = 2
-
                         if not report_id:
                             rep = _ensure_report(request, context)
                             report_id = str(rep.id)
 
+                        # Starta ALLA sektioner parallellt (utils/generation).
+                        # TQ-texterna behövs direkt i steg 2, resten hämtas i sina steg.
+                        payload = _section_payload(
+                            context,
+                            style,
+                            betygsskala_prompt,
+                            ratings_json_str,
+                            selected_motivations_for_ai,
+                        )
+                        schedule_report_generation(report_id, context, payload)
+
+                        # En gemensam väntetid för båda (trådläget) – med workern väntar
+                        # vi inte alls, steg 2 och 3 pollar tills texterna är klara.
+                        deadline = time.monotonic() + getattr(settings, "REPORT_GENERATION_WAIT", 25)
+                        for key in ("tq_fardighet_text", "tq_motivation_text"):
+                            if not context[key]:
+                                context[key] = wait_for_section(
+                                    report_id, key, timeout=deadline - time.monotonic()
+                                )
+                            if not context[key] and not section_pending(report_id, key):
+                                _run_section_into(context, key, payload)
+
+                        step = 2
+
             # 2 -> 3
             elif step == 2:
                 step = 3
 
-            # 3 -> 4
-            elif step == 3:
-                if not context["leda_text"]:
-                    P = get_prompt_text("leda", fallback="")
-                    context["leda_text"] = _run_openai(
-                        P,
+            # 3 -> 10: texten är oftast redan genererad i bakgrunden efter steg 1
+            elif step in STEP_SECTIONS:
+                key = STEP_SECTIONS[step]
+                if not (context.get(key) or "").strip():
+                    context[key] = wait_for_section(report_id, key)
+
+                # Fallback: ingen förgenererad text (t.ex. äldre rapport) -> kör nu.
+                # Pågår jobbet fortfarande pollar sidan i stället (se pending_section).
+                if not (context.get(key) or "").strip() and not section_pending(report_id, key):
+                    payload = _section_payload(
+                        context,
                         style,
-                        excel_text=_trim(context["test_text"]),
-                        intervju_text=_trim(context["intervju_text"]),
-                        ratings_json=ratings_json_str,
-                        betygsskala_forklaring=betygsskala_prompt,
-                        uploaded_files=_trim(
-                            context.get("uploaded_files_markdown")
-                            or context.get("uploaded_files_text", "")
-                        ),
-                        candidate_name=context["candidate_name"],
-                        candidate_role=context["candidate_role"],
-                        candidate_first_name=context["candidate_first_name"],
-                        candidate_last_name=context["candidate_last_name"],
-                        motivation_notes=context.get("motivation_notes", ""),
-                        logical_score=context.get("logical_score", ""),
-                        verbal_score=context.get("verbal_score", ""),
-
-                        # FIX: skicka valda motivationsfaktorer
-                        selected_motivations=selected_motivations_for_ai,
+                        betygsskala_prompt,
+                        ratings_json_str,
+                        selected_motivations_for_ai,
                     )
-                step = 4
-
-            # 4 -> 5
-            elif step == 4:
-                if not context["mod_text"]:
-                    P = get_prompt_text("mod", fallback="")
-                    context["mod_text"] = _run_openai(
-                        P,
-                        style,
-                        excel_text=_trim(context["test_text"]),
-                        intervju_text=_trim(context["intervju_text"]),
-                        ratings_json=ratings_json_str,
-                        betygsskala_forklaring=betygsskala_prompt,
-                        uploaded_files=_trim(
-                            context.get("uploaded_files_markdown")
-                            or context.get("uploaded_files_text", "")
-                        ),
-                        candidate_name=context["candidate_name"],
-                        candidate_role=context["candidate_role"],
-                        candidate_first_name=context["candidate_first_name"],
-                        candidate_last_name=context["candidate_last_name"],
-                        motivation_notes=context.get("motivation_notes", ""),
-                        logical_score=context.get("logical_score", ""),
-                        verbal_score=context.get("verbal_score", ""),
-
-                        # FIX
-                        selected_motivations=selected_motivations_for_ai,
-                    )
-                step = 5
-
-            # 5 -> 6
-            elif step == 5:
-                if not context["sjalkannedom_text"]:
-                    P = get_prompt_text("sjalkannedom", fallback="")
-                    context["sjalkannedom_text"] = _run_openai(
-                        P,
-                        style,
-                        excel_text=_trim(context["test_text"]),
-                        intervju_text=_trim(context["intervju_text"]),
-                        ratings_json=ratings_json_str,
-                        betygsskala_forklaring=betygsskala_prompt,
-                        uploaded_files=_trim(
-                            context.get("uploaded_files_markdown")
-                            or context.get("uploaded_files_text", "")
-                        ),
-                        candidate_name=context["candidate_name"],
-                        candidate_role=context["candidate_role"],
-                        candidate_first_name=context["candidate_first_name"],
-                        candidate_last_name=context["candidate_last_name"],
-                        motivation_notes=context.get("motivation_notes", ""),
-                        logical_score=context.get("logical_score", ""),
-                        verbal_score=context.get("verbal_score", ""),
-
-                        # FIX
-                        selected_motivations=selected_motivations_for_ai,
-                    )
-                step = 6
-
-            # 6 -> 7
-            elif step == 6:
-                if not context["strategi_text"]:
-                    P = get_prompt_text("strategi", fallback="")
-                    context["strategi_text"] = _run_openai(
-                        P,
-                        style,
-                        excel_text=_trim(context["test_text"]),
-                        intervju_text=_trim(context["intervju_text"]),
-                        ratings_json=ratings_json_str,
-                        betygsskala_forklaring=betygsskala_prompt,
-                        uploaded_files=_trim(
-                            context.get("uploaded_files_markdown")
-                            or context.get("uploaded_files_text", "")
-                        ),
-                        candidate_name=context["candidate_name"],
-                        candidate_role=context["candidate_role"],
-                        candidate_first_name=context["candidate_first_name"],
-                        candidate_last_name=context["candidate_last_name"],
-                        motivation_notes=context.get("motivation_notes", ""),
-                        logical_score=context.get("logical_score", ""),
-                        verbal_score=context.get("verbal_score", ""),
-
-                        # FIX
-                        selected_motivations=selected_motivations_for_ai,
-                    )
-                step = 7
-
-            # 7 -> 8
-            elif step == 7:
-                if not context["kommunikation_text"]:
-                    P = get_prompt_text("kommunikation", fallback="")
-                    context["kommunikation_text"] = _run_openai(
-                        P,
-                        style,
-                        excel_text=_trim(context["test_text"]),
-                        intervju_text=_trim(context["intervju_text"]),
-                        ratings_json=ratings_json_str,
-                        betygsskala_forklaring=betygsskala_prompt,
-                        uploaded_files=_trim(
-                            context.get("uploaded_files_markdown")
-                            or context.get("uploaded_files_text", "")
-                        ),
-                        candidate_name=context["candidate_name"],
-                        candidate_role=context["candidate_role"],
-                        candidate_first_name=context["candidate_first_name"],
-                        candidate_last_name=context["candidate_last_name"],
-                        motivation_notes=context.get("motivation_notes", ""),
-                        logical_score=context.get("logical_score", ""),
-                        verbal_score=context.get("verbal_score", ""),
-
-                        # FIX
-                        selected_motivations=selected_motivations_for_ai,
-                    )
-                step = 8
-
-            # 8 -> 9
-            elif step == 8:
-                if not (context.get("sur_text") or "").strip():
-                    P = get_prompt_text("styrkor_utveckling_risk", fallback="")
-                    context["sur_text"] = _run_openai(
-                        P,
-                        style,
-                        tq_fardighet_text=context["tq_fardighet_text"],
-                        tq_motivation_text=context["tq_motivation_text"],
-                        leda_text=context["leda_text"],
-                        mod_text=context["mod_text"],
-                        sjalkannedom_text=context["sjalkannedom_text"],
-                        strategi_text=context["strategi_text"],
-                        kommunikation_text=context["kommunikation_text"],
-                        uploaded_files=_trim(
-                            context.get("uploaded_files_markdown")
-                            or context.get("uploaded_files_text", "")
-                        ),
-                        candidate_name=context["candidate_name"],
-                        candidate_role=context["candidate_role"],
-                        candidate_first_name=context["candidate_first_name"],
-                        candidate_last_name=context["candidate_last_name"],
-                        motivation_notes=context.get("motivation_notes", ""),
-                        logical_score=context.get("logical_score", ""),
-                        verbal_score=context.get("verbal_score", ""),
-
-                        # FIX
-                        selected_motivations=selected_motivations_for_ai,
-                    )
-                step = 9
-
-            # 9 -> 10
-            elif step == 9:
-
-                if request.method == "POST":
-                    pass
-
-                if not context["slutsats_text"]:
-                    P = get_prompt_text("sammanfattande_slutsats", fallback="")
-                    context["slutsats_text"] = _run_openai(
-                        P,
-                        style,
-                        sur_text=context["sur_text"],
-                        tq_fardighet_text=context["tq_fardighet_text"],
-                        tq_motivation_text=context["tq_motivation_text"],
-                        leda_text=context["leda_text"],
-                        mod_text=context["mod_text"],
-                        sjalkannedom_text=context["sjalkannedom_text"],
-                        strategi_text=context["strategi_text"],
-                        kommunikation_text=context["kommunikation_text"],
-                        uploaded_files=_trim(
-                            context.get("uploaded_files_markdown")
-                            or context.get("uploaded_files_text", "")
-                        ),
-                        candidate_name=context["candidate_name"],
-                        candidate_role=context["candidate_role"],
-                        candidate_first_name=context["candidate_first_name"],
-                        candidate_last_name=context["candidate_last_name"],
-                        motivation_notes=context.get("motivation_notes", ""),
-                        logical_score=context.get("logical_score", ""),
-                        verbal_score=context.get("verbal_score", ""),
-
-                        # FIX
-                        selected_motivations=selected_motivations_for_ai,
-                    )
-                step = 10
+                    _run_section_into(context, key, payload)
+                step += 1
 
             # 10 -> 11
             elif step == 10:
@@ -2518,6 +2479,13 @@ def index(request):
     # uppdatera step i context efter POST-logik
     context["step"] = step
 
+    # Skrivs texten för detta steg fortfarande i bakgrunden? Då pollar sidan.
+    shown_key = DISPLAY_STEP_SECTIONS.get(step)
+    context["pending_section"] = ""
+    if shown_key and report_id and not (context.get(shown_key) or "").strip():
+        if section_pending(report_id, shown_key):
+            context["pending_section"] = shown_key
+
     # 🔹 Bygg lista med fulla objekt för de valda motivationsfaktorerna
     selected_motivation_keys = context.get("selected_motivation_keys") or \
                               request.session.get("selected_motivation_keys", [])
@@ -2571,23 +2539,24 @@ def index(request):
 
         request.session[sidebar_key] = sidebar_session.id
 
+    chat_stream.finish_stale_replies(sidebar_session.id)
     sidebar_messages = ChatMessage.objects.filter(
         session=sidebar_session
     ).order_by("created_at")
 
     context["sidebar_session_id"] = sidebar_session.id
+    context["chat_sse_enabled"] = settings.ASGI_ENABLED
     context["sidebar_messages"] = sidebar_messages
 
     # Bygg context som skickas till AI i sidopanelen
-    active_set = get_active_prompt_set()
     ratings_json_for_sidebar = context.get("ratings_json", ratings_json_str or "")
     sidebar_ctx = _build_sidebar_context(
-        prompt_set=active_set,
         step=context["step"],
         context=context,
         ratings_json_str=ratings_json_for_sidebar,
     )
-    context["sidebar_context_json"] = json.dumps(sidebar_ctx, ensure_ascii=False)
+    context["sidebar_context_key"] = _store_sidebar_context(request.user.id, report_id, sidebar_ctx)
+    context["sidebar_context_field"] = _sidebar_context_field(sidebar_ctx)
 
     # ---------- 5) Förbered HTML-versioner till sammanställningen ----------
     context["tq_fardighet_html"]   = _markdown_to_html(context.get("tq_fardighet_text", ""))
@@ -2648,7 +2617,7 @@ def index(request):
         print("leda_image length:", len(request.POST.get("leda_image", "")))
         print("mod_image length:", len(request.POST.get("mod_image", "")))
 
-        _save_report_state(rep, context)
+        _save_report_state(rep, context, request.user, edited_key)
 
     # Skicka med report_id till templaten så den kan POST:as vidare
     context["report_id"] = report_id
@@ -2659,40 +2628,15 @@ def index(request):
 
 
 # ====== CHAT HELPERS =========================================================
-import chardet
-from docx import Document
-from PyPDF2 import PdfReader
-
 MAX_FILE_TEXT = 15000  # tecken; vi trimmar för att inte spränga tokens
 
-def _read_file_text(django_file) -> str:
-    name = django_file.name.lower()
-    try:
-        # se till att vi läser från början
-        if hasattr(django_file, "open"):
-            django_file.open(mode="rb")
-        try:
-            django_file.seek(0)
-        except Exception:
-            pass
-
-        if name.endswith(".pdf"):
-            reader = PdfReader(django_file)
-            text = "\n".join((page.extract_text() or "") for page in reader.pages)
-        elif name.endswith(".docx"):
-            doc = Document(django_file)
-            text = "\n".join(p.text for p in doc.paragraphs)
-        elif name.endswith((".txt", ".csv", ".md", ".json", ".py", ".html")):
-            data = django_file.read()
-            enc = chardet.detect(data).get("encoding") or "utf-8"
-            text = data.decode(enc, errors="ignore")
-        else:
-            text = ""
-
-        # CRUCIAL för Postgres: inga NUL-tecken i TextField
-        return (text or "").replace("\x00", "")
-    except Exception:
-        return ""
+def _read_file_text(django_file, max_chars: int | None = None) -> str:
+    """
+    Text ur PDF/DOCX/textfil (se utils/file_text.py). Med max_chars läses bara
+    så mycket som behövs för _trim/_trim_middle med samma budget.
+    Samma filinnehåll parsas bara en gång (utils/extraction_cache.py).
+    """
+    return extraction_cache.extract(django_file, max_chars).text
 
 def _trim_middle(s: str, max_chars: int = MAX_FILE_TEXT) -> str:
     s = s or ""
@@ -2701,11 +2645,156 @@ def _trim_middle(s: str, max_chars: int = MAX_FILE_TEXT) -> str:
     return s[: max_chars//2] + "\n...\n" + s[- max_chars//2 :]
 
 def _build_openai_messages(session):
-    """Konstruera historiken som OpenAI-meddelanden."""
-    msgs = [{"role":"system","content": session.system_prompt}]
-    for m in session.messages.order_by("created_at"):
-        msgs.append({"role": m.role, "content": m.content})
-    return msgs
+    """
+    Konstruera historiken som OpenAI-meddelanden: systemprompten + de senaste
+    meddelandena inom CHAT_HISTORY_TOKEN_BUDGET (se utils/chat_history.py).
+    """
+    return chat_history.build_history(session)
+
+def _save_chat_attachments(user_msg, files) -> list:
+    """
+    Sparar bilagor till ett user-meddelande och returnerar textutdragen
+    (de skickas bara med i prompten, inte i user_msg.content).
+    """
+    file_texts = []
+    for f in files:
+        att = ChatAttachment(message=user_msg, original_name=f.name)
+        att.file.save(f.name, f, save=False)
+        extraction = extraction_cache.extract(att.file, MAX_FILE_TEXT)
+        att.extraction = extraction if extraction.pk else None
+        att.text_excerpt = _trim_middle(extraction.text, MAX_FILE_TEXT)
+        att.save()
+        if att.text_excerpt:
+            file_texts.append(f"\n--- \nFIL: {att.original_name}\n{att.text_excerpt}")
+    return file_texts
+
+def _with_file_texts(content: str, file_texts: list) -> str:
+    if not file_texts:
+        return content
+    return content + "\n\n(Bifogade filer – textutdrag, visas ej för användaren)" + "".join(file_texts)
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Sidopanelens kontext (kandidat, test/intervju/CV, aktuell sektion + prompt).
+# Byggs och renderas en gång när steget visas och sparas i cachen under
+# (användare, rapport, steg, versionshash). Chatten skickar bara nyckeln
+# + texten i stegets textruta (den kan vara ändrad men osparad).
+# ──────────────────────────────────────────────────────────────────────────────
+SIDEBAR_CURRENT_TEXT = "\x00AKTUELL_TEXT\x00"  # ersätts med textrutans innehåll per anrop
+
+
+def _sidebar_cache_key(user_id, key: str) -> str:
+    return f"sidebar_ctx:{user_id}:{key}"
+
+
+def _store_sidebar_context(user_id, report_id, sidebar_ctx: dict) -> str:
+    """
+    Renderar systemmeddelandet för sidopanelen och cachar det.
+    Returnerar nyckeln ("<rapport>:<steg>:<hash>") som sidan skickar med chatten.
+    """
+    raw = json.dumps(sidebar_ctx, ensure_ascii=False, sort_keys=True)
+    version = hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+    key = f"{report_id or 'ny'}:{sidebar_ctx.get('step')}:{version}"
+
+    cache_key = _sidebar_cache_key(user_id, key)
+    if cache.get(cache_key) is None:
+        cache.set(cache_key, _sidebar_context_entry(sidebar_ctx), settings.SIDEBAR_CONTEXT_TTL)
+    return key
+
+
+def _sidebar_context_entry(sidebar_ctx: dict) -> dict:
+    """Det renderade systemmeddelandet (med platshållare för aktuell text) + texten."""
+    sections = sidebar_ctx.get("sections") or []
+    current_text = sections[0].get("current_text", "") if sections else ""
+    template_ctx = dict(
+        sidebar_ctx,
+        sections=[dict(sec, current_text=SIDEBAR_CURRENT_TEXT) for sec in sections],
+    )
+    return {"message": _build_sidebar_context_message(template_ctx), "current_text": current_text}
+
+
+def _rebuild_sidebar_context(user_id, key: str):
+    """
+    Cachen är per process (och har TTL) – en chattfråga som hamnar i en annan
+    worker, efter omstart eller efter TTL hittar inte nyckeln. Bygg då om
+    kontexten från den sparade rapporten och steget i nyckeln.
+    """
+    try:
+        report_part, step_part, _ = key.split(":", 2)
+        report_id, step = uuid.UUID(report_part), int(step_part)
+    except ValueError:
+        return None  # "ny:..." – rapporten var inte sparad, inget att bygga från
+    data = (
+        Report.objects.filter(id=report_id, deleted_at__isnull=True)
+        .values_list("data", flat=True)
+        .first()
+    )
+    if data is None:
+        return None
+
+    sidebar_ctx = _build_sidebar_context(step=step, context=data, ratings_json_str=data.get("ratings_json", ""))
+    entry = _sidebar_context_entry(sidebar_ctx)
+    cache.set(_sidebar_cache_key(user_id, key), entry, settings.SIDEBAR_CONTEXT_TTL)
+    return entry
+
+
+def _sidebar_context_field(sidebar_ctx: dict) -> str:
+    """Namnet på textrutan vars innehåll chatten skickar med (aktuell sektion)."""
+    sections = sidebar_ctx.get("sections") or []
+    return sections[0].get("field_key", "") if sections else ""
+
+
+def _insert_sidebar_context(messages: list, user_id, data) -> list:
+    """
+    Lägger in verktygets kontext efter grund-systemprompten.
+    data = request.POST: sidebar_context_key (+ sidebar_current_text), eller –
+    från sidor laddade före serverlagringen – hela kontexten som json i sidebar_context.
+    """
+    ctx_text = ""
+    key = data.get("sidebar_context_key")
+    if key:
+        entry = cache.get(_sidebar_cache_key(user_id, key)) or _rebuild_sidebar_context(user_id, key)
+        if entry:
+            current_text = data.get("sidebar_current_text")
+            if current_text is None:
+                current_text = entry["current_text"]
+            ctx_text = entry["message"].replace(SIDEBAR_CURRENT_TEXT, _trim(current_text, 1200))
+
+    elif data.get("sidebar_context"):
+        try:
+            sidebar_ctx = json.loads(data["sidebar_context"])
+        except Exception:
+            sidebar_ctx = None
+        if sidebar_ctx:
+            ctx_text = _build_sidebar_context_message(sidebar_ctx)
+
+    if ctx_text:
+        messages.insert(1, {"role": "system", "content": ctx_text})
+    return messages
+
+def _sidebar_user_content(message: str, context_blob: str) -> str:
+    """Lägger in texten från aktuellt steg snyggt innan användarens text."""
+    if not context_blob:
+        return message
+    return (
+        "Du är en assistent som hjälper användaren att förbättra texten i ett verktyg.\n"
+        "Nedanför finns den text som hör till det steg användaren jobbar i just nu.\n"
+        "När användaren skriver saker som 'den här texten', 'det här stycket' etc, "
+        "så syftar de på texten nedan.\n\n"
+        "=== AKTUELL TEXT I VERKTYGET ===\n"
+        f"{context_blob}\n\n"
+        "=== ANVÄNDARENS MEDDELANDE ===\n"
+        f"{message}"
+    )
+
+def _chunk_text(chunk) -> str:
+    """Plockar ut texten ur en streamad chunk från OpenAI (dict eller objekt)."""
+    try:
+        delta = chunk.choices[0].delta
+        if isinstance(delta, dict):
+            return delta.get("content") or ""
+        return getattr(delta, "content", "") or ""
+    except Exception:
+        return ""
 
 # ====== CHAT VIEWS ===========================================================
 from django.contrib.auth.decorators import login_required
@@ -2738,7 +2827,7 @@ def chat_session(request, session_id):
     if request.method == "POST" and "save_settings" in request.POST:
         session.title = request.POST.get("title") or session.title
         session.system_prompt = request.POST.get("system_prompt") or session.system_prompt
-        session.save()
+        session.save(update_fields=["title", "system_prompt", "updated_at"])
         return redirect("chat_session", session_id=session.id)
 
     # skicka meddelande
@@ -2749,26 +2838,14 @@ def chat_session(request, session_id):
             user_msg = ChatMessage.objects.create(session=session, role="user", content=user_text)
 
             # 2) Spara bilagor + extrahera text (men skriv inte in den i user_msg.content)
-            file_texts = []
-            for f in request.FILES.getlist("files"):
-                att = ChatAttachment(message=user_msg, original_name=f.name)
-                att.file.save(f.name, f, save=False)  # spara originalfilen
-                att_text = _read_file_text(att.file)  # extrahera text
-                att.text_excerpt = _trim_middle(att_text, MAX_FILE_TEXT)
-                att.save()
-
-                # bygg endast ett "osynligt" prompt-tillägg till AI (inte till UI)
-                if att.text_excerpt:
-                    file_texts.append(f"\n--- \nFIL: {att.original_name}\n{att.text_excerpt}")
+            file_texts = _save_chat_attachments(user_msg, request.FILES.getlist("files"))
 
             # 3) Bygg prompt till OpenAI: ersätt sista user-meddelandet med en version
             #    som inkluderar filtexter, men utan att ändra vad som sparas i DB/UI
             try:
                 messages = _build_openai_messages(session)
-                combined = user_msg.content
-                if file_texts:
-                    combined += "\n\n(Bifogade filer – textutdrag, visas ej för användaren)" + "".join(file_texts)
-                messages[-1]["content"] = combined  # endast för anropet, ej sparat i DB
+                # endast för anropet, ej sparat i DB
+                messages[-1]["content"] = _with_file_texts(user_msg.content, file_texts)
 
                 resp = client.chat.completions.create(
                     model="gpt-4o-mini",
@@ -2782,9 +2859,12 @@ def chat_session(request, session_id):
 
             # 4) Spara AI-svaret och bumpa sessionen
             ChatMessage.objects.create(session=session, role="assistant", content=ai_text)
-            session.save()
+            # bara updated_at – sammanfattningen kan ha uppdaterats i bakgrunden
+            session.save(update_fields=["updated_at"])
+            chat_history.schedule_summary_refresh(session)
             return redirect("chat_session", session_id=session.id)
 
+    chat_stream.finish_stale_replies(session.id)
     messages = session.messages.order_by("created_at")
     sessions = ChatSession.objects.filter(user=request.user).order_by("-updated_at")[:20]
     return render(
@@ -2853,99 +2933,86 @@ def chat_send(request, session_id):
     """
     session = get_object_or_404(ChatSession, id=session_id, user=request.user)
     if request.method != "POST":
-        return StreamingHttpResponse(
-            iter(["Only POST allowed"]),
-            content_type="text/plain; charset=utf-8",
-            status=405
-        )
+        return _chat_stream_response(iter(["Only POST allowed"]), status=405)
+
+    messages = _chat_turn_messages(request, session)
+    if messages is None:
+        return _chat_stream_response(iter([""]))
+
+    return _chat_stream_response(_stream_chat_reply(session, messages, max_tokens=1200))
+
 
+def _chat_turn_messages(request, session):
+    """
+    Sparar användarens meddelande (+ bilagor) och bygger prompten till OpenAI.
+    None om varken text eller filer skickades.
+    """
     user_text = (request.POST.get("message") or "").strip()
     if not user_text and not request.FILES:
-        resp = StreamingHttpResponse(
-            iter([""]),
-            content_type="text/plain; charset=utf-8",
-            status=200
-        )
-        resp["Cache-Control"] = "no-cache"
-        resp["X-Accel-Buffering"] = "no"
-        return resp
+        return None
 
     # 1) Spara user-meddelande (utan filutdrag i content)
     user_msg = ChatMessage.objects.create(session=session, role="user", content=user_text)
 
     # 2) Filer -> extrahera text -> endast för prompten
-    file_texts = []
-    for f in request.FILES.getlist("files"):
-        att = ChatAttachment(message=user_msg, original_name=f.name)
-        att.file.save(f.name, f, save=False)
-        att_text = _read_file_text(att.file)
-        att.text_excerpt = _trim_middle(att_text, MAX_FILE_TEXT)
-        att.save()
-        if att.text_excerpt:
-            file_texts.append(f"\n--- \nFIL: {att.original_name}\n{att.text_excerpt}")
+    file_texts = _save_chat_attachments(user_msg, request.FILES.getlist("files"))
 
     # 3) Historik + ersätt sista user content med dold filtext (endast i prompten)
     messages = _build_openai_messages(session)
 
     # 🧠 Lägg till extra context från verktyget om det skickats med
-    sidebar_ctx_raw = request.POST.get("sidebar_context")
-    if sidebar_ctx_raw:
-        try:
-            sidebar_ctx = json.loads(sidebar_ctx_raw)
-        except Exception:
-            sidebar_ctx = None
+    _insert_sidebar_context(messages, request.user.id, request.POST)
 
-        if sidebar_ctx:
-            ctx_text = _build_sidebar_context_message(sidebar_ctx)
-            # Lägg in efter grund-systemprompten så att den alltid finns med
-            messages.insert(1, {"role": "system", "content": ctx_text})
+    messages[-1]["content"] = _with_file_texts(user_msg.content, file_texts)
+    return messages
 
-    combined = user_msg.content
-    if file_texts:
-        combined += "\n\n(Bifogade filer – textutdrag, visas ej för användaren)" + "".join(file_texts)
-    messages[-1]["content"] = combined
 
-    def token_stream():
-        pieces = []
-
-        try:
-            stream = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=messages,
-                temperature=0.3,
-                max_tokens=1200,
-                stream=True,
-            )
-            for chunk in stream:
-                piece = ""
-                try:
-                    delta = chunk.choices[0].delta
-                    if isinstance(delta, dict):
-                        piece = delta.get("content") or ""
-                    else:
-                        piece = getattr(delta, "content", "") or ""
-                except Exception:
-                    piece = ""
-
-                if piece:
-                    pieces.append(piece)
-                    yield piece
-
-        except Exception as e:
-            err = f"\n\n(Ett fel inträffade vid AI-anropet: {e})"
-            pieces.append(err)
-            yield err
-        finally:
-            ai_text = "".join(pieces).strip()
-            ChatMessage.objects.create(session=session, role="assistant", content=ai_text)
-            session.save()
-
-    resp = StreamingHttpResponse(token_stream(), content_type="text/plain; charset=utf-8")
+def _chat_stream_response(body, status=200):
+    resp = StreamingHttpResponse(body, content_type="text/plain; charset=utf-8", status=status)
     resp["Cache-Control"] = "no-cache"
     resp["X-Accel-Buffering"] = "no"
     return resp
 
 
+def _stream_chat_reply(session, messages, max_tokens):
+    """
+    Streamar AI-svaret bit för bit. Assistant-meddelandet skapas direkt och
+    sparas i omgångar under strömmen (chat_stream.ReplyWriter), färdigt även vid fel/avbrott.
+    """
+    writer = chat_stream.ReplyWriter(session)
+    writer.open()
+
+    try:
+        stream = client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=messages,
+            temperature=0.3,
+            max_tokens=max_tokens,
+            stream=True,
+        )
+        for chunk in stream:
+            piece = _chunk_text(chunk)
+            if piece:
+                if writer.add(piece):
+                    writer.flush()
+                yield piece
+
+    except Exception as e:
+        err = f"\n\n(Ett fel inträffade vid AI-anropet: {e})"
+        writer.add(err)
+        yield err
+    finally:
+        writer.finish()
+
+
+def _wants_stream(request) -> bool:
+    """stream=1 i POST eller Accept: text/plain / text/event-stream."""
+    if request.POST.get("stream") in ("1", "true", "True"):
+        return True
+    accept = request.headers.get("Accept", "")
+    return "text/plain" in accept or "text/event-stream" in accept
+
+
 @require_POST
 @login_required
 @csrf_exempt
@@ -2956,7 +3023,8 @@ def sidebar_chat(request):
       - session_id
       - message
       - context  (texten i nuvarande steg / textarea)
-    Returnerar JSON: {"reply": "..."}
+      - stream   (valfri, "1": streama svaret som text/plain, som chat_send)
+    Returnerar annars JSON: {"reply": "..."}
     """
     session_id = request.POST.get("session_id")
     message = (request.POST.get("message") or "").strip()
@@ -2973,23 +3041,13 @@ def sidebar_chat(request):
     # 2) Bygg historik för OpenAI
     messages = _build_openai_messages(session)
 
-    # Lägg in kontexten snyggt innan användarens text
-    combined = message
-    if context_blob:
-        combined = (
-            "Du är en assistent som hjälper användaren att förbättra texten i ett verktyg.\n"
-            "Nedanför finns den text som hör till det steg användaren jobbar i just nu.\n"
-            "När användaren skriver saker som 'den här texten', 'det här stycket' etc, "
-            "så syftar de på texten nedan.\n\n"
-            "=== AKTUELL TEXT I VERKTYGET ===\n"
-            f"{context_blob}\n\n"
-            "=== ANVÄNDARENS MEDDELANDE ===\n"
-            f"{message}"
-        )
+    # Lägg in kontexten snyggt innan användarens text (endast i prompten)
+    messages[-1]["content"] = _sidebar_user_content(message, context_blob)
 
-    messages.append({"role": "user", "content": combined})
+    # 3) Anropa OpenAI – streamat om klienten vill, svaret sparas när strömmen är slut
+    if _wants_stream(request):
+        return _chat_stream_response(_stream_chat_reply(session, messages, max_tokens=800))
 
-    # 3) Anropa OpenAI
     try:
         resp = client.chat.completions.create(
             model="gpt-4o-mini",
@@ -3003,7 +3061,8 @@ def sidebar_chat(request):
 
     # 4) Spara AI-svaret
     ChatMessage.objects.create(session=session, role="assistant", content=reply)
-    session.save()
+    session.save(update_fields=["updated_at"])
+    chat_history.schedule_summary_refresh(session)
 
     return JsonResponse({"reply": reply})
 
@@ -3017,13 +3076,122 @@ def chat_delete(request, session_id):
 
 @login_required
 def report_list(request):
+    try:
+        reports, next_cursor = _report_list_page(request.GET.get("cursor"))
+    except pagination.InvalidCursor:
+        return redirect("report_list")
+    return render(request, "report_list.html", {"reports": reports, "next_cursor": next_cursor})
+
+
+@login_required
+def report_list_page(request):
+    """
+    JSON för oändlig scroll i rapportlistan: nästa sida efter ?cursor=
+    {"html": <rapportkort>, "next_cursor": "..." eller null}
+    """
+    try:
+        reports, next_cursor = _report_list_page(request.GET.get("cursor"))
+    except pagination.InvalidCursor:
+        return JsonResponse({"error": "Ogiltig markör"}, status=400)
+    html = render_to_string("report_cards.html", {"reports": reports}, request=request)
+    return JsonResponse({"html": html, "next_cursor": next_cursor})
+
+
+def _report_list_page(cursor):
+    """En sida rapporter, utan data-fältet (listan visar bara titel, skapare och tider)."""
     reports = (
         Report.objects
         .filter(deleted_at__isnull=True)
         .select_related("created_by")
-        .order_by("-updated_at")
+        .only(
+            "id", "title", "updated_at",
+            "created_by__username", "created_by__first_name", "created_by__last_name",
+        )
     )
-    return render(request, "report_list.html", {"reports": reports})
+    return pagination.keyset_page(reports, cursor, settings.REPORT_LIST_PAGE_SIZE)
+
+
+@login_required
+def search(request):
+    """
+    GET ?q=...&kind=report|message&page=N -> rankade träffar bland rapporterna och
+    användarens egna chattmeddelanden (utils/search_index.py), som JSON.
+    """
+    q = (request.GET.get("q") or "").strip()
+    try:
+        page = int(request.GET.get("page") or 1)
+    except ValueError:
+        page = 1
+    result = search_index.search(q, request.user.id, kind=request.GET.get("kind"), page=page)
+    return JsonResponse({"q": q, **result})
+
+
+@login_required
+@require_POST
+def report_batch_upload(request):
+    """
+    Batchläge för en testdag: en Excel med en kandidat per rad blir en rapport per
+    kandidat med namn, roll och betyg ifyllda. Alla sektioner köas direkt och skrivs
+    parallellt i bakgrunden utifrån testdatan (och ev. jobbannons); intervju och CV
+    läggs sedan till per rapport via Redigera.
+    """
+    upload = request.FILES.get("excel")
+    if not upload:
+        messages.error(request, "Ladda upp en Excelfil.")
+        return redirect("report_list")
+
+    try:
+        candidates = _read_excel_candidates(upload)
+    except Exception as e:
+        messages.error(request, "Kunde inte läsa excelfilen: " + str(e)[:400])
+        return redirect("report_list")
+
+    if not candidates:
+        messages.error(request, "Hittade inga kandidater i excelfilen (förnamn/efternamn i kolumn 1–2).")
+        return redirect("report_list")
+
+    role = (request.POST.get("candidate_role") or "").strip()
+    job_ad_text = ""
+    job_ad_file = request.FILES.get("job_ad_pdf")
+    if job_ad_file:
+        job_ad_text = _trim(_read_file_text(job_ad_file, 6500), 6500).strip()
+
+    reports = []
+    for first, last, excel_text, ratings in candidates:
+        ctx = {
+            "candidate_first_name": first,
+            "candidate_last_name": last,
+            "candidate_name": f"{first} {last}".strip(),
+            "candidate_role": role,
+            "job_ad_text": job_ad_text,
+            "test_text": excel_text,
+            "ratings_json": json.dumps(ratings, ensure_ascii=False),
+        }
+        reports.append(Report(
+            created_by=request.user,
+            current_step=2,
+            title=_report_title_from_context(ctx),
+            data=_extract_report_data_from_context(ctx),
+        ))
+    # bulk_create skickar ingen post_save – historik och sökindex fylls i här
+    with transaction.atomic():
+        Report.objects.bulk_create(reports)
+        report_revisions.record_created(reports, request.user)
+    for rep in reports:
+        search_index.index_report(rep.id)
+
+    prompts = get_prompts()
+    style = prompts.get("global_style", getattr(settings, "STYLE_INSTRUCTION", ""))
+    betygsskala_prompt = prompts.get("betygsskala_forklaring", "")
+    for rep in reports:
+        payload = _section_payload(rep.data, style, betygsskala_prompt, rep.data["ratings_json"], [])
+        schedule_report_generation(rep.id, rep.data, payload)
+
+    messages.success(
+        request,
+        f"Skapade {len(reports)} rapporter – texterna skrivs nu i bakgrunden.",
+    )
+    return redirect("report_list")
 
 
 @login_required
@@ -3111,25 +3279,130 @@ def report_delete(request, report_id):
 
 
 @login_required
-def report_download(request, report_id):
+def report_jobs(request, report_id):
+    """
+    Status för AI-genereringen av en rapport – wizarden pollar denna
+    medan en text fortfarande skrivs i bakgrunden.
+    """
     rep = _get_report_or_404(report_id)
-    data = rep.data or {}
+    return JsonResponse({"sections": section_statuses(rep.id)})
+
+
+@login_required
+@require_POST
+def report_section_generate(request, report_id, key):
+    """
+    Skriver om en enskild sektion från den sparade rapporten (går förbi AI-cachen)
+    och sparar den nya texten. Returnerar JSON: {"key": ..., "text": ...}
+    """
+    if key not in SECTION_PROMPTS:
+        return JsonResponse({"error": "Okänd sektion"}, status=404)
+
+    rep = _get_report_or_404(report_id)
+    payload = _section_payload_for_report(rep)
+
+    text = _run_section(key, payload, rep.data or {}, regenerate=True)
+    if text == SECTION_ERROR_TEXT:
+        return JsonResponse({"error": text}, status=502)
+
+    store_section_text(rep.id, key, text, overwrite=True, user=request.user)
+    return JsonResponse({"key": key, "text": text})
+
+
+@login_required
+def report_revision_list(request, report_id):
+    """Versionshistoriken för en rapport: {"revisions": [{number, created_at, created_by, changed, removed}]}"""
+    rep = _get_report_or_404(report_id)
+    return JsonResponse({"revisions": report_revisions.history(rep.id)})
+
+
+@login_required
+def report_revision_detail(request, report_id, number):
+    """Rapportdata som den såg ut i version number: {"number": ..., "data": {...}}"""
+    rep = _get_report_or_404(report_id)
+    try:
+        data = report_revisions.data_at(rep.id, number)
+    except report_revisions.RevisionNotFound:
+        return JsonResponse({"error": "Versionen finns inte"}, status=404)
+    return JsonResponse({"number": number, "data": data})
+
+
+@login_required
+def report_revision_diff(request, report_id):
+    """
+    Skillnaden mellan två versioner, ?from=<nr>&to=<nr> (to = senaste om den saknas).
+    {"from", "to", "added": {...}, "removed": {...}, "changed": {nyckel: {"before", "after"}}}
+    """
+    rep = _get_report_or_404(report_id)
+    latest = rep.revisions.order_by("-number").values_list("number", flat=True).first()
+    try:
+        a = int(request.GET.get("from", ""))
+        b = int(request.GET.get("to") or latest or 0)
+    except ValueError:
+        return JsonResponse({"error": "from och to ska vara versionsnummer"}, status=400)
+    try:
+        return JsonResponse(report_revisions.compare(rep.id, a, b))
+    except report_revisions.RevisionNotFound:
+        return JsonResponse({"error": "Versionen finns inte"}, status=404)
 
-    context = data.copy()
-    context["candidate_name"] = context.get("candidate_name", "")
+
+@login_required
+def report_download(request, report_id):
+    rep = _get_report_or_404(report_id)
 
     # ✅ Prioritera POST (bilder skickade från report_open), annars fallback
-    leda_image_data = request.POST.get("leda_image") or data.get("leda_image", "")
-    mod_image_data = request.POST.get("mod_image") or data.get("mod_image", "")
-    sjalkannedom_image_data = request.POST.get("sjalkannedom_image") or data.get("sjalkannedom_image", "")
-    strategi_image_data = request.POST.get("strategi_image") or data.get("strategi_image", "")
-    kommunikation_image_data = request.POST.get("kommunikation_image") or data.get("kommunikation_image", "")
+    doc, filename = _report_docx_from_data(rep.data or {}, request.POST)
+    return _docx_file_response(doc, filename)
 
-    from django.http import HttpResponse
-    from docx import Document
 
-    template_path = os.path.join(settings.BASE_DIR, "reports", "domarnamnden_template.docx")
-    doc = Document(template_path)
+@login_required
+@require_POST
+def report_bulk_export(request):
+    """
+    ZIP med en DOCX per rapport. Urval: markerade rapporter (report_ids),
+    datumintervall (date_from/date_to) och/eller skapare (created_by).
+    """
+    ids = request.POST.getlist("report_ids")
+    try:
+        date_from = parse_date(request.POST.get("date_from") or "")
+        date_to = parse_date(request.POST.get("date_to") or "")
+    except ValueError:
+        messages.error(request, "Ogiltigt datum.")
+        return redirect("report_list")
+    created_by = (request.POST.get("created_by") or "").strip()
+
+    if not (ids or date_from or date_to or created_by):
+        messages.error(request, "Välj rapporter eller ett datumintervall att exportera.")
+        return redirect("report_list")
+
+    reports = bulk_export.select_reports(ids, date_from, date_to, created_by)
+    count = reports.count()
+    if not count:
+        messages.error(request, "Inga rapporter matchade urvalet.")
+        return redirect("report_list")
+    if count > settings.BULK_EXPORT_MAX_REPORTS:
+        messages.error(
+            request,
+            f"Urvalet innehåller {count} rapporter – max {settings.BULK_EXPORT_MAX_REPORTS} per export. "
+            "Använd manage.py export_reports för större uttag.",
+        )
+        return redirect("report_list")
+
+    response = StreamingHttpResponse(bulk_export.iter_report_zip(reports), content_type="application/zip")
+    response["Content-Disposition"] = f'attachment; filename="rapporter_{timezone.localdate():%Y-%m-%d}.zip"'
+    return response
+
+
+def _report_docx_from_data(data: dict, overrides=None):
+    """
+    Bygger Word-dokumentet för en sparad rapport (Report.data).
+    Returnerar (doc, filnamn). Används av report_download och bulkexporten.
+    """
+    overrides = overrides or {}
+    context = data.copy()
+    context["candidate_name"] = context.get("candidate_name", "")
+
+    images = {k: overrides.get(k) or data.get(k, "") for k in REPORT_IMAGE_KEYS}
 
     # motivations-text
     selected_motivation_keys = data.get("selected_motivation_keys", []) or []
@@ -3141,51 +3414,12 @@ def report_download(request, report_id):
         motivation_lines.append(f"{m['label']}\n{m['definition']}".strip())
     selected_motivations_text = "\n\n".join(motivation_lines)
 
-    mapping = {
-        "{candidate_name}": context.get("candidate_name", ""),
-        "{candidate_first_name}": context.get("candidate_first_name", ""),
-        "{candidate_last_name}": context.get("candidate_last_name", ""),
-        "{candidate_role}": context.get("candidate_role", ""),
-        "{tq_fardighet_text}": html_to_text(context.get("tq_fardighet_text", "")),
-        "{sur_text}": html_to_text(context.get("sur_text", "")),
-        "{tq_motivation_text}": html_to_text(context.get("tq_motivation_text", "")),
-        "{leda_text}": html_to_text(context.get("leda_text", "")),
-        "{mod_text}": html_to_text(context.get("mod_text", "")),
-        "{sjalkannedom_text}": html_to_text(context.get("sjalkannedom_text", "")),
-        "{strategi_text}": html_to_text(context.get("strategi_text", "")),
-        "{kommunikation_text}": html_to_text(context.get("kommunikation_text", "")),
-        "{selected_motivations}": selected_motivations_text,
-    }
-    docx_replace_text(doc, mapping)
-
-    ratings_json_raw = data.get("ratings_json") or ""
-    ratings_doc = {}
-    if isinstance(ratings_json_raw, dict):
-        ratings_doc = ratings_json_raw
-    elif isinstance(ratings_json_raw, str) and ratings_json_raw.strip():
-        try:
-            ratings_doc = json.loads(ratings_json_raw)
-        except Exception:
-            ratings_doc = {}
-
-    if ratings_doc:
-        replace_table_placeholder(doc, "{leda_table}", ratings_doc, "leda_utveckla_och_engagera")
-        replace_table_placeholder(doc, "{mod_table}", ratings_doc, "mod_och_handlingskraft")
-        replace_table_placeholder(doc, "{sjalkannedom_table}", ratings_doc, "sjalkannedom_och_emotionell_stabilitet")
-        replace_table_placeholder(doc, "{strategi_table}", ratings_doc, "strategiskt_tankande_och_anpassningsformaga")
-        replace_table_placeholder(doc, "{kommunikation_table}", ratings_doc, "kommunikation_och_samarbete")
-
-    # ✅ Lägg in bilder om de finns
-    replace_image_placeholder(doc, "{leda_image}", leda_image_data)
-    replace_image_placeholder(doc, "{mod_image}", mod_image_data)
-    replace_image_placeholder(doc, "{sjalkannedom_image}", sjalkannedom_image_data)
-    replace_image_placeholder(doc, "{strategi_image}", strategi_image_data)
-    replace_image_placeholder(doc, "{kommunikation_image}", kommunikation_image_data)
-
-    response = HttpResponse(
-        content_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+    doc = _build_report_docx(
+        context,
+        selected_motivations_text,
+        _parse_ratings_json(data.get("ratings_json") or ""),
+        images,
     )
+
     filename = f"{context.get('candidate_first_name','rapport')}_{context.get('candidate_last_name','rapport')}_{context.get('candidate_role','rapport')}.docx"
-    response["Content-Disposition"] = f'attachment; filename="{filename}"'
-    doc.save(response)
-    return response
+    return doc, filename
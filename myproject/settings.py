@@ -80,6 +80,11 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'myproject.wsgi.application'
+ASGI_APPLICATION = 'myproject.asgi.application'
+
+# True = kör under ASGI (uvicorn) med async-vyer för chatt/AI (myapp/async_views.py).
+# Sätts bara på dynos som kör myproject.asgi – WSGI-dynos behåller de vanliga vyerna.
+ASGI_ENABLED = os.getenv("ASGI_ENABLED", "False") == "True"
 
 
 # Database
@@ -96,6 +101,11 @@ else:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            # Rapporttexter skrivs från bakgrundstrådar – undvik "database is locked"
+            'OPTIONS': {
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': 20,
+            },
         }
     }
 
@@ -160,6 +170,83 @@ SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 
 PROMPT_OWNER_USERNAME = "veronika" 
 
+# Parallell generering av rapportsektioner (myapp/utils/generation.py)
+REPORT_GENERATION_WORKERS = int(os.getenv("REPORT_GENERATION_WORKERS", "5"))
+REPORT_GENERATION_WAIT = int(os.getenv("REPORT_GENERATION_WAIT", "25"))  # sekunder
+# "thread" = i webbprocessen, "worker" = jobbkö i databasen + manage.py run_report_worker
+REPORT_GENERATION_BACKEND = os.getenv("REPORT_GENERATION_BACKEND", "thread")
+REPORT_JOB_MAX_ATTEMPTS = int(os.getenv("REPORT_JOB_MAX_ATTEMPTS", "3"))
+
+# Cache för OpenAI-svar i _run_openai (myapp/utils/ai_cache.py)
+AI_CACHE_ENABLED = os.getenv("AI_CACHE_ENABLED", "True") == "True"
+AI_CACHE_TTL = int(os.getenv("AI_CACHE_TTL", str(30 * 24 * 3600)))  # sekunder
+AI_CACHE_MAX_ENTRIES = int(os.getenv("AI_CACHE_MAX_ENTRIES", "5000"))
+
+# Word-mallen för export – parsas en gång per process (myapp/utils/docx_template.py)
+REPORT_TEMPLATE_PATH = os.path.join(BASE_DIR, "reports", "domarnamnden_template.docx")
+# Exporten buffras i minnet upp till så här många byte, sedan i en temporär fil
+DOCX_SPOOL_MAX_SIZE = int(os.getenv("DOCX_SPOOL_MAX_SIZE", str(512 * 1024)))
+
+# Excel från testplattformen läses strömmande; max antal rader som tas med i excel_text
+EXCEL_MAX_ROWS = int(os.getenv("EXCEL_MAX_ROWS", "1000"))
+
+# Chatten skickar systemprompten + så många av de senaste meddelandena som ryms
+# i budgeten (tokens) till OpenAI (myapp/utils/chat_history.py)
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "6000"))
+# Sidopanelens kontext renderas när steget visas och hålls i cachen (sekunder)
+SIDEBAR_CONTEXT_TTL = int(os.getenv("SIDEBAR_CONTEXT_TTL", str(12 * 3600)))
+
+# Hur ofta (sekunder) varje process kollar om prompterna ändrats (myapp/utils/prompt_registry.py)
+PROMPT_REGISTRY_CHECK_SECONDS = float(os.getenv("PROMPT_REGISTRY_CHECK_SECONDS", "2"))
+
+# Löpande sammanfattning av äldre chattmeddelanden, uppdateras i bakgrunden när de
+# osammanfattade meddelandena passerar tröskeln (tokens). De senaste hålls utanför.
+CHAT_SUMMARY_ENABLED = os.getenv("CHAT_SUMMARY_ENABLED", "True") == "True"
+CHAT_SUMMARY_TRIGGER_TOKENS = int(os.getenv("CHAT_SUMMARY_TRIGGER_TOKENS", "4000"))
+CHAT_SUMMARY_KEEP_RECENT = int(os.getenv("CHAT_SUMMARY_KEEP_RECENT", "6"))
+CHAT_SUMMARY_CHUNK_TOKENS = int(os.getenv("CHAT_SUMMARY_CHUNK_TOKENS", "8000"))
+
+# Återupptagbara chattsvar via SSE (myapp/utils/chat_stream.py). Kräver ASGI_ENABLED
+# – under WSGI registreras inte SSE-vyerna och chatten streamar text/plain. Streamade svar
+# (SSE och text/plain) skrivs till databasen var CHAT_STREAM_FLUSH_TOKENS:e bit
+# från OpenAI eller efter CHAT_STREAM_FLUSH_SECONDS, det som kommer först.
+CHAT_STREAM_WORKERS = int(os.getenv("CHAT_STREAM_WORKERS", "8"))
+CHAT_STREAM_FLUSH_TOKENS = int(os.getenv("CHAT_STREAM_FLUSH_TOKENS", "20"))
+CHAT_STREAM_FLUSH_SECONDS = float(os.getenv("CHAT_STREAM_FLUSH_SECONDS", "1.0"))
+# Hur länge en SSE-anslutning väntar på att svaret ska bli klart; ofärdiga svar
+# äldre än så markeras som avbrutna (chat_stream.finish_stale_replies)
+CHAT_STREAM_MAX_SECONDS = int(os.getenv("CHAT_STREAM_MAX_SECONDS", "300"))
+
+# Textutdrag ur PDF (myapp/utils/file_text.py) – motorerna provas i tur och ordning
+PDF_TEXT_ENGINES = [e.strip() for e in os.getenv("PDF_TEXT_ENGINES", "pymupdf,pypdf2").split(",") if e.strip()]
+# Cache för textutdrag, nycklad på sha256 av filen (myapp/utils/extraction_cache.py)
+FILE_TEXT_CACHE_ENABLED = os.getenv("FILE_TEXT_CACHE_ENABLED", "True") == "True"
+FILE_TEXT_CACHE_MAX_ENTRIES = int(os.getenv("FILE_TEXT_CACHE_MAX_ENTRIES", "2000"))
+
+# Rapportlistan visas i sidor om så här många (keyset-paginering, myapp/utils/pagination.py)
+REPORT_LIST_PAGE_SIZE = int(os.getenv("REPORT_LIST_PAGE_SIZE", "50"))
+
+# Fulltextsökning över rapporter och chattar (myapp/utils/search_index.py).
+# Efter att ha varit avstängd: manage.py rebuild_search_index
+SEARCH_INDEX_ENABLED = os.getenv("SEARCH_INDEX_ENABLED", "True") == "True"
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "20"))
+
+# Versionshistorik för rapporter (myapp/utils/report_revisions.py): var N:e version
+# sparas hel, övriga som komprimerade skillnader mot föregående.
+REPORT_REVISION_SNAPSHOT_EVERY = int(os.getenv("REPORT_REVISION_SNAPSHOT_EVERY", "20"))
+
+# Bulkexport (ZIP med många rapporter, myapp/utils/bulk_export.py).
+# Antal processer som renderar DOCX parallellt; 1 = ingen processpool.
+BULK_EXPORT_WORKERS = int(os.getenv("BULK_EXPORT_WORKERS", "2"))
+# Max antal rapporter per export via webben (manage.py export_reports har ingen gräns)
+BULK_EXPORT_MAX_REPORTS = int(os.getenv("BULK_EXPORT_MAX_REPORTS", "200"))
+
+# Betygsbilder i Word-exporten ritas på servern (myapp/utils/rating_charts.py).
+# Tomt = DejaVu Sans om den finns, annars Pillows inbyggda typsnitt.
+RATING_CHART_FONT = os.getenv("RATING_CHART_FONT", "")
+RATING_CHART_FONT_BOLD = os.getenv("RATING_CHART_FONT_BOLD", "")
+RATING_CHART_CACHE_TTL = int(os.getenv("RATING_CHART_CACHE_TTL", str(24 * 3600)))  # sekunder
+
 STYLE_INSTRUCTION = """
 Skriv på ett liknande sätt som nedan text. Formulera din text så att det känns som samma person har skrivit den.
 Skriv kandidatens förnamn genom hela texten.